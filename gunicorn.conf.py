@@ -0,0 +1,36 @@
+"""
+Gunicorn settings for the production serving profile.
+
+Picked up automatically when ``gunicorn`` is started from the project root::
+
+    gunicorn                                    # sabawoon.wsgi, threaded workers
+    GUNICORN_APP=sabawoon.asgi:application \
+    GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker gunicorn
+
+The ASGI variant needs ``uvicorn-worker`` installed on top of requirements.txt.
+Every value below can be overridden from the environment.
+"""
+import multiprocessing
+import os
+
+
+wsgi_app = os.environ.get('GUNICORN_APP', 'sabawoon.wsgi:application')
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Processes give parallelism for the CPU-bound cost chain; threads keep a
+# worker busy while another request waits on the database.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then so a slow leak cannot grow without bound
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
@@ -8,13 +8,36 @@ from pathlib import Path
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+
+def env_bool(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_list(name, default=()):
+    value = os.environ.get(name)
+    if value is None:
+        return list(default)
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+# Every setting below that reads the environment defaults to the development
+# setup, so a plain ``manage.py runserver`` keeps working unchanged.  The
+# production profile (see Dockerfile and gunicorn.conf.py) sets DJANGO_DEBUG=False.
+
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-94f8yd6vu2_bt^-=^(o!w&z6c&n02ek4=ql!)y#xh82+04l2m9'
+SECRET_KEY = os.environ.get(
+    'DJANGO_SECRET_KEY',
+    'django-insecure-94f8yd6vu2_bt^-=^(o!w&z6c&n02ek4=ql!)y#xh82+04l2m9',
+)
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = env_bool('DJANGO_DEBUG', True)
 
-ALLOWED_HOSTS = ['localhost', '127.0.0.1']  # Added for development
+ALLOWED_HOSTS = env_list('DJANGO_ALLOWED_HOSTS', ['localhost', '127.0.0.1'])
+CSRF_TRUSTED_ORIGINS = env_list('DJANGO_CSRF_TRUSTED_ORIGINS')
 
 # Application definition
 INSTALLED_APPS = [
@@ -31,12 +54,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'vehicle.middleware.ProfilingMiddleware',
+    'vehicle.middleware.CostMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'vehicle.middleware.RateTableMiddleware',
 ]
 
 ROOT_URLCONF = 'sabawoon.urls'
@@ -60,13 +87,56 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'sabawoon.wsgi.application'
 
+# DJANGO_DB_ENGINE picks the backend: sqlite3 (default), postgresql or mysql.
+DB_ENGINE = os.environ.get('DJANGO_DB_ENGINE', 'sqlite3')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': f'django.db.backends.{DB_ENGINE}',
+        'NAME': os.environ.get('DJANGO_DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'USER': os.environ.get('DJANGO_DB_USER', ''),
+        'PASSWORD': os.environ.get('DJANGO_DB_PASSWORD', ''),
+        'HOST': os.environ.get('DJANGO_DB_HOST', ''),
+        'PORT': os.environ.get('DJANGO_DB_PORT', ''),
+        # Keep connections open across requests, and check them before reuse
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
     }
 }
 
+if DB_ENGINE == 'sqlite3' and env_bool('DJANGO_SQLITE_TUNING', True):
+    # Writers wait up to 20s for the lock instead of failing, and take it at
+    # BEGIN so a read never has to be upgraded mid-transaction (the usual
+    # source of "database is locked").  These settings only last as long as
+    # the connection and leave the database file as it is.
+    DATABASES['default']['OPTIONS'].update({
+        'timeout': 20,
+        'transaction_mode': 'IMMEDIATE',
+        'init_command': (
+            'PRAGMA mmap_size=134217728;'
+            'PRAGMA cache_size=-20000;'
+            'PRAGMA temp_store=MEMORY;'
+        ),
+    })
+    if env_bool('DJANGO_SQLITE_WAL', False):
+        # WAL lets readers run while one connection writes, and
+        # synchronous=NORMAL is still crash safe under it.  WAL is recorded in
+        # the database file and keeps -wal/-shm files next to it, so it is
+        # only turned on when asked for.
+        DATABASES['default']['OPTIONS']['init_command'] = (
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+            + DATABASES['default']['OPTIONS']['init_command']
+        )
+elif DB_ENGINE == 'postgresql' and env_bool('DJANGO_DB_POOL', False):
+    # psycopg's connection pool (needs psycopg[pool]) replaces CONN_MAX_AGE
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DJANGO_DB_POOL_MIN', 2)),
+        'max_size': int(os.environ.get('DJANGO_DB_POOL_MAX', 10)),
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -94,13 +164,68 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# WhiteNoise serves the collected files from every worker.  With the manifest
+# storage, file names carry a content hash and are sent gzip/brotli compressed
+# with far-future cache headers; it needs ``collectstatic`` to have run, so it
+# is on by default only outside DEBUG.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'sabawoon.storage.StaticFilesStorage'
+            if env_bool('DJANGO_STATIC_MANIFEST', not DEBUG)
+            else 'django.contrib.staticfiles.storage.StaticFilesStorage'
+        ),
+    },
+}
+
 # Media files configuration - FIXED
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'  # Using Pathlib for cross-platform compatibility
 
+# Uploaded car images are served by Django itself unless a front proxy does it
+SERVE_MEDIA = env_bool('DJANGO_SERVE_MEDIA', DEBUG)
+
 # Create media directory if it doesn't exist
 os.makedirs(MEDIA_ROOT, exist_ok=True)
 
+# Background tasks (``vehicle.tasks``) are run by ``manage.py run_tasks``
+# workers; with TASKS_EAGER they run inside the request that queues them,
+# for a setup without a worker such as runserver, hence on by default with
+# DEBUG.  Exports they write are kept out of MEDIA_ROOT and downloaded
+# through a login-protected view.
+TASKS_EAGER = env_bool('DJANGO_TASKS_EAGER', DEBUG)
+EXPORT_ROOT = Path(os.environ.get('DJANGO_EXPORT_ROOT', BASE_DIR / 'exports'))
+
+# By default each process has its own cache.  DJANGO_CACHE_LOCATION shares one
+# between the web and task workers, a directory or a redis:// URL, so a change
+# made in one process drops what the others cached of the old data
+# (``vehicle.data_version``).
+CACHE_LOCATION = os.environ.get('DJANGO_CACHE_LOCATION', '')
+if CACHE_LOCATION.startswith('redis://'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_LOCATION}}
+elif CACHE_LOCATION:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': CACHE_LOCATION}}
+# Seconds the rendered dashboard panels and the fleet status summary of one
+# data version, and the site settings, are kept; with per-process caches also
+# how long a process may miss another one's change
+DASHBOARD_CACHE_TIMEOUT = int(os.environ.get('DJANGO_DASHBOARD_CACHE_TIMEOUT', 300))
+
+# Per-request profiling (``vehicle.profiling``), listed to staff under
+# /profiling/.  It times every query, so keep it off unless looking into a
+# slow page; DJANGO_PROFILING_CPROFILE adds a cProfile of each request.
+PROFILING = env_bool('DJANGO_PROFILING', False)
+PROFILING_CPROFILE = env_bool('DJANGO_PROFILING_CPROFILE', False)
+PROFILING_BUFFER_SIZE = int(os.environ.get('DJANGO_PROFILING_BUFFER_SIZE', 200))
+
+# Calls, time and queries of the model cost properties (``vehicle.metrics``),
+# per page, in the Prometheus text format under /metrics/ for a scraper
+# on INTERNAL_IPS or for staff.
+COST_METRICS = env_bool('DJANGO_COST_METRICS', False)
+INTERNAL_IPS = env_list('DJANGO_INTERNAL_IPS', ['127.0.0.1', '::1'])
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_URL = 'login'
@@ -0,0 +1,21 @@
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+class StaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """
+    Hashed, compressed static files that tolerate the stylesheets in
+    ``static/css`` pointing at fonts which were never checked in.
+
+    A ``url()`` to a missing file is left as written instead of failing
+    ``collectstatic``, and an unknown name in ``{% static %}`` falls back to
+    the unhashed path.
+    """
+    manifest_strict = False
+
+    def hashed_name(self, name, content=None, filename=None):
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            if content is not None:
+                raise
+            return name
@@ -2,11 +2,19 @@ from django.contrib import admin
 from .models import (
     Related, CarMark, CarType, ModelYear, CarColor, CarAction,
     CarInfo, PurchaseInfo, ShippingInfo, WorldExpenses,
-    KabulExpenses, RepairAndOtherExpenses, SaleInfo, CarImages, DashboardSetting, Currency, Buyer
+    KabulExpenses, RepairAndOtherExpenses, SaleInfo, CarImages, DashboardSetting, Currency, Buyer,
+    CarCostLedger
 )
 
 
 
+class CostChainAdminMixin:
+    """Changelists of the cost chain stages load the whole chain in one query"""
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_cost_chain()
+
+
 admin.site.register(Currency)
 admin.site.register(Buyer)
 
@@ -54,32 +62,38 @@ class PurchaseInfoAdmin(admin.ModelAdmin):
 
 
 @admin.register(ShippingInfo)
-class ShippingInfoAdmin(admin.ModelAdmin):
+class ShippingInfoAdmin(CostChainAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'car', 'date_arrived_in_dubai', 'total_price_to_dubai', 'dubai_paid_invoice')
 
 
 @admin.register(WorldExpenses)
-class WorldExpensesAdmin(admin.ModelAdmin):
+class WorldExpensesAdmin(CostChainAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'car', 'herat_arrival_date', 'shipiping_price_to_islam_qala', 'gomrok_payment')
 
 
 @admin.register(KabulExpenses)
-class KabulExpensesAdmin(admin.ModelAdmin):
+class KabulExpensesAdmin(CostChainAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'car', 'herat_to_kabul_cost', 'usa_to_kabul_cost', 'arrival_date_kabul')
 
 
 @admin.register(RepairAndOtherExpenses)
-class RepairAndOtherExpensesAdmin(admin.ModelAdmin):
+class RepairAndOtherExpensesAdmin(CostChainAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'car', 'repair_cost', 'palate_cost')
 
 
 @admin.register(SaleInfo)
-class SaleInfoAdmin(admin.ModelAdmin):
+class SaleInfoAdmin(CostChainAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'car', 'status', 'sale_price', 'special_sale_price', 'benefit')
     readonly_fields = ('sale_commission', 'special_sale_price', 'benefit', 'capital_bound')
     list_filter = ('status',)
 
 
+@admin.register(CarCostLedger)
+class CarCostLedgerAdmin(admin.ModelAdmin):
+    list_display = ('car', 'total_to_dubai', 'total_cost_in_kabul', 'final_cost', 'benefit', 'updated_at')
+    readonly_fields = ('car',) + CarCostLedger.AMOUNT_FIELDS + ('updated_at',)
+
+
 
 
 @admin.register(CarImages)
@@ -0,0 +1,241 @@
+"""
+Monthly and weekly rollups of the fleet, for trends over years of data.
+
+``FleetRollup`` keeps, per period, mark and type, how many cars reached each
+event of the route (``EVENTS``, dated by the stage models) and the revenue,
+cost and benefit of the cars sold, taken from the cost ledger.  A chart
+reads a few hundred of these rows instead of every car.
+
+A period is refreshed as a whole, from one grouped query per event over the
+days it covers (the event dates are indexed):
+
+* saving or deleting a stage or a car queues ``vehicle.refresh_rollups``
+  with the periods of the car's dates before and after the change (see
+  ``signals``),
+* imports and the recompute after a rate change refresh the periods of the
+  cars they wrote,
+* ``seed_fleet`` and ``rebuild_cost_ledger`` rebuild every period, as does
+  ``manage.py rebuild_rollups``.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.db import models, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import CarInfo, FleetRollup, SaleInfo
+
+
+# (field of ``FleetRollup``, date of the event from a car, label)
+EVENTS = (
+    ('bought', 'purchase_info__buy_date', "خرید"),
+    ('shipped', 'shipping_info__etd_from_usa', "حرکت از امریکا"),
+    ('arrived_dubai', 'shipping_info__date_arrived_in_dubai', "رسید به امارات"),
+    ('arrived_herat', 'world_expenses__herat_arrival_date', "رسید به هرات"),
+    ('arrived_kabul', 'kabul_expenses__arrival_date_kabul', "رسید به کابل"),
+    ('sold', 'sale_info__sale_date', "فروش"),
+)
+
+# (field of ``FleetRollup``, ledger field summed over the cars sold, label)
+AMOUNTS = (
+    ('revenue', 'sale_in_base', "عاید"),
+    ('cost', 'final_cost', "مصارف"),
+    ('benefit', 'benefit', "مفاد"),
+)
+
+KINDS = dict(FleetRollup.KIND_CHOICES)
+
+
+def period_start(kind, day):
+    if kind == FleetRollup.KIND_MONTH:
+        return day.replace(day=1)
+    return day - timedelta(days=day.weekday())
+
+
+def period_end(kind, start):
+    """The first day after the period starting on ``start``."""
+    if kind == FleetRollup.KIND_MONTH:
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=7)
+
+
+def _date_field(path):
+    relation, name = path.split('__')
+    return CarInfo._meta.get_field(relation).related_model._meta.get_field(name)
+
+
+def _day(value):
+    # ``buy_date`` is a datetime, counted on its local day
+    return timezone.localdate(value) if isinstance(value, datetime) else value
+
+
+def periods_of(days):
+    """``(kind, start)`` of the periods of every kind the ``days`` fall in."""
+    return {(kind, period_start(kind, _day(day))) for day in days if day is not None for kind in KINDS}
+
+
+def car_periods(car_ids, batch_size=1000):
+    """The periods the event dates of the cars fall in."""
+    car_ids = iter(car_ids)
+    periods = set()
+    while batch := list(islice(car_ids, batch_size)):
+        for dates in CarInfo.objects.filter(pk__in=batch).values_list(*(path for _, path, _ in EVENTS)):
+            periods |= periods_of(dates)
+    return periods
+
+
+def _stage_fields(model):
+    return [
+        path.split('__')[1] for _, path, _ in EVENTS
+        if CarInfo._meta.get_field(path.split('__')[0]).related_model is model
+    ]
+
+
+def stage_periods(instance):
+    """The periods the event dates of a stage instance fall in, as they are in memory."""
+    return periods_of(getattr(instance, name) for name in _stage_fields(type(instance)))
+
+
+def stored_periods(instance):
+    """The periods the event dates of a stage instance fall in, as they are stored."""
+    fields = _stage_fields(type(instance))
+    if instance.pk is None or not fields:
+        return set()
+    return periods_of(type(instance).objects.filter(pk=instance.pk).values_list(*fields).first() or ())
+
+
+def encode(periods):
+    """``periods`` as JSON task arguments, ``['month:2024-03-01', ...]``."""
+    return sorted(f'{kind}:{start.isoformat()}' for kind, start in periods)
+
+
+def decode(periods):
+    return {(kind, datetime.strptime(start, '%Y-%m-%d').date()) for kind, start in (
+        period.split(':') for period in periods
+    )}
+
+
+def _within(path, ranges):
+    field = _date_field(path)
+    condition = Q()
+    for since, until in ranges:
+        if isinstance(field, models.DateTimeField):
+            since, until = (timezone.make_aware(datetime.combine(day, time.min)) for day in (since, until))
+        condition |= Q(**{f'{path}__gte': since, f'{path}__lt': until})
+    return condition
+
+
+def _merge(ranges):
+    merged = []
+    for since, until in sorted(ranges):
+        if merged and since <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], until)
+        else:
+            merged.append([since, until])
+    return merged
+
+
+def _daily(ranges=None):
+    """``{(day, mark_id, car_type_id): {field: value}}`` of the events within ``ranges``, all by default."""
+    days = {}
+    for name, path, _ in EVENTS:
+        cars = CarInfo.objects.filter(**{f'{path}__isnull': False})
+        if ranges is not None:
+            cars = cars.filter(_within(path, ranges))
+        aggregates = {name: Count('pk')}
+        if name == 'sold':
+            cars = cars.filter(sale_info__status=SaleInfo.STATUS_SOLD)
+            aggregates.update({field: Sum(f'cost_ledger__{ledger}') for field, ledger, _ in AMOUNTS})
+        day = TruncDate(path) if isinstance(_date_field(path), models.DateTimeField) else F(path)
+        rows = cars.annotate(day=day).values('day', 'mark', 'car_type').annotate(**aggregates).order_by()
+        for row in rows:
+            values = days.setdefault((row.pop('day'), row.pop('mark'), row.pop('car_type')), {})
+            values.update((field, value) for field, value in row.items() if value is not None)
+    return days
+
+
+def _rollups(days, periods=None):
+    """The ``FleetRollup`` rows adding up ``days``, of ``periods`` only if given."""
+    zero = Decimal('0')
+    buckets = {}
+    for (day, mark_id, car_type_id), values in days.items():
+        for kind in KINDS:
+            start = period_start(kind, day)
+            if periods is not None and (kind, start) not in periods:
+                continue
+            bucket = buckets.setdefault((kind, start, mark_id, car_type_id), {})
+            for field, value in values.items():
+                bucket[field] = bucket.get(field, zero if isinstance(value, Decimal) else 0) + value
+    return [
+        FleetRollup(kind=kind, start=start, mark_id=mark_id, car_type_id=car_type_id, **values)
+        for (kind, start, mark_id, car_type_id), values in buckets.items()
+    ]
+
+
+def refresh(periods):
+    """Recompute the rollup rows of ``periods``, ``(kind, start)`` pairs.  Returns how many were written."""
+    periods = set(periods)
+    if not periods:
+        return 0
+    ranges = _merge((start, period_end(kind, start)) for kind, start in periods)
+    with transaction.atomic():
+        stored = FleetRollup.objects.none()
+        for kind in KINDS:
+            starts = [start for period_kind, start in periods if period_kind == kind]
+            if starts:
+                stored |= FleetRollup.objects.filter(kind=kind, start__in=starts)
+        # Read the cars only once the periods' rows are locked (SQLite's
+        # IMMEDIATE transactions lock at BEGIN), so a refresh of the same
+        # periods running alongside writes after this one, from newer data.
+        # Two refreshes of a period that has no rows yet cannot both insert
+        # it: the unique constraint fails one, and its task is retried.
+        list(stored.select_for_update().values_list('pk', flat=True))
+        rows = _rollups(_daily(ranges), periods)
+        stored.delete()
+        FleetRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def rebuild():
+    """Recompute every rollup row.  Returns how many were written."""
+    with transaction.atomic():
+        list(FleetRollup.objects.select_for_update().values_list('pk', flat=True))
+        rows = _rollups(_daily())
+        FleetRollup.objects.all().delete()
+        FleetRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+FIELDS = tuple(name for name, _, _ in EVENTS) + tuple(name for name, _, _ in AMOUNTS)
+
+
+def series(kind=FleetRollup.KIND_MONTH, since=None, until=None, **filters):
+    """
+    Totals per period of ``kind``, oldest first, from ``since`` up to
+    ``until`` (excluded), of the cars matching ``filters`` (``mark``,
+    ``car_type``).  Periods between the first and the last one with an
+    event are filled in with zeros.
+    """
+    rows = FleetRollup.objects.filter(kind=kind, **filters)
+    if since is not None:
+        rows = rows.filter(start__gte=period_start(kind, since))
+    if until is not None:
+        rows = rows.filter(start__lt=until)
+    # Named apart from the fields they add up, as annotations must be
+    totals = {
+        row.pop('start'): {name: row[f'total_{name}'] for name in FIELDS}
+        for row in rows.values('start').annotate(**{f'total_{name}': Sum(name) for name in FIELDS}).order_by('start')
+    }
+    if not totals:
+        return []
+    amounts = {name for name, _, _ in AMOUNTS}
+    empty = {name: Decimal('0') if name in amounts else 0 for name in FIELDS}
+    start, last = min(totals), max(totals)
+    periods = []
+    while start <= last:
+        periods.append({'start': start, **totals.get(start, empty)})
+        start = period_end(kind, start)
+    return periods
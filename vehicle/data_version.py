@@ -0,0 +1,46 @@
+"""
+A version of the fleet data, for caches of what is computed from it such
+as the dashboard panels.
+
+Saving or deleting a car, a stage of its cost chain, a currency or a rate
+history row starts a new version once its transaction commits (see
+``signals``), and so do the bulk writes that send no signals: imports,
+``seed_fleet``, ``rebuild_cost_ledger`` and the recompute after a rate
+change.  Entries keyed on an older version are simply never read again.
+
+The version lives in the default cache, so it is only shared between
+processes when the cache is (see ``CACHES`` in the settings).
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+KEY = 'vehicle:data_version'
+
+
+def current():
+    # A clock reading rather than a counter, so a version never comes back
+    # after the cache is cleared or the key is evicted
+    version = time.time_ns()
+    if not cache.add(KEY, version, None):
+        version = cache.get(KEY, version)
+    return version
+
+
+def cached(name, compute, timeout):
+    """``compute()``, cached as ``name`` until the data changes or ``timeout`` seconds pass."""
+    return cache.get_or_set(f'{KEY}:{current()}:{name}', compute, timeout)
+
+
+def _start_new():
+    cache.set(KEY, time.time_ns(), None)
+
+
+def bump():
+    """
+    Start a new version when the current transaction commits; a request
+    reading the data before that would cache it under the new version.
+    """
+    transaction.on_commit(_start_new)
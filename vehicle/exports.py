@@ -0,0 +1,124 @@
+"""
+Per-car profitability report: one row per ``CarInfo`` with every stage
+subtotal of the cost chain in base currency.
+
+Rows are read from ``CarCostLedger`` with a chunked ``iterator()`` and
+written out as they are produced, so memory stays flat however large the
+fleet is.  Cars without a ledger row yet are computed live, a chunk at a
+time.
+"""
+import csv
+import tempfile
+from decimal import Decimal
+from itertools import islice
+
+from . import rates
+from .models import CarCostLedger, CarInfo
+
+
+CENT = Decimal('0.01')
+
+
+COLUMNS = [
+    ('car_id', "Car"),
+    ('lot', "LOT#"),
+    ('vin', "VIN#"),
+    ('mark', "Mark"),
+    ('car_type', "Type"),
+    ('model_year', "Model year"),
+    ('status', "Status"),
+    ('purchase_in_base', "Purchase"),
+    ('masaref_to_dubai', "Expenses to Dubai"),
+    ('total_to_dubai', "Total to Dubai"),
+    ('expenses_to_herat', "Expenses to Herat"),
+    ('all_expenses_to_herat', "Total to Herat"),
+    ('herat_to_kabul_in_base', "Herat to Kabul"),
+    ('total_cost_in_kabul', "Total in Kabul"),
+    ('repair_in_base', "Repair"),
+    ('palate_in_base', "Plate"),
+    ('final_cost', "Final cost"),
+    ('sale_in_base', "Sale"),
+    ('benefit', "Benefit"),
+]
+
+FORMATS = ('csv', 'xlsx')
+
+
+def _amounts(cars):
+    """Ledger amounts of each of ``cars``; cars without a ledger row are computed together."""
+    missing = [car.pk for car in cars if getattr(car, 'cost_ledger', None) is None]
+    live = {}
+    if missing:
+        chains = list(CarInfo.objects.select_related(*CarCostLedger.chain_related()).filter(pk__in=missing))
+        live = {car.pk: values for car, values in zip(chains, CarCostLedger.compute_many(chains))}
+    for car in cars:
+        ledger = getattr(car, 'cost_ledger', None)
+        if ledger is None:
+            yield live[car.pk]
+        else:
+            yield {name: getattr(ledger, name) for name in CarCostLedger.AMOUNT_FIELDS}
+
+
+def fleet_rows(queryset=None, chunk_size=2000):
+    """Yield the header, then one list of values per car, ordered by id."""
+    if queryset is None:
+        queryset = CarInfo.objects.all()
+    cars = queryset.select_related(
+        'cost_ledger', 'mark', 'car_type__mark', 'model_year', 'sale_info',
+    ).order_by('pk')
+
+    yield [label for _, label in COLUMNS]
+    rows = cars.iterator(chunk_size=chunk_size)
+    with rates.rate_table():
+        while chunk := list(islice(rows, chunk_size)):
+            for car, amounts in zip(chunk, _amounts(chunk)):
+                sale = getattr(car, 'sale_info', None)
+                values = {
+                    'car_id': car.pk,
+                    'lot': car.lot,
+                    'vin': car.vin,
+                    'mark': car.mark.name if car.mark else '',
+                    'car_type': car.car_type.name if car.car_type else '',
+                    'model_year': car.model_year.year if car.model_year else '',
+                    'status': sale.get_status_display() if sale else '',
+                }
+                for name, amount in amounts.items():
+                    values[name] = amount.quantize(CENT)
+                yield [values[key] for key, _ in COLUMNS]
+
+
+class _Echo:
+    """File-like object whose ``write`` hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """Encode ``rows`` as CSV, one line at a time."""
+    writer = csv.writer(_Echo())
+    # A byte order mark so spreadsheet programs read the Persian names as UTF-8
+    yield '﻿'
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def xlsx_file(rows):
+    """
+    Write ``rows`` to an XLSX workbook in a temporary file and return it,
+    rewound.  The workbook is built in openpyxl's write-only mode, which
+    keeps one row in memory at a time.
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError("XLSX export needs openpyxl, install it or export as CSV")
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Fleet")
+    for row in rows:
+        sheet.append(row)
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
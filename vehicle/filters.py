@@ -0,0 +1,149 @@
+"""
+Search, filters and sort order for lists of cars, or of stage records that
+belong to a car.
+
+Everything is read from the querystring, so any combination of filters can
+be linked to or bookmarked.  VIN# and LOT# searches are turned into index
+range conditions (``vin >= 'ABC' AND vin < 'ABD'``) rather than ``LIKE``,
+which SQLite cannot run on an index; the search by the last digits of a VIN
+does the same on ``CarInfo.vin_reversed``.
+
+Lists are paginated by keyset on the chosen sort key, see ``pagination``.
+"""
+from datetime import datetime, time, timedelta
+
+from django import forms
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import CarColor, CarMark, CarType, ModelYear, SaleInfo
+from .pagination import KeysetPaginationMixin
+
+
+def prefix_range(field, prefix):
+    """``Q`` matching values of ``field`` that start with ``prefix``, as an index range."""
+    # The smallest string greater than every string starting with ``prefix``
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': upper})
+
+
+class CarFilterForm(forms.Form):
+    """Search and filters of a car list; every field is optional."""
+    # (field, descending) of each sort key, ties are broken by the row's own id
+    SORTS = {
+        'newest': ('pk', True),
+        'oldest': ('pk', False),
+        'vin': ('vin', False),
+        '-vin': ('vin', True),
+        'lot': ('lot', False),
+        '-lot': ('lot', True),
+    }
+    SORT_CHOICES = [
+        ('newest', 'جدیدترین'),
+        ('oldest', 'قدیمی‌ترین'),
+        ('vin', 'VIN# (A-Z)'),
+        ('-vin', 'VIN# (Z-A)'),
+        ('lot', 'LOT# (A-Z)'),
+        ('-lot', 'LOT# (Z-A)'),
+    ]
+    NO_SALE = 'none'
+
+    q = forms.CharField(
+        label='VIN# / LOT#', required=False, max_length=100,
+        widget=forms.TextInput(attrs={'placeholder': 'اول یا آخر VIN# یا LOT#'}),
+    )
+    mark = forms.ModelChoiceField(label='MARK', queryset=CarMark.objects.all(), required=False)
+    car_type = forms.ModelChoiceField(
+        label='نوع', queryset=CarType.objects.select_related('mark'), required=False,
+    )
+    model_year = forms.ModelChoiceField(label='مدل سال', queryset=ModelYear.objects.all(), required=False)
+    color = forms.ModelChoiceField(label='رنگ', queryset=CarColor.objects.all(), required=False)
+    status = forms.ChoiceField(
+        label='حالت', required=False,
+        choices=[('', '---------'), *SaleInfo.STATUS_CHOICES, (NO_SALE, 'بدون فروش')],
+    )
+    bought_from = forms.DateField(
+        label='تاریخ خرید از', required=False, widget=forms.DateInput(attrs={'type': 'date'}),
+    )
+    bought_to = forms.DateField(
+        label='تاریخ خرید تا', required=False, widget=forms.DateInput(attrs={'type': 'date'}),
+    )
+    sort = forms.ChoiceField(label='ترتیب', required=False, choices=SORT_CHOICES)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for field in self.fields.values():
+            field.widget.attrs.setdefault(
+                'class', 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm text-sm',
+            )
+
+    def filter(self, queryset, car_prefix=''):
+        """
+        Narrow ``queryset`` to the rows matching the valid fields.
+
+        ``car_prefix`` is the path from the listed model to its car, e.g.
+        ``'car__'`` for a stage model.
+        """
+        if not self.is_valid():
+            return queryset
+        data = self.cleaned_data
+        car = car_prefix
+
+        term = data['q'].strip().upper()
+        if term:
+            queryset = queryset.filter(
+                prefix_range(f'{car}vin', term)
+                | prefix_range(f'{car}lot', term)
+                | prefix_range(f'{car}vin_reversed', term[::-1])
+            )
+        for name in ('mark', 'car_type', 'model_year', 'color'):
+            if data[name] is not None:
+                queryset = queryset.filter(**{f'{car}{name}': data[name]})
+
+        if data['status'] == self.NO_SALE:
+            queryset = queryset.filter(**{f'{car}sale_info__isnull': True})
+        elif data['status']:
+            queryset = queryset.filter(**{f'{car}sale_info__status': data['status']})
+
+        # Whole local days as a datetime range, which the buy_date index serves
+        if data['bought_from']:
+            start = timezone.make_aware(datetime.combine(data['bought_from'], time.min))
+            queryset = queryset.filter(**{f'{car}purchase_info__buy_date__gte': start})
+        if data['bought_to']:
+            end = timezone.make_aware(datetime.combine(data['bought_to'] + timedelta(days=1), time.min))
+            queryset = queryset.filter(**{f'{car}purchase_info__buy_date__lt': end})
+        return queryset
+
+    def sort_key(self, car_prefix=''):
+        """``(field, descending)`` to order and paginate by."""
+        sort = self.cleaned_data.get('sort') if self.is_valid() else None
+        field, descending = self.SORTS[sort or 'newest']
+        return (field if field == 'pk' else f'{car_prefix}{field}'), descending
+
+
+class CarFilterMixin(KeysetPaginationMixin):
+    """
+    ``ListView`` mixin: filter with ``CarFilterForm`` and paginate by keyset
+    on the chosen sort key.
+
+    Set ``car_prefix`` on views listing stage records, e.g. ``'car__'``.
+    The context gets ``filter_form`` next to ``page_obj``.
+    """
+    car_prefix = ''
+    paginate_by = 20
+
+    def get_filter_form(self):
+        if not hasattr(self, 'filter_form'):
+            self.filter_form = CarFilterForm(self.request.GET)
+        return self.filter_form
+
+    def get_queryset(self):
+        return self.get_filter_form().filter(super().get_queryset(), self.car_prefix)
+
+    def get_keyset_ordering(self):
+        return self.get_filter_form().sort_key(self.car_prefix)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['filter_form'] = self.get_filter_form()
+        return context
@@ -4,6 +4,19 @@ from django_select2.forms import Select2Widget, Select2MultipleWidget
 from django.utils.translation import gettext_lazy as _
 
 
+class CarChoicesMixin:
+    """Load the car choices with what their labels show, in one query"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        car = self.fields.get('car')
+        # The importers put their own lookup field in its place
+        if isinstance(car, forms.ModelChoiceField):
+            # CarInfo.__str__ reads the mark and the model year, some forms
+            # also show the type, whose label reads its mark
+            car.queryset = car.queryset.select_related('mark', 'model_year', 'car_type__mark')
+
+
 class RelatedForm(forms.ModelForm):
     class Meta:
         model = Related
@@ -114,6 +127,14 @@ class CarInfoForm(forms.ModelForm):
             }),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        car_type = self.fields['car_type']
+        # CarType.__str__ reads the mark; the importers put their own
+        # lookup field in its place
+        if isinstance(car_type, forms.ModelChoiceField):
+            car_type.queryset = car_type.queryset.select_related('mark')
+
 
 
 
@@ -152,7 +173,7 @@ class CarInfoForm(forms.ModelForm):
 
 
 
-class PurchaseInfoForm(forms.ModelForm):
+class PurchaseInfoForm(CarChoicesMixin, forms.ModelForm):
     payment_status = forms.CharField(
         label="وضعیت پرداخت",
         required=False,
@@ -348,7 +369,7 @@ class PurchaseInfoForm(forms.ModelForm):
 
 
 
-class ShippingInfoForm(forms.ModelForm):
+class ShippingInfoForm(CarChoicesMixin, forms.ModelForm):
     class Meta:
         model = ShippingInfo
         fields = '__all__'
@@ -650,7 +671,7 @@ class ShippingInfoForm(forms.ModelForm):
 
 
 
-class WorldExpensesForm(forms.ModelForm):
+class WorldExpensesForm(CarChoicesMixin, forms.ModelForm):
     class Meta:
         model = WorldExpenses
         fields = '__all__'
@@ -798,7 +819,7 @@ class WorldExpensesForm(forms.ModelForm):
 
 
 
-class KabulExpensesForm(forms.ModelForm):
+class KabulExpensesForm(CarChoicesMixin, forms.ModelForm):
     class Meta:
         model = KabulExpenses
         fields = '__all__'
@@ -831,7 +852,7 @@ class KabulExpensesForm(forms.ModelForm):
 
 
 
-class RepairAndOtherExpensesForm(forms.ModelForm):
+class RepairAndOtherExpensesForm(CarChoicesMixin, forms.ModelForm):
     class Meta:
         model = RepairAndOtherExpenses
         fields = '__all__'
@@ -1147,7 +1168,7 @@ class BuyerForm(forms.ModelForm):
 
 
 # forms.py
-class SaleInfoForm(forms.ModelForm):
+class SaleInfoForm(CarChoicesMixin, forms.ModelForm):
     class Meta:
         model = SaleInfo
         fields = '__all__'  # or explicitly list all fields including 'car'
@@ -1198,7 +1219,7 @@ class SaleInfoForm(forms.ModelForm):
 
 
 
-class CarImagesForm(forms.ModelForm):
+class CarImagesForm(CarChoicesMixin, forms.ModelForm):
     class Meta:
         model = CarImages
         fields = ['car', 'image', 'description']
@@ -1285,4 +1306,31 @@ class BuyerForm(forms.ModelForm):
             'address': forms.Textarea(attrs={'class': 'form-control', 'rows': 2}),
             'national_id': forms.TextInput(attrs={'class': 'form-control'}),
             'additional_info': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
-        }
\ No newline at end of file
+        }
+
+class FleetImportForm(forms.Form):
+    KIND_CHOICES = [
+        ('cars', _('Cars')),
+        ('purchases', _('Purchases')),
+        ('shipping', _('Shipping')),
+    ]
+
+    kind = forms.ChoiceField(
+        label=_('Records'),
+        choices=KIND_CHOICES,
+        widget=forms.Select(attrs={'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm'}),
+    )
+    file = forms.FileField(
+        label=_('File'),
+        help_text=_('CSV with a header row of field names, or JSONL with one object per line'),
+    )
+    dry_run = forms.BooleanField(
+        label=_('Validate only'),
+        required=False,
+    )
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        if upload.name.rsplit('.', 1)[-1].lower() not in ('csv', 'jsonl'):
+            raise forms.ValidationError(_('Upload a .csv or .jsonl file'))
+        return upload
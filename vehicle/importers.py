@@ -0,0 +1,343 @@
+"""
+Bulk import of cars and stage records from CSV or JSONL.
+
+Each row is validated by the same ModelForm the data entry pages use, so the
+field and ``clean()`` rules stay in one place.  Foreign keys are given by name
+(mark, type, model year, colour, related, action, currency code, and LOT# or
+VIN# for the car) and resolved through in-memory lookup tables instead of a
+query per field per row.  Valid rows are written with ``bulk_create`` one
+batch per transaction; invalid rows are skipped and reported with their line
+number.
+"""
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django import forms
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import transaction
+from django.db.models import Q
+
+from . import analytics, data_version, pipeline, rates
+from .forms import CarInfoForm, PurchaseInfoForm, ShippingInfoForm
+from .models import (
+    CarAction, CarColor, CarCostLedger, CarInfo, CarMark, CarType, Currency,
+    ModelYear, PurchaseInfo, Related, ShippingInfo,
+)
+from .pagination import refresh_statistics
+
+
+def _key(value):
+    return str(value).strip().casefold()
+
+
+class Lookup:
+    """
+    Natural key -> instance table for one model, loaded with one query.
+
+    ``keys`` are attribute names or callables taking the instance.
+    """
+
+    def __init__(self, model, *keys, queryset=None):
+        self.model = model
+        self.keys = keys
+        self.load(model.objects.all() if queryset is None else queryset)
+
+    def load(self, queryset):
+        self.objects = {}
+        for obj in queryset:
+            for key in self.keys:
+                value = key(obj) if callable(key) else getattr(obj, key)
+                if value in (None, ''):
+                    continue
+                # A key shared by two rows is ambiguous and resolves to nothing
+                value = _key(value)
+                self.objects[value] = None if value in self.objects else obj
+
+    def get(self, value):
+        return self.objects.get(_key(value))
+
+    def __contains__(self, value):
+        return _key(value) in self.objects
+
+
+class LookupChoiceField(forms.Field):
+    """Form field resolving a name (or an instance) through a ``Lookup``."""
+
+    def __init__(self, lookup, **kwargs):
+        self.lookup = lookup
+        super().__init__(**kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values or isinstance(value, self.lookup.model):
+            return value or None
+        if value not in self.lookup:
+            raise ValidationError(f"Unknown {self.lookup.model._meta.verbose_name}: {value}", code='invalid_choice')
+        obj = self.lookup.get(value)
+        if obj is None:
+            raise ValidationError(f"Ambiguous {self.lookup.model._meta.verbose_name}: {value}", code='invalid_choice')
+        return obj
+
+
+def read_rows(stream, file_format):
+    """
+    Yield ``(line, row)`` pairs from a binary or text stream, one at a time.
+
+    CSV needs a header row with the form field names; JSONL has one object
+    per line.
+    """
+    if isinstance(stream, (io.TextIOBase, io.StringIO)):
+        text = stream
+    else:
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    elif file_format == 'jsonl':
+        for line, raw in enumerate(text, start=1):
+            if not raw.strip():
+                continue
+            try:
+                row = json.loads(raw)
+            except ValueError as exc:
+                row = {'__error__': f"Invalid JSON: {exc}"}
+            yield line, row if isinstance(row, dict) else {'__error__': "Expected a JSON object"}
+    else:
+        raise ValueError(f"Unknown import format '{file_format}'")
+
+
+@dataclass
+class ImportReport:
+    kind: str
+    created: int = 0
+    errors: list = field(default_factory=list)  # (line, field, message)
+
+    @property
+    def failed_rows(self):
+        return len({line for line, _, _ in self.errors})
+
+
+class _SharedFields(dict):
+    """
+    ``base_fields`` handed to every import form as is: a form deep-copies its
+    fields so it can change them while rendering, which an import form never
+    does, and the copy costs more than validating the row.
+    """
+
+    def __deepcopy__(self, memo):
+        return dict(self)
+
+
+class Importer:
+    """
+    Validate rows with ``form_class`` and bulk-create ``model`` instances.
+
+    Subclasses name the form and how the car of a stage row is found.
+    """
+    kind = None
+    form_class = None
+    model = None
+    # Form field naming an existing car, by LOT# or VIN#
+    car_field = None
+
+    def __init__(self, batch_size=1000, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.lookups = self.build_lookups()
+        # Refilled for each batch with the cars its rows name
+        self.car_lookup = Lookup(CarInfo, 'lot', 'vin', queryset=())
+        self.form = self._import_form()
+        # Foreign key defaults such as get_usd_currency() query each time
+        # they are evaluated, resolve them once for every new instance
+        self.instance_defaults = {
+            model_field.attname: model_field.get_default()
+            for model_field in self.model._meta.concrete_fields
+            if model_field.is_relation and model_field.has_default()
+        }
+        self.defaults = self._defaults()
+        self.seen_cars = set()
+
+    def build_lookups(self):
+        return {'currency': Lookup(Currency, 'code')}
+
+    def _import_form(self):
+        base_fields = dict(self.form_class.base_fields)
+        for name, form_field in base_fields.items():
+            if not isinstance(form_field, forms.ModelChoiceField):
+                continue
+            model = form_field.queryset.model
+            lookup = self.car_lookup if name == self.car_field else self.lookups.get(model.__name__.lower())
+            if lookup is not None:
+                base_fields[name] = LookupChoiceField(lookup, required=form_field.required, label=form_field.label)
+
+        class ImportForm(self.form_class):
+
+            def _get_validation_exclusions(form):
+                # Lookup fields were checked against the tables already, skip
+                # ForeignKey.validate() running one query each
+                exclude = super()._get_validation_exclusions()
+                exclude.update(
+                    name for name, form_field in form.fields.items()
+                    if isinstance(form_field, LookupChoiceField)
+                )
+                return exclude
+
+            def validate_unique(form):
+                # Checked once per batch by the importer
+                pass
+
+        ImportForm.base_fields = _SharedFields(base_fields)
+        return ImportForm
+
+    def new_instance(self):
+        return self.model(**self.instance_defaults)
+
+    def _defaults(self):
+        """Values for columns a row leaves out, as the entry form would start."""
+        blank = self.form(instance=self.new_instance())
+        defaults = {}
+        for name in blank.fields:
+            try:
+                model_field = self.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if model_field.has_default():
+                defaults[name] = blank[name].initial
+        return defaults
+
+    def run(self, rows):
+        report = ImportReport(self.kind)
+        rows = iter(rows)
+        # Derived amounts and the ledger convert currencies on every row
+        with rates.rate_table():
+            while batch := list(islice(rows, self.batch_size)):
+                self.import_batch(batch, report)
+        if report.created and not self.dry_run:
+            # Totals of unfiltered lists are read from the table statistics
+            refresh_statistics(self.model)
+        return report
+
+    def prepare_batch(self, batch):
+        """Load what the rows of ``batch`` refer to."""
+
+    def import_batch(self, batch, report):
+        self.prepare_batch(batch)
+        instances = []
+        for line, row in batch:
+            if '__error__' in row:
+                report.errors.append((line, '', row['__error__']))
+                continue
+            data = dict(self.defaults)
+            data.update((name, value) for name, value in row.items() if value not in (None, ''))
+            form = self.form(data=data, instance=self.new_instance())
+            if not form.is_valid():
+                for name, messages in form.errors.items():
+                    for message in messages:
+                        report.errors.append((line, '' if name == '__all__' else name, message))
+                continue
+            instance = form.save(commit=False)
+            error = self.check_unique(instance)
+            if error:
+                report.errors.append((line, self.car_field or '', error))
+                continue
+            self.prepare(instance)
+            instances.append(instance)
+
+        if instances and not self.dry_run:
+            with transaction.atomic():
+                self.model.objects.bulk_create(instances, batch_size=self.batch_size)
+                self.after_create(instances)
+                data_version.bump()
+        report.created += len(instances)
+
+    def check_unique(self, instance):
+        return None
+
+    def prepare(self, instance):
+        """Fill in what ``save()`` would have set, ``bulk_create`` skips it."""
+
+    def after_create(self, instances):
+        # bulk_create sends no post_save, so refresh the ledger, legs and rollups here
+        car_ids = {instance.car_id for instance in instances}
+        CarCostLedger.refresh_many(car_ids)
+        pipeline.refresh(car_ids)
+        analytics.refresh(analytics.car_periods(car_ids))
+
+
+class CarImporter(Importer):
+    kind = 'cars'
+    form_class = CarInfoForm
+    model = CarInfo
+
+    def build_lookups(self):
+        lookups = super().build_lookups()
+        lookups.update({
+            'carmark': Lookup(CarMark, 'name'),
+            'modelyear': Lookup(ModelYear, 'year'),
+            'carcolor': Lookup(CarColor, 'name'),
+            'related': Lookup(Related, 'name'),
+            'caraction': Lookup(CarAction, 'name'),
+        })
+        # A type name may repeat across marks: "Toyota - Corolla" is always
+        # unique, a bare "Corolla" only when one mark has it
+        types = CarType.objects.select_related('mark')
+        lookups['cartype'] = Lookup(CarType, 'name', str, queryset=types)
+        return lookups
+
+    def import_batch(self, batch, report):
+        for _, row in batch:
+            if row.get('mark') and row.get('car_type') and ' - ' not in str(row['car_type']):
+                qualified = f"{row['mark']} - {row['car_type']}"
+                if qualified in self.lookups['cartype']:
+                    row['car_type'] = qualified
+        super().import_batch(batch, report)
+
+    def prepare(self, instance):
+        instance.lot = instance.lot or CarInfo.new_lot()
+        instance.set_search_fields()
+
+    def after_create(self, instances):
+        # Like a car saved from the form, a car without stages has no ledger row yet
+        pass
+
+
+class StageImporter(Importer):
+    car_field = 'car'
+
+    def prepare_batch(self, batch):
+        # VIN# and LOT# are stored upper case, see CarInfo.set_search_fields
+        keys = {str(row['car']).strip().upper() for _, row in batch if row.get('car')}
+        cars = list(CarInfo.objects.filter(Q(lot__in=keys) | Q(vin__in=keys)).only('pk', 'lot', 'vin'))
+        self.existing = set(
+            self.model.objects.filter(car__in=cars).values_list('car_id', flat=True)
+        )
+        self.car_lookup.load(cars)
+
+    def check_unique(self, instance):
+        if instance.car_id in self.existing or instance.car_id in self.seen_cars:
+            return f"{instance.car.lot} already has {self.model._meta.verbose_name}"
+        self.seen_cars.add(instance.car_id)
+        return None
+
+
+class PurchaseImporter(StageImporter):
+    kind = 'purchases'
+    form_class = PurchaseInfoForm
+    model = PurchaseInfo
+
+    def prepare(self, instance):
+        instance.update_remaining()
+
+
+class ShippingImporter(StageImporter):
+    kind = 'shipping'
+    form_class = ShippingInfoForm
+    model = ShippingInfo
+
+
+IMPORTERS = {importer.kind: importer for importer in (CarImporter, PurchaseImporter, ShippingImporter)}
+FORMATS = ('csv', 'jsonl')
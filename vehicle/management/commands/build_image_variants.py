@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from vehicle import thumbnails
+from vehicle.models import CarImages
+
+
+class Command(BaseCommand):
+    help = "Build the thumbnail and medium variants of car photos uploaded before they were generated"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rebuild variants that exist already")
+
+    def handle(self, *args, force=False, **options):
+        built = failed = 0
+        for image in CarImages.objects.exclude(image='').only('pk', 'image').iterator(chunk_size=500):
+            try:
+                thumbnails.build_variants(image.image, force=force)
+            except OSError as exc:
+                failed += 1
+                self.stderr.write(f"Image {image.pk} ({image.image.name}): {exc}")
+                continue
+            built += 1
+        self.stdout.write(self.style.SUCCESS(f"{built} images have variants, {failed} could not be read"))
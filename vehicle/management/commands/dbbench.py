@@ -0,0 +1,101 @@
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+
+from vehicle import rates
+from vehicle.models import RepairAndOtherExpenses
+from vehicle.rollups import fleet_totals
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent read and write transactions against the database from "
+        "several threads and report throughput and lock errors"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds to run")
+        parser.add_argument(
+            '--write-ratio', type=float, default=0.2,
+            help="Share of operations that are writes, between 0 and 1",
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, threads=8, duration=10.0, write_ratio=0.2, seed=0, **options):
+        if threads < 1 or duration <= 0 or not 0 <= write_ratio <= 1:
+            raise CommandError("--threads and --duration must be positive, --write-ratio between 0 and 1")
+        repair_ids = list(RepairAndOtherExpenses.objects.values_list('pk', flat=True))
+        if not repair_ids:
+            raise CommandError("No cars with repair expenses, run seed_fleet first")
+
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                self.stdout.write(f"SQLite journal_mode={cursor.fetchone()[0]}")
+
+        lock = threading.Lock()
+        stats = {'read': [], 'write': [], 'locked': 0}
+        deadline = time.perf_counter() + duration
+
+        def read():
+            # What the dashboard and a list page run, in autocommit like a view
+            fleet_totals()
+            for repair in RepairAndOtherExpenses.objects.with_cost_chain().order_by('-pk')[:25]:
+                repair.final_cost
+
+        def write(pk):
+            # A real stage save, ledger refresh included, that is then rolled
+            # back so the benchmark leaves the data as it found it
+            with transaction.atomic():
+                repair = RepairAndOtherExpenses.objects.select_related('car').get(pk=pk)
+                repair.repair_cost += Decimal('1')
+                repair.save()
+                transaction.set_rollback(True)
+
+        def worker(index):
+            rng = random.Random(seed + index)
+            try:
+                with rates.rate_table():
+                    while time.perf_counter() < deadline:
+                        kind = 'write' if rng.random() < write_ratio else 'read'
+                        started = time.perf_counter()
+                        try:
+                            if kind == 'write':
+                                write(rng.choice(repair_ids))
+                            else:
+                                read()
+                        except OperationalError:
+                            with lock:
+                                stats['locked'] += 1
+                            continue
+                        elapsed = time.perf_counter() - started
+                        with lock:
+                            stats[kind].append(elapsed)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        for kind in ('read', 'write'):
+            timings = sorted(stats[kind])
+            if not timings:
+                self.stdout.write(f"{kind}s: none")
+                continue
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(
+                f"{kind}s: {len(timings) / wall:.1f}/s, {len(timings)} done, "
+                f"mean {sum(timings) / len(timings) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms"
+            )
+        summary = f"{stats['locked']} operations failed on a locked database ({threads} threads, {wall:.1f}s)"
+        self.stdout.write(self.style.WARNING(summary) if stats['locked'] else self.style.SUCCESS(summary))
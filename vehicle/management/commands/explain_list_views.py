@@ -0,0 +1,111 @@
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.views.generic import ListView
+
+from vehicle import rates
+
+
+TABLE_SCAN = re.compile(r'^SCAN (\w+)$')
+
+
+def list_routes(patterns=None, prefix=''):
+    """``(name, path)`` of every URL without arguments served by a ``ListView``."""
+    for pattern in get_resolver().url_patterns if patterns is None else patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            yield from list_routes(pattern.url_patterns, route)
+        elif isinstance(pattern, URLPattern) and not pattern.pattern.converters:
+            view_class = getattr(pattern.callback, 'view_class', None)
+            if view_class is not None and issubclass(view_class, ListView):
+                yield pattern.name, '/' + route.lstrip('^').rstrip('$')
+
+
+def full_scans(sql, plan):
+    """
+    Plan steps that read a whole table: a ``SCAN`` without an index, unless
+    the query stops after one page in the table's own order.
+    """
+    bounded = ' LIMIT ' in sql and not any('TEMP B-TREE FOR ORDER BY' in step for step in plan)
+    scans = [step for step in plan if TABLE_SCAN.match(step)]
+    if bounded and scans and scans[0] == plan[0]:
+        # The driving table is read in rowid order and the LIMIT ends the scan
+        scans = scans[1:]
+    return scans
+
+
+class Command(BaseCommand):
+    help = "Run EXPLAIN QUERY PLAN on the queries of every list view and fail on full table scans"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--small-table', type=int, default=100,
+            help="Scans of tables with at most this many rows (lookup tables) are allowed",
+        )
+
+    def _row_count(self, table):
+        if table not in self._row_counts:
+            if table in connection.introspection.table_names():
+                with connection.cursor() as cursor:
+                    cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+                    self._row_counts[table] = cursor.fetchone()[0]
+            else:
+                # An alias such as T5, the row count is unknown
+                self._row_counts[table] = None
+        return self._row_counts[table]
+
+    def _is_small(self, step, small_table):
+        table = TABLE_SCAN.match(step)[1]
+        if table.startswith('sqlite_'):
+            # SQLite's own schema and statistics tables
+            return True
+        rows = self._row_count(table)
+        return rows is not None and rows <= small_table
+
+    def handle(self, *args, small_table=100, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("EXPLAIN QUERY PLAN is SQLite only")
+
+        factory = RequestFactory()
+        # Never saved, only used to get past LoginRequiredMixin
+        user = User(username='explain', is_active=True, is_staff=True, is_superuser=True)
+        failures = 0
+        self._row_counts = {}
+
+        for name, path in list_routes():
+            request = factory.get(path)
+            request.user = user
+            view = get_resolver().resolve(path).func
+            with rates.rate_table(), CaptureQueriesContext(connection) as queries:
+                response = view(request)
+                if hasattr(response, 'render'):
+                    response.render()
+
+            problems = []
+            for query in queries.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT'):
+                    continue
+                with connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                    plan = [row[-1] for row in cursor.fetchall()]
+                scans = [step for step in full_scans(sql, plan) if not self._is_small(step, small_table)]
+                if scans:
+                    problems.append((sql, scans))
+
+            if problems:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"{name} ({path}): {len(problems)} queries scan a whole table"))
+                for sql, scans in problems:
+                    self.stdout.write(f"  {', '.join(scans)}: {sql[:200]}")
+            else:
+                self.stdout.write(f"{name} ({path}): {len(queries)} queries, no full table scans")
+
+        if failures:
+            raise CommandError(f"{failures} list views do full table scans")
+        self.stdout.write(self.style.SUCCESS("No list view does a full table scan"))
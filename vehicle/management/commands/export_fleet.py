@@ -0,0 +1,38 @@
+import shutil
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vehicle import exports
+
+
+class Command(BaseCommand):
+    help = "Export the per-car profitability report (every cost chain subtotal in base currency)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=exports.FORMATS, default='csv')
+        parser.add_argument('--output', '-o', help="File to write, standard output by default (CSV only)")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Cars fetched per database round trip")
+
+    def handle(self, *args, format='csv', output=None, chunk_size=2000, **options):
+        rows = exports.fleet_rows(chunk_size=chunk_size)
+
+        if format == 'xlsx':
+            if not output:
+                raise CommandError("XLSX export needs --output")
+            try:
+                workbook = exports.xlsx_file(rows)
+            except RuntimeError as exc:
+                raise CommandError(str(exc))
+            with workbook, open(output, 'wb') as target:
+                shutil.copyfileobj(workbook, target)
+            return
+
+        if not output:
+            # No byte order mark on a terminal or pipe
+            lines = exports.csv_lines(rows)
+            next(lines)
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(output, 'w', encoding='utf-8', newline='') as target:
+            target.writelines(exports.csv_lines(rows))
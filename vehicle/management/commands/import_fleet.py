@@ -0,0 +1,44 @@
+import csv
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vehicle import importers
+
+
+class Command(BaseCommand):
+    help = "Bulk-import cars, purchases or shipping records from a CSV or JSONL file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(importers.IMPORTERS))
+        parser.add_argument('path', help="CSV with a header of form field names, or JSONL")
+        parser.add_argument('--format', choices=importers.FORMATS, help="Default: from the file extension")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per bulk insert and transaction")
+        parser.add_argument('--dry-run', action='store_true', help="Validate only, write nothing")
+        parser.add_argument('--report', help="Write the per-row errors to this CSV file")
+
+    def handle(self, *args, kind, path, format=None, batch_size=1000, dry_run=False, report=None, **options):
+        path = Path(path)
+        file_format = format or path.suffix.lstrip('.').lower()
+        if file_format not in importers.FORMATS:
+            raise CommandError(f"Cannot tell the format of {path.name}, pass --format")
+        if not path.exists():
+            raise CommandError(f"{path} does not exist")
+
+        importer = importers.IMPORTERS[kind](batch_size=batch_size, dry_run=dry_run)
+        with path.open('rb') as stream:
+            result = importer.run(importers.read_rows(stream, file_format))
+
+        for line, field, message in result.errors[:20]:
+            self.stdout.write(f"Line {line}: {field + ': ' if field else ''}{message}")
+        if len(result.errors) > 20:
+            self.stdout.write(f"... {len(result.errors) - 20} more errors")
+        if report:
+            with open(report, 'w', encoding='utf-8', newline='') as target:
+                writer = csv.writer(target)
+                writer.writerow(['line', 'field', 'error'])
+                writer.writerows(result.errors)
+
+        verb = "Validated" if dry_run else "Imported"
+        summary = f"{verb} {result.created} {kind}, {result.failed_rows} rows rejected"
+        self.stdout.write(self.style.WARNING(summary) if result.errors else self.style.SUCCESS(summary))
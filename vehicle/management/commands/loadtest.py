@@ -0,0 +1,117 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from urllib.error import HTTPError, URLError
+from urllib.parse import urljoin, urlsplit
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+
+DEFAULT_ROUTES = [
+    'dashboard', 'carinfo-list', 'purchaseinfo-list', 'shippinginfo-list',
+    'world_expenses_list', 'kabul_expenses_list',
+]
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure requests/sec of a running server over the main pages, e.g. "
+        "runserver against the gunicorn profile on the same seeded fleet"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Base URL of the running server")
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help="Path to request, may be repeated (default: dashboard and list pages)",
+        )
+        parser.add_argument('--concurrency', type=int, default=8, help="Number of client threads")
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds to run")
+        parser.add_argument(
+            '--user',
+            help="Username to log in as; the server must share this database (default: first superuser)",
+        )
+        parser.add_argument('--label', default='', help="Name of the run in the summary line")
+
+    def _session_cookie(self, username):
+        User = get_user_model()
+        users = User.objects.filter(is_active=True)
+        user = users.filter(username=username).first() if username else users.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError("No user to log in as, create one or pass --user")
+
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return session, f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+    def handle(self, *args, url, paths=None, concurrency=8, duration=10.0, user=None, label='', **options):
+        if concurrency < 1 or duration <= 0:
+            raise CommandError("--concurrency and --duration must be positive")
+        paths = paths or [reverse(name) for name in DEFAULT_ROUTES]
+        login_path = reverse('login')
+        session, cookie = self._session_cookie(user)
+
+        lock = threading.Lock()
+        latencies, errors = [], []
+        deadline = time.perf_counter() + duration
+
+        def client(offset):
+            index = offset
+            while time.perf_counter() < deadline:
+                path = paths[index % len(paths)]
+                index += 1
+                request = Request(urljoin(url, path), headers={'Cookie': cookie})
+                started = time.perf_counter()
+                try:
+                    with urlopen(request, timeout=30) as response:
+                        response.read()
+                        # An expired or unknown session ends on the login page
+                        failed = 'redirected to login' if urlsplit(response.url).path == login_path else None
+                except (HTTPError, URLError, OSError) as exc:
+                    failed = exc
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if failed:
+                        errors.append((path, failed))
+                    else:
+                        latencies.append(elapsed)
+
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(client, range(concurrency)))
+        finally:
+            session.delete()
+        wall = time.perf_counter() - started
+
+        if not latencies:
+            if errors:
+                path, reason = errors[0]
+                raise CommandError(f"Every request failed, first: {path}: {reason}")
+            raise CommandError("No request finished, increase --duration")
+
+        self.stdout.write(
+            f"{label or url}: {len(latencies) / wall:.1f} req/s, "
+            f"{len(latencies)} ok, {len(errors)} failed, "
+            f"p50 {statistics.median(latencies) * 1000:.0f} ms, "
+            f"p95 {_percentile(latencies, 0.95) * 1000:.0f} ms "
+            f"({concurrency} clients, {wall:.1f}s)"
+        )
+        for path, reason in errors[:5]:
+            self.stderr.write(f"  {path}: {reason}")
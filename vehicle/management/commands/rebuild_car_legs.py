@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from vehicle import data_version, pipeline
+
+
+class Command(BaseCommand):
+    help = "Rebuild the legs of every car on the route from the stage dates"
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        legs = pipeline.rebuild()
+        data_version.bump()
+        self.stdout.write(self.style.SUCCESS(
+            f"{legs} legs in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,63 @@
+from decimal import Decimal
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from vehicle import analytics, data_version, rates
+from vehicle.models import CarCostLedger, CarInfo
+
+
+class Command(BaseCommand):
+    help = "Rebuild the car cost ledger from the stage tables and report any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only report drift, do not write the ledger",
+        )
+        parser.add_argument(
+            '--tolerance', type=Decimal, default=Decimal('0.01'),
+            help="Differences up to this amount are not reported as drift",
+        )
+
+    def handle(self, *args, check=False, tolerance=Decimal('0.01'), **options):
+        cars = CarInfo.objects.select_related('cost_ledger', *CarCostLedger.chain_related())
+        drifted = missing = 0
+
+        with rates.rate_table(), transaction.atomic():
+            rows = cars.iterator(chunk_size=500)
+            while chunk := list(islice(rows, 500)):
+                ledgers = []
+                for car, values in zip(chunk, CarCostLedger.compute_many(chunk)):
+                    ledger = getattr(car, 'cost_ledger', None)
+                    ledgers.append(CarCostLedger(car=car, **values))
+                    if ledger is None:
+                        missing += 1
+                        continue
+
+                    drift = {
+                        name: (getattr(ledger, name), value)
+                        for name, value in values.items()
+                        if abs(getattr(ledger, name) - value) > tolerance
+                    }
+                    if drift:
+                        drifted += 1
+                        for name, (stored, actual) in drift.items():
+                            self.stdout.write(f"Car #{car.pk}: {name} stored {stored:.2f}, actual {actual:.2f}")
+
+                if not check:
+                    CarCostLedger.objects.bulk_create(
+                        ledgers, update_conflicts=True, unique_fields=['car'],
+                        update_fields=[*CarCostLedger.AMOUNT_FIELDS, 'updated_at'],
+                    )
+            if not check:
+                # The rollups add up the ledger
+                analytics.rebuild()
+                data_version.bump()
+
+        summary = f"{drifted} drifted, {missing} missing ledger rows"
+        if drifted or missing:
+            self.stdout.write(self.style.WARNING(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from vehicle import analytics
+
+
+class Command(BaseCommand):
+    help = "Rebuild the monthly and weekly fleet rollups from the stage dates and the cost ledger"
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = analytics.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"{rows} rollup rows in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,72 @@
+import multiprocessing
+import signal
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from vehicle import tasks
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks (image variants, exports, ledger refreshes) until stopped"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help="Worker processes to start")
+        parser.add_argument('--burst', action='store_true', help="Stop once the queue is empty")
+        parser.add_argument('--poll', type=float, default=1.0, help="Seconds between looks at an empty queue")
+        parser.add_argument(
+            '--stale-after', type=int, default=600,
+            help="Seconds after which a running task is taken to belong to a dead worker",
+        )
+        parser.add_argument('--keep-days', type=int, default=14, help="Days finished tasks are kept")
+        parser.add_argument(
+            '--analyze-every', type=int, default=3600,
+            help="Seconds between refreshes of the SQLite table statistics",
+        )
+
+    def handle(self, *args, processes=1, burst=False, poll=1.0, stale_after=600, keep_days=14,
+               analyze_every=3600, **options):
+        if processes < 1 or poll <= 0 or stale_after <= 0 or keep_days < 0 or analyze_every <= 0:
+            raise CommandError("--processes, --poll, --stale-after and --analyze-every must be positive")
+        self.options = {
+            'burst': burst, 'poll': poll,
+            'stale_after': timedelta(seconds=stale_after), 'keep': timedelta(days=keep_days),
+            'analyze_every': timedelta(seconds=analyze_every),
+        }
+        if processes == 1:
+            self.work()
+            return
+
+        # Each process opens its own connection, none may inherit this one
+        connections.close_all()
+        workers = [multiprocessing.Process(target=self.work) for _ in range(processes)]
+
+        def forward(signum, frame):
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+
+        # Ctrl-C reaches every process of the terminal, a stop signal only
+        # this one: pass it on and wait for the workers to finish their task
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, forward)
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    def work(self):
+        stopping = []
+
+        def stop(signum, frame):
+            stopping.append(signum)
+
+        # Finish the running task on Ctrl-C or a stop signal, then exit
+        previous = {signum: signal.signal(signum, stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            done = tasks.work(stop=lambda: bool(stopping), **self.options)
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write(f"{tasks.worker_name()}: {done} tasks run")
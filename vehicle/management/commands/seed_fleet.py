@@ -0,0 +1,320 @@
+import random
+import time
+import uuid
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from vehicle import analytics, data_version, pagination, pipeline, rates
+from vehicle.models import (
+    Buyer, CarAction, CarColor, CarCostLedger, CarInfo, CarMark, CarType, Currency,
+    ExchangeRateHistory, KabulExpenses, ModelYear, PurchaseInfo, RepairAndOtherExpenses,
+    Related, SaleInfo, ShippingInfo, WorldExpenses, COST_CHAIN_RELATIONS, get_usd_currency,
+)
+
+
+# code: (name, symbol, rate to USD)
+KNOWN_CURRENCIES = {
+    'AFN': ('Afghani', '؋', Decimal('0.014200')),
+    'AED': ('UAE Dirham', 'AED', Decimal('0.272300')),
+    'EUR': ('Euro', '€', Decimal('1.080000')),
+    'PKR': ('Pakistani Rupee', 'Rs', Decimal('0.003600')),
+    'IRR': ('Iranian Rial', '﷼', Decimal('0.000024')),
+}
+
+MARKS = {
+    'Toyota': ['Corolla', 'Camry', 'Land Cruiser', 'Prius', 'RAV4'],
+    'Lexus': ['RX 350', 'ES 350', 'GX 460'],
+    'Honda': ['Civic', 'Accord', 'CR-V'],
+    'Hyundai': ['Elantra', 'Sonata', 'Tucson'],
+}
+COLORS = ['White', 'Black', 'Silver', 'Grey', 'Blue', 'Red']
+RELATED = ['Kabul', 'Herat', 'Mazar']
+ACTIONS = ['Copart', 'IAAI', 'Manheim']
+
+SHIPPING_AMOUNTS = {
+    'commission': (150, 400), 'clearing': (100, 300), 'duty_vat': (300, 1200),
+    'd_o': (50, 150), 'red_sea': (20, 80), 'towing': (150, 600),
+    'shipping': (900, 2200), 'port_clips_prmi': (30, 120), 'attstion': (40, 160),
+    'cash_paid_comission': (20, 90),
+}
+
+
+def _parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        code, _, weight = part.partition('=')
+        try:
+            mix[code.strip().upper()] = float(weight)
+        except ValueError:
+            raise CommandError(f"Invalid currency mix entry '{part}', expected CODE=WEIGHT")
+    if not mix or sum(mix.values()) <= 0:
+        raise CommandError("The currency mix needs at least one positive weight")
+    return mix
+
+
+def _clear_missing(car, present):
+    # Cache the missing stages as absent so the chain never asks the database
+    for relation in COST_CHAIN_RELATIONS:
+        if relation not in present:
+            CarInfo._meta.get_field(relation).set_cached_value(car, None)
+
+
+class Command(BaseCommand):
+    help = "Bulk-create a synthetic fleet with the full cost chain for load and scale testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cars', type=int, default=1000, help="Number of cars to create")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, the same seed on the same database gives the same fleet")
+        parser.add_argument(
+            '--currency-mix', default='USD=60,AFN=30,AED=10',
+            help="Share of amounts per currency, e.g. USD=60,AFN=30,AED=10",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--start-date', type=date.fromisoformat, default=date(2023, 1, 1),
+            help="First purchase date, purchases are spread over the following two years",
+        )
+
+    def handle(self, *args, cars, seed, currency_mix, batch_size, start_date, **options):
+        # Seeding from the fleet size too keeps repeated runs from reusing LOT numbers
+        rng = random.Random(f'{seed}-{CarInfo.objects.count()}')
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            currencies = self.seed_currencies(rng, _parse_mix(currency_mix), start_date)
+            reference = self.seed_reference(max(1, cars // 20))
+            created = 0
+            with rates.rate_table():
+                while created < cars:
+                    size = min(batch_size, cars - created)
+                    self.seed_batch(rng, size, currencies, reference, start_date)
+                    created += size
+                    self.stdout.write(f"{created}/{cars} cars", ending='\r')
+            analytics.rebuild()
+            pipeline.rebuild()
+            data_version.bump()
+        pagination.refresh_statistics()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {cars} cars in {time.perf_counter() - started:.1f}s"
+        ))
+
+    def seed_currencies(self, rng, mix, start_date):
+        """Return ``(currencies, weights)`` for the mix, creating missing currencies and rate history"""
+        base = get_usd_currency()
+        currencies = []
+        for code in mix:
+            if code == base.code:
+                currencies.append(base)
+                continue
+            if code not in KNOWN_CURRENCIES and not Currency.objects.filter(code=code).exists():
+                raise CommandError(f"Unknown currency '{code}', create it first")
+            name, symbol, rate = KNOWN_CURRENCIES.get(code, (code, code, Decimal('1')))
+            currency, created = Currency.objects.get_or_create(
+                code=code, defaults={'name': name, 'symbol': symbol, 'exchange_rate': rate},
+            )
+            if created:
+                # Monthly rates drifting around the current one
+                history = []
+                for month in range(24):
+                    rate = (rate * Decimal(str(rng.uniform(0.97, 1.03)))).quantize(Decimal('0.000001'))
+                    history.append(ExchangeRateHistory(
+                        currency=currency, rate=rate, date=start_date + timedelta(days=30 * month),
+                    ))
+                ExchangeRateHistory.objects.bulk_create(history)
+                rates.invalidate(currency.pk)
+            currencies.append(currency)
+        return currencies, list(mix.values())
+
+    def seed_reference(self, buyer_count):
+        marks = {name: CarMark.objects.get_or_create(name=name)[0] for name in MARKS}
+        existing_buyers = list(Buyer.objects.all()[:buyer_count])
+        buyers = existing_buyers + Buyer.objects.bulk_create(
+            Buyer(name=f"Buyer {index}") for index in range(len(existing_buyers), buyer_count)
+        )
+        return {
+            'marks': list(marks.values()),
+            'types': {
+                mark.pk: [CarType.objects.get_or_create(mark=mark, name=name)[0] for name in MARKS[mark.name]]
+                for mark in marks.values()
+            },
+            'years': [ModelYear.objects.get_or_create(year=str(year))[0] for year in range(2012, 2025)],
+            'colors': [CarColor.objects.get_or_create(name=name)[0] for name in COLORS],
+            'related': [Related.objects.get_or_create(name=name)[0] for name in RELATED],
+            'actions': [CarAction.objects.get_or_create(name=name)[0] for name in ACTIONS],
+            'buyers': buyers,
+            'base': get_usd_currency(),
+        }
+
+    def seed_batch(self, rng, size, currencies, reference, start_date):
+        currency_list, weights = currencies
+        base = reference['base']
+
+        def currency():
+            return rng.choices(currency_list, weights)[0]
+
+        def amount(low, high, money=None):
+            value = Decimal(str(rng.uniform(low, high))).quantize(Decimal('0.01'))
+            if money is not None and money.exchange_rate:
+                # Keep amounts realistic in the chosen currency
+                value = (value / money.exchange_rate).quantize(Decimal('0.01'))
+            return value
+
+        def day(start, spread):
+            return start + timedelta(days=rng.randint(0, spread))
+
+        cars = []
+        for _ in range(size):
+            mark = rng.choice(reference['marks'])
+            car = CarInfo(
+                mark=mark,
+                car_type=rng.choice(reference['types'][mark.pk]),
+                model_year=rng.choice(reference['years']),
+                color=rng.choice(reference['colors']),
+                related=rng.choice(reference['related']),
+                action=rng.choice(reference['actions']),
+                vin=f"{rng.getrandbits(60):017X}",
+                lot=f"LOT-{uuid.UUID(int=rng.getrandbits(128)).hex[:8].upper()}",
+                position=rng.choice(['Dubai', 'Herat', 'Kabul', 'USA']),
+            )
+            # bulk_create skips save()
+            car.set_search_fields()
+            cars.append(car)
+        CarInfo.objects.bulk_create(cars)
+
+        stages = {model: [] for model in (
+            PurchaseInfo, ShippingInfo, WorldExpenses, KabulExpenses, RepairAndOtherExpenses, SaleInfo,
+        )}
+        ledgers = []
+        for car in cars:
+            # Most of the fleet has gone through the whole chain
+            depth = rng.choices(range(1, 7), weights=[5, 8, 8, 8, 11, 60])[0]
+            present = set(COST_CHAIN_RELATIONS[:depth])
+            _clear_missing(car, present)
+            bought = datetime.combine(day(start_date, 700), dt_time(rng.randint(8, 17)), tzinfo=dt_timezone.utc)
+            on = bought.date()
+
+            purchase_currency = currency()
+            purchase = PurchaseInfo(
+                car=car,
+                purchase_price=amount(3000, 30000, purchase_currency),
+                purchase_price_currency=purchase_currency,
+                paid_amount_currency=purchase_currency,
+                buy_date=bought,
+            )
+            purchase.paid_amount = (purchase.purchase_price * Decimal(rng.choice(['1', '0.5', '0']))).quantize(Decimal('0.01'))
+            # What PurchaseInfo.save derives
+            purchase.remain_purchase = (
+                purchase._convert_to_base(purchase.purchase_price, 'purchase_price', 'buy_date')
+                - purchase._convert_to_base(purchase.paid_amount, 'paid_amount', 'buy_date')
+            )
+            if purchase.remain_purchase > 0:
+                purchase.payment_date = bought + timedelta(days=rng.randint(10, 60))
+            car.purchase_info = purchase
+            stages[PurchaseInfo].append(purchase)
+
+            if 'shipping_info' in present:
+                on = day(on, 20)
+                shipping = ShippingInfo(
+                    car=car,
+                    etd_from_usa=on,
+                    date_arrived_in_dubai=on + timedelta(days=rng.randint(25, 45)),
+                    total_price_to_dubai_currency=base,
+                    cnt_number=f"CNT{rng.randint(100000, 999999)}",
+                    bkg_number=f"BKG{rng.randint(100000, 999999)}",
+                )
+                for name, (low, high) in SHIPPING_AMOUNTS.items():
+                    money = currency()
+                    setattr(shipping, name, amount(low, high, money))
+                    setattr(shipping, f'{name}_currency', money)
+                    setattr(shipping, f'{name}_date', day(on, 40))
+                shipping.dubai_paid_invoice = amount(1000, 3000)
+                shipping.dubai_paid_invoice_currency = base
+                shipping.dubai_paid_invoice_date = day(on, 40)
+                car.shipping_info = shipping
+                stages[ShippingInfo].append(shipping)
+                on = shipping.date_arrived_in_dubai
+
+            if 'world_expenses' in present:
+                on = day(on, 30)
+                world = WorldExpenses(car=car, herat_arrival_date=on, return_date_from_dubai=day(on, 10))
+                for name, (low, high) in (
+                    ('shipiping_price_to_islam_qala', (500, 1500)),
+                    ('gomrok_payment', (800, 4000)),
+                    ('business_company_comission', (100, 400)),
+                ):
+                    money = currency()
+                    setattr(world, name, amount(low, high, money))
+                    setattr(world, f'{name}_currency', money)
+                    setattr(world, f'{name}_date', day(on, 15))
+                world.paid_value_for_shipping_currency = world.shipiping_price_to_islam_qala_currency
+                world.paid_value_for_shipping = rng.choice([world.shipiping_price_to_islam_qala, Decimal('0')])
+                world.paid_value_for_shipping_date = world.shipiping_price_to_islam_qala_date
+                # What WorldExpenses.save derives; the remain flags stay off
+                world.remain_shipping_for_islam_qala = (
+                    world._convert_to_base(
+                        world.shipiping_price_to_islam_qala, 'shipiping_price_to_islam_qala',
+                        'shipiping_price_to_islam_qala_date',
+                    )
+                    - world._convert_to_base(
+                        world.paid_value_for_shipping, 'paid_value_for_shipping', 'paid_value_for_shipping_date',
+                    )
+                )
+                car.world_expenses = world
+                stages[WorldExpenses].append(world)
+
+            if 'kabul_expenses' in present:
+                on = day(on, 10)
+                money = currency()
+                kabul = KabulExpenses(
+                    car=car,
+                    herat_to_kabul_cost=amount(150, 500, money),
+                    herat_to_kabul_cost_currency=money,
+                    herat_to_kabul_cost_date=on,
+                    arrival_date_kabul=day(on, 5),
+                )
+                car.kabul_expenses = kabul
+                stages[KabulExpenses].append(kabul)
+
+            if 'repair_expenses' in present:
+                on = day(on, 20)
+                repair_currency, palate_currency = currency(), currency()
+                repair = RepairAndOtherExpenses(
+                    car=car,
+                    repair_cost=amount(0, 2500, repair_currency),
+                    repair_cost_currency=repair_currency,
+                    repair_cost_date=on,
+                    palate_cost=amount(100, 400, palate_currency),
+                    palate_cost_currency=palate_currency,
+                    palate_cost_date=day(on, 10),
+                )
+                car.repair_expenses = repair
+                stages[RepairAndOtherExpenses].append(repair)
+
+            if 'sale_info' in present:
+                status = rng.choices(
+                    [SaleInfo.STATUS_SOLD, SaleInfo.STATUS_READY, SaleInfo.STATUS_IN_TRANSIT], weights=[60, 30, 10],
+                )[0]
+                # Every car that reaches the sale stage went through repair
+                final_cost = car.repair_expenses.compute_final_cost()
+                sale = SaleInfo(car=car, status=status, sale_price_currency=base)
+                if status == SaleInfo.STATUS_SOLD:
+                    markup = Decimal(str(rng.uniform(0.9, 1.35)))
+                    sale.sale_price = (final_cost * markup).quantize(Decimal('0.01'))
+                    sale.sale_date = day(on, 60)
+                    sale.buyer = rng.choice(reference['buyers'])
+                else:
+                    # What SaleInfo.save derives for cars that are not sold,
+                    # as stored, which is what the ledger is computed from
+                    sale.sale_price = final_cost.quantize(Decimal('0.01'))
+                car.sale_info = sale
+                stages[SaleInfo].append(sale)
+
+            ledgers.append(CarCostLedger(car=car, **CarCostLedger.compute(car)))
+
+        for model, objects in stages.items():
+            model.objects.bulk_create(objects)
+        CarCostLedger.objects.bulk_create(ledgers)
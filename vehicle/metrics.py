@@ -0,0 +1,136 @@
+"""
+Call counts, time and queries of the cost properties of the stage models,
+switched on with ``DJANGO_COST_METRICS``.
+
+The subtotals are chained: ``SaleInfo.benefit`` reads ``repair_final_cost``,
+which reads ``RepairAndOtherExpenses.final_cost`` and so on up to the
+purchase.  Every property and ``compute_*`` method of the chain is wrapped
+with ``@timed``, which records per page (the view of the request, empty
+outside one) and property:
+
+* calls,
+* seconds, including the timed properties it reads,
+* self seconds, without them, which is what to add up to see where a page
+  spends its time,
+* queries run, including those of the timed properties it reads.
+
+The totals are kept in memory, per worker process, and served in the
+Prometheus text format under ``/metrics/``.
+"""
+import functools
+import threading
+import time
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import connections
+
+
+# Prometheus exposition format 0.0.4
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_state = Local()
+_lock = threading.Lock()
+# (view, property) -> [calls, seconds, self seconds, queries]
+_totals = {}
+
+
+def _count_query(execute, sql, params, many, context):
+    _state.queries = getattr(_state, 'queries', 0) + 1
+    return execute(sql, params, many, context)
+
+
+def _count_queries():
+    for connection in connections.all():
+        if _count_query not in connection.execute_wrappers:
+            # First, so the wrappers pushed and popped around a block by
+            # ``execute_wrapper()`` stay last
+            connection.execute_wrappers.insert(0, _count_query)
+
+
+def timed(func):
+    """Record the calls of ``func`` under its qualified name, e.g. ``SaleInfo.benefit``."""
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not settings.COST_METRICS:
+            return func(*args, **kwargs)
+        _count_queries()
+        stack = getattr(_state, 'stack', None)
+        if stack is None:
+            stack = _state.stack = []
+        # Time spent in the timed calls made by this one
+        stack.append(0.0)
+        queries = getattr(_state, 'queries', 0)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            _record(
+                (getattr(_state, 'view', ''), name),
+                elapsed, elapsed - nested, getattr(_state, 'queries', 0) - queries,
+            )
+    return wrapper
+
+
+def _record(key, seconds, self_seconds, queries):
+    with _lock:
+        totals = _totals.get(key)
+        if totals is None:
+            totals = _totals[key] = [0, 0.0, 0.0, 0]
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2] += self_seconds
+        totals[3] += queries
+
+
+def set_view(view):
+    """Name the page the properties read from now on in this thread are counted under."""
+    _state.view = view
+
+
+def snapshot():
+    """``{(view, property): {'calls', 'seconds', 'self_seconds', 'queries'}}``"""
+    with _lock:
+        return {
+            key: dict(zip(('calls', 'seconds', 'self_seconds', 'queries'), totals))
+            for key, totals in _totals.items()
+        }
+
+
+def reset():
+    with _lock:
+        _totals.clear()
+
+
+# (metric, field of ``snapshot()``, help)
+METRICS = (
+    ('vehicle_cost_property_calls_total', 'calls', "Calls of a cost property."),
+    ('vehicle_cost_property_seconds_total', 'seconds',
+     "Time spent in a cost property, with the cost properties it reads."),
+    ('vehicle_cost_property_self_seconds_total', 'self_seconds',
+     "Time spent in a cost property, without the cost properties it reads."),
+    ('vehicle_cost_property_queries_total', 'queries',
+     "Queries run by a cost property, with the cost properties it reads."),
+)
+
+
+def _label(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def prometheus_text():
+    """The totals as counters in the Prometheus text format."""
+    rows = sorted(snapshot().items())
+    lines = []
+    for metric, field, help_text in METRICS:
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} counter')
+        for (view, name), totals in rows:
+            lines.append(f'{metric}{{view="{_label(view)}",property="{_label(name)}"}} {totals[field]}')
+    return '\n'.join(lines) + '\n'
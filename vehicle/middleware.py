@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import reverse
+
+from . import metrics, profiling, rates
+
+
+class RateTableMiddleware:
+    """Give every request its own exchange-rate table (see ``vehicle.rates``)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with rates.rate_table():
+            return self.get_response(request)
+
+
+class ProfilingMiddleware:
+    """
+    Record the time breakdown and queries of every request (see
+    ``vehicle.profiling``).  Left out of the chain unless
+    ``settings.PROFILING`` is on.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # Photos, and the profiling pages themselves
+        self.skipped = (settings.MEDIA_URL, reverse('profiling_list'))
+
+    def __call__(self, request):
+        if request.path.startswith(self.skipped):
+            return self.get_response(request)
+        with profiling.profile_request(request) as profile:
+            response = self.get_response(request)
+            profile.status = response.status_code
+        return response
+
+
+class CostMetricsMiddleware:
+    """
+    Count the cost properties read by a request under its view (see
+    ``vehicle.metrics``).  Left out of the chain unless
+    ``settings.COST_METRICS`` is on.
+    """
+
+    def __init__(self, get_response):
+        if not settings.COST_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            metrics.set_view('')
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics.set_view(request.resolver_match.view_name)
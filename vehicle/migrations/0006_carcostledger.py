@@ -0,0 +1,131 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:25
+
+from bisect import bisect_right
+from datetime import datetime
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+# The cost chain as it stands at this migration, frozen here so that later
+# changes to the models or to ``vehicle.rates`` do not change what it writes.
+# ``manage.py rebuild_cost_ledger`` recomputes the ledger with today's code.
+SHIPPING_AMOUNTS = (
+    'commission', 'clearing', 'duty_vat', 'd_o', 'red_sea', 'towing',
+    'shipping', 'port_clips_prmi', 'attstion', 'cash_paid_comission',
+)
+HERAT_AMOUNTS = ('shipiping_price_to_islam_qala', 'gomrok_payment', 'business_company_comission')
+# (ledger field, stage, amount field, date field)
+CHAIN_AMOUNTS = (
+    ('purchase_in_base', 'purchase_info', 'purchase_price', 'buy_date'),
+    *(('masaref_to_dubai', 'shipping_info', name, f'{name}_date') for name in SHIPPING_AMOUNTS),
+    *(('expenses_to_herat', 'world_expenses', name, f'{name}_date') for name in HERAT_AMOUNTS),
+    ('herat_to_kabul_in_base', 'kabul_expenses', 'herat_to_kabul_cost', 'herat_to_kabul_cost_date'),
+    ('repair_in_base', 'repair_expenses', 'repair_cost', 'repair_cost_date'),
+    ('palate_in_base', 'repair_expenses', 'palate_cost', 'palate_cost_date'),
+    ('sale_in_base', 'sale_info', 'sale_price', 'sale_date'),
+)
+STAGES = ('purchase_info', 'shipping_info', 'world_expenses', 'kabul_expenses', 'repair_expenses', 'sale_info')
+STATUS_SOLD = 'فروخته شده'
+
+
+def build_ledgers(apps, schema_editor):
+    CarInfo = apps.get_model('vehicle', 'CarInfo')
+    CarCostLedger = apps.get_model('vehicle', 'CarCostLedger')
+    Currency = apps.get_model('vehicle', 'Currency')
+    ExchangeRateHistory = apps.get_model('vehicle', 'ExchangeRateHistory')
+
+    currencies = {pk: (is_base, rate) for pk, is_base, rate in Currency.objects.values_list('pk', 'is_base', 'exchange_rate')}
+    history = {}
+    rows = ExchangeRateHistory.objects.order_by('currency_id', 'date', 'created_at')
+    for currency_id, day, rate in rows.values_list('currency_id', 'date', 'rate'):
+        dates, rates = history.setdefault(currency_id, ([], []))
+        dates.append(day)
+        rates.append(rate)
+
+    def to_base(amount, currency_id, day):
+        # Currency.get_rate_at_date: the latest history row on or before
+        # the day, else the current rate
+        if amount is None:
+            return Decimal('0')
+        if currency_id not in currencies or currencies[currency_id][0]:
+            return amount
+        if not day:
+            return amount * currencies[currency_id][1]
+        if isinstance(day, datetime):
+            if timezone.is_aware(day):
+                day = timezone.make_naive(day, timezone.get_default_timezone())
+            day = day.date()
+        dates, rates = history.get(currency_id, ((), ()))
+        index = bisect_right(dates, day)
+        return amount * (rates[index - 1] if index else currencies[currency_id][1])
+
+    fields = [
+        'pk', 'sale_info__status', *(f'{stage}__pk' for stage in STAGES),
+        *(
+            f'{stage}__{name}' for _, stage, amount, date in CHAIN_AMOUNTS
+            for name in (amount, f'{amount}_currency', date)
+        ),
+    ]
+    zero = Decimal('0')
+    ledgers = []
+    for row in CarInfo.objects.order_by('pk').values(*fields).iterator(chunk_size=1000):
+        values = {}
+        for key, stage, amount, date in CHAIN_AMOUNTS:
+            converted = to_base(row[f'{stage}__{amount}'], row[f'{stage}__{amount}_currency'], row[f'{stage}__{date}'])
+            values[key] = values.get(key, zero) + converted
+        has = {stage: row[f'{stage}__pk'] is not None for stage in STAGES}
+        purchase = values['purchase_in_base']
+        total_to_dubai = purchase + values['masaref_to_dubai'] if has['shipping_info'] else zero
+        all_to_herat = total_to_dubai + values['expenses_to_herat'] if has['world_expenses'] else zero
+        in_kabul = all_to_herat + values['herat_to_kabul_in_base'] if has['kabul_expenses'] else zero
+        final_cost = values['repair_in_base'] + values['palate_in_base'] + in_kabul if has['repair_expenses'] else zero
+        sale_in_base = values['sale_in_base']
+        benefit = zero
+        if row['sale_info__status'] == STATUS_SOLD:
+            benefit = sale_in_base - (sale_in_base * Decimal('0.02') + Decimal('100')) - final_cost
+        ledgers.append(CarCostLedger(
+            car_id=row['pk'], total_to_dubai=total_to_dubai, all_expenses_to_herat=all_to_herat,
+            total_cost_in_kabul=in_kabul, final_cost=final_cost, benefit=benefit, **values,
+        ))
+        if len(ledgers) == 1000:
+            CarCostLedger.objects.bulk_create(ledgers)
+            ledgers = []
+    CarCostLedger.objects.bulk_create(ledgers)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicle', '0005_purchaseinfo_payment_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarCostLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('purchase_in_base', models.DecimalField(decimal_places=6, default=0, max_digits=24)),
+                ('masaref_to_dubai', models.DecimalField(decimal_places=6, default=0, max_digits=24)),
+                ('total_to_dubai', models.DecimalField(decimal_places=6, default=0, max_digits=24)),
+                ('expenses_to_herat', models.DecimalField(decimal_places=6, default=0, max_digits=24)),
+                ('all_expenses_to_herat', models.DecimalField(decimal_places=6, default=0, max_digits=24)),
+                ('herat_to_kabul_in_base', models.DecimalField(decimal_places=6, default=0, max_digits=24)),
+                ('total_cost_in_kabul', models.DecimalField(decimal_places=6, default=0, max_digits=24)),
+                ('repair_in_base', models.DecimalField(decimal_places=6, default=0, max_digits=24)),
+                ('palate_in_base', models.DecimalField(decimal_places=6, default=0, max_digits=24)),
+                ('final_cost', models.DecimalField(decimal_places=6, default=0, max_digits=24)),
+                ('sale_in_base', models.DecimalField(decimal_places=6, default=0, max_digits=24)),
+                ('benefit', models.DecimalField(decimal_places=6, default=0, max_digits=24)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('car', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='cost_ledger', to='vehicle.carinfo')),
+            ],
+            options={
+                'verbose_name': 'Car Cost Ledger',
+                'verbose_name_plural': 'Car Cost Ledgers',
+            },
+        ),
+        migrations.RunPython(build_ledgers, migrations.RunPython.noop),
+    ]
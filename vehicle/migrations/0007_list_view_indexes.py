@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicle', '0006_carcostledger'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='exchangeratehistory',
+            name='vehicle_exc_currenc_877e97_idx',
+        ),
+        migrations.AddIndex(
+            model_name='carinfo',
+            index=models.Index(fields=['vin'], name='vehicle_car_vin_ece661_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeratehistory',
+            index=models.Index(fields=['currency', 'date', 'created_at'], name='vehicle_exc_currenc_65dd95_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseinfo',
+            index=models.Index(fields=['buy_date'], name='vehicle_pur_buy_dat_626b4b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='saleinfo',
+            index=models.Index(fields=['status', 'sale_date'], name='vehicle_sal_status_0f8e4e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shippinginfo',
+            index=models.Index(fields=['date_arrived_in_dubai'], name='vehicle_shi_date_ar_0284ac_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:10
+
+from django.db import migrations, models
+from django.db.models.functions import Reverse
+
+
+def reverse_vins(apps, schema_editor):
+    CarInfo = apps.get_model('vehicle', 'CarInfo')
+    CarInfo.objects.update(vin_reversed=Reverse('vin'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicle', '0007_list_view_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carinfo',
+            name='vin_reversed',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.RunPython(reverse_vins, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='carinfo',
+            index=models.Index(fields=['vin_reversed'], name='vehicle_car_vin_rev_0c42bb_idx'),
+        ),
+    ]
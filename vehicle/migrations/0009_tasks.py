@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:35
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicle', '0008_car_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='کار')),
+                ('kwargs', models.JSONField(blank=True, default=dict, verbose_name='ورودی')),
+                ('unique_key', models.CharField(blank=True, db_index=True, editable=False, max_length=255)),
+                ('status', models.CharField(choices=[('queued', 'در صف'), ('running', 'در حال اجرا'), ('done', 'انجام شد'), ('failed', 'ناکام')], default='queued', max_length=10, verbose_name='حالت')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='تلاش\u200cها')),
+                ('max_attempts', models.PositiveSmallIntegerField(default=3, verbose_name='حداکثر تلاش')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='اجرا بعد از')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='زمان ثبت')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='شروع')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='پایان')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='کارگر')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='نتیجه')),
+                ('error', models.TextField(blank=True, verbose_name='خطا')),
+            ],
+            options={
+                'verbose_name': 'کار پس\u200cزمینه',
+                'verbose_name_plural': 'کارهای پس\u200cزمینه',
+                'indexes': [models.Index(fields=['status', 'run_after'], name='vehicle_tas_status_203fa8_idx')],
+            },
+        ),
+    ]
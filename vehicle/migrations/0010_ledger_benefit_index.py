@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicle', '0009_tasks'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='carcostledger',
+            index=models.Index(fields=['benefit'], name='vehicle_car_benefit_3664a0_idx'),
+        ),
+    ]
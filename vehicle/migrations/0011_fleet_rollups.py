@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicle', '0010_ledger_benefit_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FleetRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('month', 'ماهانه'), ('week', 'هفته\u200cوار')], max_length=5)),
+                ('start', models.DateField()),
+                ('bought', models.PositiveIntegerField(default=0)),
+                ('shipped', models.PositiveIntegerField(default=0)),
+                ('arrived_dubai', models.PositiveIntegerField(default=0)),
+                ('arrived_herat', models.PositiveIntegerField(default=0)),
+                ('arrived_kabul', models.PositiveIntegerField(default=0)),
+                ('sold', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=6, default=0, max_digits=24)),
+                ('cost', models.DecimalField(decimal_places=6, default=0, max_digits=24)),
+                ('benefit', models.DecimalField(decimal_places=6, default=0, max_digits=24)),
+            ],
+            options={
+                'verbose_name': 'Fleet Rollup',
+                'verbose_name_plural': 'Fleet Rollups',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='kabulexpenses',
+            index=models.Index(fields=['arrival_date_kabul'], name='vehicle_kab_arrival_678032_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shippinginfo',
+            index=models.Index(fields=['etd_from_usa'], name='vehicle_shi_etd_fro_9feb2f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='worldexpenses',
+            index=models.Index(fields=['herat_arrival_date'], name='vehicle_wor_herat_a_8c5322_idx'),
+        ),
+        migrations.AddField(
+            model_name='fleetrollup',
+            name='car_type',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='vehicle.cartype'),
+        ),
+        migrations.AddField(
+            model_name='fleetrollup',
+            name='mark',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='vehicle.carmark'),
+        ),
+        migrations.AddIndex(
+            model_name='fleetrollup',
+            index=models.Index(fields=['kind', 'start'], name='vehicle_fle_kind_ec6c00_idx'),
+        ),
+    ]
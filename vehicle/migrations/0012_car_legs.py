@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicle', '0011_fleet_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarLeg',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('leg', models.CharField(choices=[('usa', 'در امریکا'), ('to_dubai', 'در راه امارات'), ('dubai', 'در امارات'), ('to_herat', 'در راه هرات'), ('to_kabul', 'هرات تا کابل'), ('kabul', 'در کابل تا فروش')], max_length=10)),
+                ('started', models.DateField()),
+                ('ended', models.DateField(blank=True, null=True)),
+                ('days', models.IntegerField(blank=True, null=True)),
+                ('month', models.DateField(blank=True, null=True)),
+                ('week', models.DateField(blank=True, null=True)),
+                ('car', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='legs', to='vehicle.carinfo')),
+            ],
+            options={
+                'verbose_name': 'Car Leg',
+                'verbose_name_plural': 'Car Legs',
+                'indexes': [models.Index(fields=['leg', 'month', 'days'], name='vehicle_car_leg_727760_idx'), models.Index(fields=['leg', 'week', 'days'], name='vehicle_car_leg_b27dd5_idx'), models.Index(condition=models.Q(('ended__isnull', True)), fields=['leg'], name='vehicle_carleg_current')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+from django.db.models.functions import Reverse, Upper
+
+
+def upper_case_codes(apps, schema_editor):
+    CarInfo = apps.get_model('vehicle', 'CarInfo')
+    CarInfo.objects.exclude(vin=Upper('vin')).update(vin=Upper('vin'))
+    CarInfo.objects.exclude(vin_reversed=Reverse('vin')).update(vin_reversed=Reverse('vin'))
+    # LOT# is unique: leave a LOT# alone when its upper case is already taken
+    taken = set(CarInfo.objects.values_list('lot', flat=True))
+    for car in CarInfo.objects.exclude(lot=Upper('lot')).only('pk', 'lot'):
+        lot = car.lot.upper()
+        if lot not in taken:
+            taken.add(lot)
+            CarInfo.objects.filter(pk=car.pk).update(lot=lot)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicle', '0012_car_legs'),
+    ]
+
+    operations = [
+        migrations.RunPython(upper_case_codes, migrations.RunPython.noop),
+    ]
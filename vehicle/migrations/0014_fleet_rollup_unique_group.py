@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:33
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+def drop_duplicate_groups(apps, schema_editor):
+    # Two refreshes of one period could each write its groups before the
+    # constraint; keep the first row of each.  Only deletes, so the table
+    # has no pending foreign key checks when the constraint is added
+    FleetRollup = apps.get_model('vehicle', 'FleetRollup')
+    groups = (
+        FleetRollup.objects.values('kind', 'start', 'mark', 'car_type')
+        .annotate(rows=models.Count('pk'), first=models.Min('pk'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for group in groups:
+        FleetRollup.objects.filter(
+            kind=group['kind'], start=group['start'], mark=group['mark'], car_type=group['car_type'],
+        ).exclude(pk=group['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicle', '0013_upper_case_car_codes'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_groups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='fleetrollup',
+            constraint=models.UniqueConstraint(models.F('kind'), models.F('start'), django.db.models.functions.comparison.Coalesce('mark', 0), django.db.models.functions.comparison.Coalesce('car_type', 0), name='vehicle_fleetrollup_unique_group'),
+        ),
+    ]
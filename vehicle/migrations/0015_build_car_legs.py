@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+from django.db import migrations
+from django.utils import timezone
+
+# The legs as they stand at this migration, frozen here so that later
+# changes to the models or to ``vehicle.pipeline`` do not change what it
+# writes.  ``manage.py rebuild_car_legs`` rebuilds them with today's code.
+# (stop, date of it from a car), in route order
+STOPS = (
+    ('bought', 'purchase_info__buy_date'),
+    ('shipped', 'shipping_info__etd_from_usa'),
+    ('arrived_dubai', 'shipping_info__date_arrived_in_dubai'),
+    ('left_dubai', 'world_expenses__return_date_from_dubai'),
+    ('arrived_herat', 'world_expenses__herat_arrival_date'),
+    ('arrived_kabul', 'kabul_expenses__arrival_date_kabul'),
+    ('sold', 'sale_info__sale_date'),
+)
+# Leg ``i`` runs from stop ``i`` to stop ``i + 1``
+LEGS = ('usa', 'to_dubai', 'dubai', 'to_herat', 'to_kabul', 'kabul')
+STATUS_SOLD = 'فروخته شده'
+
+
+def build_car_legs(apps, schema_editor):
+    CarInfo = apps.get_model('vehicle', 'CarInfo')
+    CarLeg = apps.get_model('vehicle', 'CarLeg')
+
+    legs = []
+    rows = CarInfo.objects.order_by().values_list('pk', 'sale_info__status', *(path for _, path in STOPS))
+    for car_id, status, *dates in rows.iterator(chunk_size=2000):
+        # ``buy_date`` is a datetime, counted on its local day
+        dates = [timezone.localdate(day) if isinstance(day, datetime) else day for day in dates]
+        if status != STATUS_SOLD:
+            dates[-1] = None
+        for index, leg in enumerate(LEGS):
+            started, ended = dates[index], dates[index + 1]
+            if started is None or (ended is None and any(dates[index + 2:])):
+                continue
+            legs.append(CarLeg(
+                car_id=car_id, leg=leg, started=started, ended=ended,
+                days=(ended - started).days if ended else None,
+                month=ended.replace(day=1) if ended else None,
+                week=ended - timedelta(days=ended.weekday()) if ended else None,
+            ))
+
+    CarLeg.objects.all().delete()
+    CarLeg.objects.bulk_create(legs, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicle', '0014_fleet_rollup_unique_group'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_car_legs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+# The rollups as they stand at this migration, frozen here so that later
+# changes to the models or to ``vehicle.analytics`` do not change what it
+# writes.  ``manage.py rebuild_rollups`` rebuilds them with today's code.
+# (field of FleetRollup, date of the event from a car, a datetime)
+EVENTS = (
+    ('bought', 'purchase_info__buy_date', True),
+    ('shipped', 'shipping_info__etd_from_usa', False),
+    ('arrived_dubai', 'shipping_info__date_arrived_in_dubai', False),
+    ('arrived_herat', 'world_expenses__herat_arrival_date', False),
+    ('arrived_kabul', 'kabul_expenses__arrival_date_kabul', False),
+    ('sold', 'sale_info__sale_date', False),
+)
+# (field of FleetRollup, ledger field summed over the cars sold)
+AMOUNTS = (('revenue', 'sale_in_base'), ('cost', 'final_cost'), ('benefit', 'benefit'))
+STATUS_SOLD = 'فروخته شده'
+
+
+def period_starts(day):
+    return {'month': day.replace(day=1), 'week': day - timedelta(days=day.weekday())}
+
+
+def build_rollups(apps, schema_editor):
+    CarInfo = apps.get_model('vehicle', 'CarInfo')
+    FleetRollup = apps.get_model('vehicle', 'FleetRollup')
+
+    buckets = {}
+    for name, path, is_datetime in EVENTS:
+        cars = CarInfo.objects.filter(**{f'{path}__isnull': False})
+        aggregates = {name: Count('pk')}
+        if name == 'sold':
+            cars = cars.filter(sale_info__status=STATUS_SOLD)
+            aggregates.update({field: Sum(f'cost_ledger__{ledger}') for field, ledger in AMOUNTS})
+        day = TruncDate(path) if is_datetime else F(path)
+        rows = cars.annotate(day=day).values('day', 'mark', 'car_type').annotate(**aggregates).order_by()
+        for row in rows:
+            day, mark_id, car_type_id = row.pop('day'), row.pop('mark'), row.pop('car_type')
+            for kind, start in period_starts(day).items():
+                bucket = buckets.setdefault((kind, start, mark_id, car_type_id), {})
+                for field, value in row.items():
+                    if value is not None:
+                        zero = Decimal('0') if isinstance(value, Decimal) else 0
+                        bucket[field] = bucket.get(field, zero) + value
+
+    FleetRollup.objects.all().delete()
+    FleetRollup.objects.bulk_create(
+        (
+            FleetRollup(kind=kind, start=start, mark_id=mark_id, car_type_id=car_type_id, **values)
+            for (kind, start, mark_id, car_type_id), values in buckets.items()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicle', '0015_build_car_legs'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
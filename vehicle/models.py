@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from django.core.validators import MinValueValidator
 from django.utils import timezone
@@ -5,7 +6,11 @@ import uuid
 from django.utils.translation import gettext_lazy as _
 from django.core.files.storage import FileSystemStorage
 from decimal import Decimal
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.db.models.functions import Coalesce
+
+from . import metrics, rates
 
 
 # ====================== UTILITY FUNCTIONS ======================
@@ -40,12 +45,27 @@ class ExchangeRateHistory(models.Model):
         verbose_name_plural = "Exchange Rate Histories"
         ordering = ['-date', '-created_at']
         indexes = [
-            models.Index(fields=['currency', 'date']),
+            models.Index(fields=['currency', 'date', 'created_at']),
         ]
 
     def __str__(self):
         return f"{self.currency.code} @ {self.rate} on {self.date}"
 
+    def save(self, *args, **kwargs):
+        # (currency id, date) before an edit, the amounts it used to decide
+        # need recomputing as well
+        self.previous = None
+        if self.pk:
+            self.previous = ExchangeRateHistory.objects.filter(pk=self.pk).values_list('currency_id', 'date').first()
+        super().save(*args, **kwargs)
+        rates.invalidate(self.currency_id)
+
+    def delete(self, *args, **kwargs):
+        currency_id = self.currency_id
+        result = super().delete(*args, **kwargs)
+        rates.invalidate(currency_id)
+        return result
+
 
 class Currency(models.Model):
     """Model to store different currencies and their exchange rates"""
@@ -71,26 +91,30 @@ class Currency(models.Model):
 
     def save(self, *args, **kwargs):
         # Create history record when exchange rate changes
+        rate_changed = False
         if self.pk:
             orig = Currency.objects.get(pk=self.pk)
-            if orig.exchange_rate != self.exchange_rate:
-                ExchangeRateHistory.objects.create(
-                    currency=self,
-                    rate=self.exchange_rate,
-                    date=timezone.now().date()
-                )
+            rate_changed = orig.exchange_rate != self.exchange_rate
         super().save(*args, **kwargs)
+        # The cached site settings carry the base currency
+        cache.delete(DashboardSetting.CACHE_KEY)
+        # Written after the new rate so ledger refreshes triggered by the
+        # history row already see it
+        if rate_changed:
+            ExchangeRateHistory.objects.create(
+                currency=self,
+                rate=self.exchange_rate,
+                date=timezone.now().date()
+            )
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        cache.delete(DashboardSetting.CACHE_KEY)
+        return result
 
     def get_rate_at_date(self, date):
         """Get the historical rate for a specific date"""
-        if not date:
-            return self.exchange_rate
-            
-        rate = ExchangeRateHistory.objects.filter(
-            currency=self,
-            date__lte=date
-        ).order_by('-date', '-created_at').first()
-        return rate.rate if rate else self.exchange_rate
+        return rates.rate_at(self, date)
 
 
 class CurrencyAmountField(models.DecimalField):
@@ -126,6 +150,37 @@ class CurrencyModelMixin:
         return amount * Decimal(str(rate))
 
 
+class CostChainQuerySet(models.QuerySet):
+    """QuerySet for the stage models of the cost chain"""
+
+    def with_cost_chain(self):
+        """
+        Select the car, its ledger, every upstream stage and all of their
+        currencies in one query, so chain subtotals render without N+1
+        """
+        relation = self.model._meta.get_field('car').remote_field.related_name
+        upstream = COST_CHAIN_RELATIONS[:COST_CHAIN_RELATIONS.index(relation)]
+        return self.select_related(
+            'car', 'car__cost_ledger', 'car__mark', 'car__car_type__mark', 'car__model_year',
+            *_currency_fields(self.model),
+            *(f'car__{path}' for path in CarCostLedger.chain_related(upstream)),
+        )
+
+
+class CostLedgerMixin:
+    """Mixin for cost chain models whose subtotals are stored in ``CarCostLedger``"""
+
+    def _from_ledger(self, field_name, compute):
+        """
+        Read a subtotal from the car's ledger row, computing it live when
+        the car has no ledger yet
+        """
+        ledger = getattr(self.car, 'cost_ledger', None) if self.car_id else None
+        if ledger is None:
+            return compute()
+        return getattr(ledger, field_name)
+
+
 # ====================== REFERENCE TABLES ======================
 
 class Related(models.Model):
@@ -208,17 +263,37 @@ class CarInfo(models.Model):
     mark = models.ForeignKey(CarMark, on_delete=models.SET_NULL, verbose_name="MARK", null=True, blank=True)
     vin = models.CharField(max_length=100, verbose_name="VIN#", blank=True)
     lot = models.CharField(max_length=100, verbose_name="LOT#", blank=True, unique=True, editable=False)
+    # The VIN back to front, so a search by its last digits is an index range too
+    vin_reversed = models.CharField(max_length=100, blank=True, editable=False)
     
     class Meta:
         verbose_name = "معلومات جنس"
         verbose_name_plural = "معلومات جنس"
+        indexes = [
+            models.Index(fields=['vin']),
+            models.Index(fields=['vin_reversed']),
+        ]
     
     def __str__(self):
         return f"{self.mark} - {self.model_year} - {self.vin}"
     
+    @staticmethod
+    def new_lot():
+        return f"LOT-{uuid.uuid4().hex[:8].upper()}"
+
+    def set_search_fields(self):
+        """
+        Upper-case VIN# and LOT# and fill ``vin_reversed``: searches compare
+        them as index ranges, which are case-sensitive.
+        """
+        self.vin = self.vin.upper()
+        self.lot = self.lot.upper()
+        self.vin_reversed = self.vin[::-1]
+
     def save(self, *args, **kwargs):
         if not self.lot:
-            self.lot = f"LOT-{uuid.uuid4().hex[:8].upper()}"
+            self.lot = self.new_lot()
+        self.set_search_fields()
         super().save(*args, **kwargs)
 
 
@@ -383,12 +458,15 @@ class PurchaseInfo(models.Model, CurrencyModelMixin):
     class Meta:
         verbose_name = "معلومات خرید"
         verbose_name_plural = "معلومات خرید"
+        indexes = [
+            models.Index(fields=['buy_date']),
+        ]
     
     def __str__(self):
         return f"Purchase #{self.id} - {self.car.mark}"
     
-    def save(self, *args, **kwargs):
-        """Calculate remaining amount before saving"""
+    def update_remaining(self):
+        """Calculate the remaining amount, as saving does"""
         # Convert both amounts to base currency first
         paid_in_base = self._convert_to_base(self.paid_amount, 'paid_amount', 'buy_date')
         purchase_in_base = self._convert_to_base(self.purchase_price, 'purchase_price', 'buy_date')
@@ -398,7 +476,10 @@ class PurchaseInfo(models.Model, CurrencyModelMixin):
         # Automatically clear payment_date if fully paid
         if self.remain_purchase <= 0:
             self.payment_date = None
-            
+
+    def save(self, *args, **kwargs):
+        """Calculate remaining amount before saving"""
+        self.update_remaining()
         super().save(*args, **kwargs)
     
     @property
@@ -439,7 +520,7 @@ class PurchaseInfo(models.Model, CurrencyModelMixin):
 
 # ====================== SHIPPING INFORMATION ======================
 
-class ShippingInfo(models.Model, CurrencyModelMixin):
+class ShippingInfo(models.Model, CurrencyModelMixin, CostLedgerMixin):
     """بخش سوم - اطلاعات حمل و نقل و گمرکات"""
     car = models.OneToOneField(CarInfo, on_delete=models.CASCADE, related_name="shipping_info")
     date_arrived_in_dubai = models.DateField(verbose_name="تاریخ رسید به امارات", null=True, blank=True)
@@ -627,14 +708,21 @@ class ShippingInfo(models.Model, CurrencyModelMixin):
         blank=True
     )
 
+    objects = CostChainQuerySet.as_manager()
+
     class Meta:
         verbose_name = "اطلاعات حمل و نقل"
         verbose_name_plural = "اطلاعات حمل و نقل"
+        indexes = [
+            models.Index(fields=['date_arrived_in_dubai']),
+            models.Index(fields=['etd_from_usa']),
+        ]
 
     def __str__(self):
         return f"Shipping #{self.id} - {self.car.mark}"
 
     @property
+    @metrics.timed
     def mizan_invoice_dubai(self):
         """مجموع هزینه‌ها تا ATTSTION (converted to base currency)"""
         return sum([
@@ -650,20 +738,28 @@ class ShippingInfo(models.Model, CurrencyModelMixin):
         ])
 
     @property
+    @metrics.timed
     def dubai_remain_invoice(self):
         """میزان انوایس دبی attstion - مبلغ پرداخت شده (converted to base currency)"""
         paid_in_base = self._convert_to_base(self.dubai_paid_invoice, 'dubai_paid_invoice', 'dubai_paid_invoice_date')
         return self.mizan_invoice_dubai - paid_in_base
 
     @property
+    @metrics.timed
     def mizan_masaref_up_to_dubai(self):
         """مجموع مصارف تا دبی = مجموع هزینه‌ها + کمیشن نقدی (converted to base currency)"""
         comission_in_base = self._convert_to_base(self.cash_paid_comission, 'cash_paid_comission', 'cash_paid_comission_date')
         return self.mizan_invoice_dubai + comission_in_base
 
     @property
+    @metrics.timed
     def computed_total_price_to_dubai(self):
         """قیمت تمام شده تا دبی = قیمت خرید + مجموع مصارف تا دبی"""
+        return self._from_ledger('total_to_dubai', self.compute_total_price_to_dubai)
+
+    @metrics.timed
+    def compute_total_price_to_dubai(self):
+        """Live version of ``computed_total_price_to_dubai``"""
         if self.car and hasattr(self.car, 'purchase_info'):
             purchase_info = self.car.purchase_info
             purchase_in_base = purchase_info._convert_to_base(
@@ -688,7 +784,7 @@ class ShippingInfo(models.Model, CurrencyModelMixin):
 
 
 
-class WorldExpenses(models.Model, CurrencyModelMixin):
+class WorldExpenses(models.Model, CurrencyModelMixin, CostLedgerMixin):
     """بخش چهارم - معمارف مصارف انتقالات (World Expenses)"""
     car = models.OneToOneField(CarInfo, on_delete=models.CASCADE, related_name="world_expenses")
     herat_arrival_date = models.DateField(verbose_name="تاریخ رسید به هرات", null=True, blank=True)
@@ -807,14 +903,20 @@ class WorldExpenses(models.Model, CurrencyModelMixin):
         null=True, blank=True
     )
 
+    objects = CostChainQuerySet.as_manager()
+
     class Meta:
         verbose_name = "مصارف انتقالات"
         verbose_name_plural = "مصارف انتقالات"
+        indexes = [
+            models.Index(fields=['herat_arrival_date']),
+        ]
 
     def __str__(self):
         return f"World Expenses #{self.id} - {self.car.mark}"
 
     @property
+    @metrics.timed
     def amount_of_expeses_to_herat(self):
         """میزان مصارف الی هرات = قیمت شیپنگ به اسلام قلعه + محصول گمرکی + کمیشن شرکت تجارتی"""
         return (
@@ -824,6 +926,7 @@ class WorldExpenses(models.Model, CurrencyModelMixin):
         )
 
     @property
+    @metrics.timed
     def expeses_up_to_herat(self):
         """مصارف تا هرات = قیمت شیپنگ به اسلام قلعه + محصول گمرکی + باقی محصول گمرکی"""
         return (
@@ -833,10 +936,16 @@ class WorldExpenses(models.Model, CurrencyModelMixin):
         )
 
     @property
+    @metrics.timed
     def all_expeses_to_herat(self):
         """تمامی مصارف الی هرات = قیمت تمام شده تا دبی + مصارف تا هرات"""
+        return self._from_ledger('all_expenses_to_herat', self.compute_all_expeses_to_herat)
+
+    @metrics.timed
+    def compute_all_expeses_to_herat(self):
+        """Live version of ``all_expeses_to_herat``"""
         shipping_info = getattr(self.car, 'shipping_info', None)
-        total_price_to_dubai = shipping_info.computed_total_price_to_dubai if shipping_info else Decimal('0')
+        total_price_to_dubai = shipping_info.compute_total_price_to_dubai() if shipping_info else Decimal('0')
         return total_price_to_dubai + self.expeses_up_to_herat
 
     def save(self, *args, **kwargs):
@@ -907,7 +1016,7 @@ class WorldExpenses(models.Model, CurrencyModelMixin):
 
 # ====================== KABUL EXPENSES ======================
 
-class KabulExpenses(models.Model, CurrencyModelMixin):
+class KabulExpenses(models.Model, CurrencyModelMixin, CostLedgerMixin):
     """بخش پنجم - مصارف از هرات الى کابل (Kabul Expenses)"""
     car = models.OneToOneField(CarInfo, on_delete=models.CASCADE, related_name="kabul_expenses")
     
@@ -950,14 +1059,20 @@ class KabulExpenses(models.Model, CurrencyModelMixin):
         blank=True
     )
 
+    objects = CostChainQuerySet.as_manager()
+
     class Meta:
         verbose_name = "مصارف کابل"
         verbose_name_plural = "مصارف کابل"
+        indexes = [
+            models.Index(fields=['arrival_date_kabul']),
+        ]
 
     def __str__(self):
         return f"Kabul Expenses #{self.id} - {self.car.mark}"
 
     @property
+    @metrics.timed
     def usa_to_kabul_cost(self):
         """میزان مصارف از امریکا الى کابل = مصارف الی هرات + کرایه هرات به کابل"""
         world_exp = getattr(self.car, 'world_expenses', None)
@@ -970,10 +1085,16 @@ class KabulExpenses(models.Model, CurrencyModelMixin):
         return amount_to_herat + herat_to_kabul_in_base
 
     @property
+    @metrics.timed
     def total_cost_in_kabul(self):
         """قیمت تمام شد در کابل = تمام مصارف الی هرات + کرایه هرات به کابل"""
+        return self._from_ledger('total_cost_in_kabul', self.compute_total_cost_in_kabul)
+
+    @metrics.timed
+    def compute_total_cost_in_kabul(self):
+        """Live version of ``total_cost_in_kabul``"""
         world_exp = getattr(self.car, 'world_expenses', None)
-        all_expenses = world_exp.all_expeses_to_herat if world_exp else Decimal('0')
+        all_expenses = world_exp.compute_all_expeses_to_herat() if world_exp else Decimal('0')
         herat_to_kabul_in_base = self._convert_to_base(
             self.herat_to_kabul_cost,
             'herat_to_kabul_cost',
@@ -1017,7 +1138,7 @@ class KabulExpenses(models.Model, CurrencyModelMixin):
 
 # ====================== REPAIR AND OTHER EXPENSES ======================
 
-class RepairAndOtherExpenses(models.Model, CurrencyModelMixin):
+class RepairAndOtherExpenses(models.Model, CurrencyModelMixin, CostLedgerMixin):
     """بخش ششم - مصارف ترمیم و سایر هزینه ها (Repair and Other Expenses)"""
     car = models.OneToOneField(CarInfo, on_delete=models.CASCADE, related_name="repair_expenses")
     
@@ -1069,6 +1190,8 @@ class RepairAndOtherExpenses(models.Model, CurrencyModelMixin):
         help_text="This should be set manually and not automatically calculated"
     )
 
+    objects = CostChainQuerySet.as_manager()
+
     class Meta:
         verbose_name = "مصارف ترمیم و سایر هزینه ها"
         verbose_name_plural = "مصارف ترمیم و سایر هزینه ها"
@@ -1077,10 +1200,16 @@ class RepairAndOtherExpenses(models.Model, CurrencyModelMixin):
         return f"Repair & Other #{self.id} - {self.car.mark}"
 
     @property
+    @metrics.timed
     def final_cost(self):
         """تمام شد نهایی = مصارف ترمیم + مصارف پلیت + مصارف کابل"""
+        return self._from_ledger('final_cost', self.compute_final_cost)
+
+    @metrics.timed
+    def compute_final_cost(self):
+        """Live version of ``final_cost``"""
         kabul_exp = getattr(self.car, 'kabul_expenses', None)
-        kabul_total = kabul_exp.total_cost_in_kabul if kabul_exp else Decimal('0')
+        kabul_total = kabul_exp.compute_total_cost_in_kabul() if kabul_exp else Decimal('0')
         
         repair_in_base = self._convert_to_base(self.repair_cost, 'repair_cost', 'repair_cost_date')
         palate_in_base = self._convert_to_base(self.palate_cost, 'palate_cost', 'palate_cost_date')
@@ -1381,7 +1510,7 @@ class Buyer(models.Model):
         return self.name
 
 
-class SaleInfo(models.Model, CurrencyModelMixin):
+class SaleInfo(models.Model, CurrencyModelMixin, CostLedgerMixin):
     """بخش هفتم - اطلاعات فروش (Sale Information)"""
     STATUS_READY = 'آماده فروش'
     STATUS_SOLD = 'فروخته شده'
@@ -1432,9 +1561,14 @@ class SaleInfo(models.Model, CurrencyModelMixin):
         verbose_name="Currency for قیمت فروش"
     )
 
+    objects = CostChainQuerySet.as_manager()
+
     class Meta:
         verbose_name = "اطلاعات فروش"
         verbose_name_plural = "اطلاعات فروش"
+        indexes = [
+            models.Index(fields=['status', 'sale_date']),
+        ]
 
     def __str__(self):
         return f"Sale #{self.id} - {self.car.mark} - {self.get_status_display()}"
@@ -1471,12 +1605,19 @@ class SaleInfo(models.Model, CurrencyModelMixin):
         return None
 
     @property
+    @metrics.timed
     def repair_final_cost(self):
         """Direct reference to RepairAndOtherExpenses.final_cost"""
+        return self._from_ledger('final_cost', self.compute_repair_final_cost)
+
+    @metrics.timed
+    def compute_repair_final_cost(self):
+        """Live version of ``repair_final_cost``"""
         repair_expenses = getattr(self.car, 'repair_expenses', None)
-        return repair_expenses.final_cost if repair_expenses else Decimal('0')
+        return repair_expenses.compute_final_cost() if repair_expenses else Decimal('0')
 
     @property
+    @metrics.timed
     def sale_commission(self):
         """Calculate 2% commission + 100 fixed fee (only for sold cars)"""
         if self.status != self.STATUS_SOLD:
@@ -1485,11 +1626,12 @@ class SaleInfo(models.Model, CurrencyModelMixin):
         sale_in_base = self._convert_to_base(
             self.sale_price,
             'sale_price',
-            self.sale_date
+            'sale_date'
         )
         return (sale_in_base * Decimal('0.02')) + Decimal('100')
 
     @property
+    @metrics.timed
     def special_sale_price(self):
         """Sale price minus commission (only for sold cars)"""
         if self.status != self.STATUS_SOLD:
@@ -1498,28 +1640,39 @@ class SaleInfo(models.Model, CurrencyModelMixin):
         sale_in_base = self._convert_to_base(
             self.sale_price,
             'sale_price',
-            self.sale_date
+            'sale_date'
         )
         return sale_in_base - self.sale_commission
 
     @property
+    @metrics.timed
     def benefit(self):
         """Calculate benefit (only for sold cars)"""
         if self.status != self.STATUS_SOLD:
             return Decimal('0')
-        return self.special_sale_price - self.repair_final_cost
+        return self._from_ledger('benefit', self.compute_benefit)
+
+    @metrics.timed
+    def compute_benefit(self):
+        """Live version of ``benefit``"""
+        if self.status != self.STATUS_SOLD:
+            return Decimal('0')
+        return self.special_sale_price - self.compute_repair_final_cost()
 
     @property
+    @metrics.timed
     def benefit_person_1(self):
         """50% of benefit for person 1 (only for sold cars)"""
         return self.benefit / 2 if self.status == self.STATUS_SOLD else Decimal('0')
 
     @property
+    @metrics.timed
     def benefit_person_2(self):
         """50% of benefit for person 2 (only for sold cars)"""
         return self.benefit / 2 if self.status == self.STATUS_SOLD else Decimal('0')
 
     @property
+    @metrics.timed
     def capital_bound(self):
         """Capital bound is 0 for sold cars, otherwise repair_final_cost"""
         return Decimal('0') if self.status == self.STATUS_SOLD else self.repair_final_cost
@@ -1535,6 +1688,316 @@ class SaleInfo(models.Model, CurrencyModelMixin):
 
 
 
+# ====================== COST LEDGER ======================
+
+COST_CHAIN_RELATIONS = (
+    'purchase_info', 'shipping_info', 'world_expenses',
+    'kabul_expenses', 'repair_expenses', 'sale_info',
+)
+
+
+def _currency_fields(model):
+    return [
+        field.name for field in model._meta.concrete_fields
+        if field.is_relation and field.related_model is Currency
+    ]
+
+
+SHIPPING_AMOUNTS = (
+    'commission', 'clearing', 'duty_vat', 'd_o', 'red_sea', 'towing',
+    'shipping', 'port_clips_prmi', 'attstion', 'cash_paid_comission',
+)
+
+HERAT_AMOUNTS = (
+    'shipiping_price_to_islam_qala', 'gomrok_payment', 'business_company_comission',
+)
+
+# (ledger field, stage, amount field, date field) of every converted amount
+# that a ledger subtotal adds up
+COST_CHAIN_AMOUNTS = (
+    ('purchase_in_base', 'purchase_info', 'purchase_price', 'buy_date'),
+    *(('masaref_to_dubai', 'shipping_info', name, f'{name}_date') for name in SHIPPING_AMOUNTS),
+    *(('expenses_to_herat', 'world_expenses', name, f'{name}_date') for name in HERAT_AMOUNTS),
+    ('herat_to_kabul_in_base', 'kabul_expenses', 'herat_to_kabul_cost', 'herat_to_kabul_cost_date'),
+    ('repair_in_base', 'repair_expenses', 'repair_cost', 'repair_cost_date'),
+    ('palate_in_base', 'repair_expenses', 'palate_cost', 'palate_cost_date'),
+    ('sale_in_base', 'sale_info', 'sale_price', 'sale_date'),
+)
+
+
+class CarCostLedger(models.Model):
+    """
+    Stage subtotals of a car's cost chain in base currency.
+
+    Kept up to date by the signals in ``vehicle.signals`` so the chain
+    properties do not have to walk every stage table on each access.
+    Rebuild with ``manage.py rebuild_cost_ledger``.
+    """
+    car = models.OneToOneField(CarInfo, on_delete=models.CASCADE, related_name="cost_ledger")
+    purchase_in_base = models.DecimalField(max_digits=24, decimal_places=6, default=0)
+    masaref_to_dubai = models.DecimalField(max_digits=24, decimal_places=6, default=0)
+    total_to_dubai = models.DecimalField(max_digits=24, decimal_places=6, default=0)
+    expenses_to_herat = models.DecimalField(max_digits=24, decimal_places=6, default=0)
+    all_expenses_to_herat = models.DecimalField(max_digits=24, decimal_places=6, default=0)
+    herat_to_kabul_in_base = models.DecimalField(max_digits=24, decimal_places=6, default=0)
+    total_cost_in_kabul = models.DecimalField(max_digits=24, decimal_places=6, default=0)
+    repair_in_base = models.DecimalField(max_digits=24, decimal_places=6, default=0)
+    palate_in_base = models.DecimalField(max_digits=24, decimal_places=6, default=0)
+    final_cost = models.DecimalField(max_digits=24, decimal_places=6, default=0)
+    sale_in_base = models.DecimalField(max_digits=24, decimal_places=6, default=0)
+    benefit = models.DecimalField(max_digits=24, decimal_places=6, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    AMOUNT_FIELDS = (
+        'purchase_in_base', 'masaref_to_dubai', 'total_to_dubai', 'expenses_to_herat',
+        'all_expenses_to_herat', 'herat_to_kabul_in_base', 'total_cost_in_kabul',
+        'repair_in_base', 'palate_in_base', 'final_cost', 'sale_in_base', 'benefit',
+    )
+
+    # What compute_many() reads of a car and its stages
+    CHAIN_FIELDS = (
+        'pk', 'sale_info__status',
+        *(
+            f'{relation}__{name}' for _, relation, amount, date in COST_CHAIN_AMOUNTS
+            for name in (amount, f'{amount}_currency', date)
+        ),
+    )
+
+    class Meta:
+        verbose_name = "Car Cost Ledger"
+        verbose_name_plural = "Car Cost Ledgers"
+        indexes = [
+            # Benefit rankings (``vehicle.rankings``)
+            models.Index(fields=['benefit']),
+        ]
+
+    def __str__(self):
+        return f"Ledger #{self.car_id}"
+
+    @staticmethod
+    def chain_related(relations=COST_CHAIN_RELATIONS):
+        """``select_related`` paths from a car to the given stages and their currencies"""
+        paths = []
+        for relation in relations:
+            model = CarInfo._meta.get_field(relation).related_model
+            paths.append(relation)
+            paths.extend(f'{relation}__{name}' for name in _currency_fields(model))
+        return paths
+
+    @classmethod
+    def compute(cls, car):
+        """Live stage subtotals of ``car``, keyed like the ledger fields"""
+        return cls.compute_many([car])[0]
+
+    @staticmethod
+    def compute_many(cars):
+        """
+        Live stage subtotals of each of ``cars``, in order.
+
+        Every amount of every car is converted by one ``rates.convert_many``
+        call; the subtotals then add up as the stage properties do
+        (``mizan_masaref_up_to_dubai``, ``compute_total_price_to_dubai`` ...).
+        """
+        zero = Decimal('0')
+        items, slots = [], []
+        stages = []
+        for car in cars:
+            car_stages = {relation: getattr(car, relation, None) for relation in COST_CHAIN_RELATIONS}
+            stages.append(car_stages)
+            for key, relation, amount, date in COST_CHAIN_AMOUNTS:
+                stage = car_stages[relation]
+                if stage is None:
+                    continue
+                # The loaded currency if select_related() fetched it, else its id
+                currency = stage._meta.get_field(f'{amount}_currency')
+                items.append((
+                    getattr(stage, amount),
+                    currency.get_cached_value(stage) if currency.is_cached(stage) else getattr(stage, currency.attname),
+                    getattr(stage, date),
+                ))
+                slots.append((len(stages) - 1, key))
+
+        sums = [{} for _ in stages]
+        for (position, key), value in zip(slots, rates.convert_many(items)):
+            sums[position][key] = sums[position].get(key, zero) + value
+
+        results = []
+        for car_stages, values in zip(stages, sums):
+            purchase = values.get('purchase_in_base', zero)
+            masaref = values.get('masaref_to_dubai', zero)
+            herat = values.get('expenses_to_herat', zero)
+            herat_to_kabul = values.get('herat_to_kabul_in_base', zero)
+            repair = values.get('repair_in_base', zero)
+            palate = values.get('palate_in_base', zero)
+            sale_in_base = values.get('sale_in_base', zero)
+
+            total_to_dubai = purchase + masaref if car_stages['shipping_info'] else zero
+            # A missing stage adds nothing and has no subtotal of its own
+            all_to_herat = total_to_dubai + herat if car_stages['world_expenses'] else zero
+            in_kabul = all_to_herat + herat_to_kabul if car_stages['kabul_expenses'] else zero
+            final_cost = repair + palate + in_kabul if car_stages['repair_expenses'] else zero
+            sale = car_stages['sale_info']
+            benefit = zero
+            if sale and sale.status == SaleInfo.STATUS_SOLD:
+                commission = (sale_in_base * Decimal('0.02')) + Decimal('100')
+                benefit = (sale_in_base - commission) - final_cost
+            results.append({
+                'purchase_in_base': purchase,
+                'masaref_to_dubai': masaref,
+                'total_to_dubai': total_to_dubai,
+                'expenses_to_herat': herat,
+                'all_expenses_to_herat': all_to_herat,
+                'herat_to_kabul_in_base': herat_to_kabul,
+                'total_cost_in_kabul': in_kabul,
+                'repair_in_base': repair,
+                'palate_in_base': palate,
+                'final_cost': final_cost,
+                'sale_in_base': sale_in_base,
+                'benefit': benefit,
+            })
+        return results
+
+    @classmethod
+    def refresh(cls, car_id):
+        """Recompute and store the ledger row of one car"""
+        car = CarInfo.objects.select_related(*cls.chain_related()).filter(pk=car_id).first()
+        if car is None:
+            return None
+        with rates.rate_table():
+            values = cls.compute(car)
+        ledger, _ = cls.objects.update_or_create(car=car, defaults=values)
+        return ledger
+
+    @classmethod
+    def refresh_many(cls, car_ids, batch_size=1000):
+        """
+        Recompute the ledger rows of many cars, a few queries per batch, and
+        store those that changed.  Returns how many did.
+        """
+        car_ids = list(car_ids)
+        stored = Decimal(1).scaleb(-cls._meta.get_field('benefit').decimal_places)
+        written = 0
+        for start in range(0, len(car_ids), batch_size):
+            # Only the columns compute_many() reads, currencies go by id
+            cars = list(
+                CarInfo.objects.select_related('cost_ledger', *COST_CHAIN_RELATIONS)
+                .only(*cls.CHAIN_FIELDS, *(f'cost_ledger__{name}' for name in cls.AMOUNT_FIELDS))
+                .filter(pk__in=car_ids[start:start + batch_size])
+            )
+            ledgers = []
+            for car, values in zip(cars, cls.compute_many(cars)):
+                current = getattr(car, 'cost_ledger', None)
+                if current is None or any(
+                    getattr(current, name) != value.quantize(stored) for name, value in values.items()
+                ):
+                    ledgers.append(cls(car=car, **values))
+            cls.objects.bulk_create(
+                ledgers, update_conflicts=True, unique_fields=['car'],
+                update_fields=[*cls.AMOUNT_FIELDS, 'updated_at'],
+            )
+            written += len(ledgers)
+        return written
+
+
+class FleetRollup(models.Model):
+    """
+    Cars bought, shipped, arrived at each stop and sold in one month or week,
+    of one mark and type, and the revenue, cost and benefit of those sold.
+
+    Kept up to date by ``vehicle.analytics`` from the stage dates and the
+    cost ledger.  Rebuild with ``manage.py rebuild_rollups``.
+    """
+    KIND_MONTH = 'month'
+    KIND_WEEK = 'week'
+
+    KIND_CHOICES = [
+        (KIND_MONTH, 'ماهانه'),
+        (KIND_WEEK, 'هفته‌وار'),
+    ]
+
+    kind = models.CharField(max_length=5, choices=KIND_CHOICES)
+    # First day of the month, or Monday of the week
+    start = models.DateField()
+    mark = models.ForeignKey(CarMark, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    car_type = models.ForeignKey(CarType, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    bought = models.PositiveIntegerField(default=0)
+    shipped = models.PositiveIntegerField(default=0)
+    arrived_dubai = models.PositiveIntegerField(default=0)
+    arrived_herat = models.PositiveIntegerField(default=0)
+    arrived_kabul = models.PositiveIntegerField(default=0)
+    sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=24, decimal_places=6, default=0)
+    cost = models.DecimalField(max_digits=24, decimal_places=6, default=0)
+    benefit = models.DecimalField(max_digits=24, decimal_places=6, default=0)
+
+    class Meta:
+        verbose_name = "Fleet Rollup"
+        verbose_name_plural = "Fleet Rollups"
+        indexes = [
+            models.Index(fields=['kind', 'start']),
+        ]
+        constraints = [
+            # One row per period, mark and type; a missing mark or type is a
+            # group of its own, where NULLs would never be equal
+            models.UniqueConstraint(
+                'kind', 'start', Coalesce('mark', 0), Coalesce('car_type', 0),
+                name='vehicle_fleetrollup_unique_group',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.start}"
+
+
+class CarLeg(models.Model):
+    """
+    The days a car spent on one leg of the route, from the stage dates:
+    ended legs have their length and the month and week they ended in, the
+    leg a car is on now has no end yet.
+
+    Kept up to date by ``vehicle.pipeline``.  Rebuild with
+    ``manage.py rebuild_car_legs``.
+    """
+    LEG_USA = 'usa'
+    LEG_TO_DUBAI = 'to_dubai'
+    LEG_DUBAI = 'dubai'
+    LEG_TO_HERAT = 'to_herat'
+    LEG_TO_KABUL = 'to_kabul'
+    LEG_KABUL = 'kabul'
+
+    LEG_CHOICES = [
+        (LEG_USA, 'در امریکا'),
+        (LEG_TO_DUBAI, 'در راه امارات'),
+        (LEG_DUBAI, 'در امارات'),
+        (LEG_TO_HERAT, 'در راه هرات'),
+        (LEG_TO_KABUL, 'هرات تا کابل'),
+        (LEG_KABUL, 'در کابل تا فروش'),
+    ]
+
+    car = models.ForeignKey(CarInfo, on_delete=models.CASCADE, related_name="legs")
+    leg = models.CharField(max_length=10, choices=LEG_CHOICES)
+    started = models.DateField()
+    ended = models.DateField(null=True, blank=True)
+    days = models.IntegerField(null=True, blank=True)
+    # Periods of ``ended``, as ``FleetRollup.start``
+    month = models.DateField(null=True, blank=True)
+    week = models.DateField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Car Leg"
+        verbose_name_plural = "Car Legs"
+        indexes = [
+            # Percentiles read a leg's days in order per period
+            models.Index(fields=['leg', 'month', 'days']),
+            models.Index(fields=['leg', 'week', 'days']),
+            # The legs cars are on now
+            models.Index(fields=['leg'], condition=models.Q(ended__isnull=True), name='vehicle_carleg_current'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_leg_display()} #{self.car_id}"
+
+
 # ====================== CAR IMAGES ======================
 
 class CarImages(models.Model):
@@ -1608,16 +2071,37 @@ class DashboardSetting(models.Model):
     
     updated_at = models.DateTimeField(auto_now=True, verbose_name=_('Last Updated'))
 
+    CACHE_KEY = 'vehicle:dashboard_setting'
+
     # Singleton pattern implementation
     def save(self, *args, **kwargs):
         # Ensure this is the only instance
         self.pk = 1
         super().save(*args, **kwargs)
+        cache.delete(self.CACHE_KEY)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        cache.delete(self.CACHE_KEY)
+        return result
     
     @classmethod
     def load(cls):
-        """Load the single settings instance, creating it if necessary"""
-        obj, created = cls.objects.get_or_create(pk=1)
+        """
+        Load the single settings instance, creating it if necessary.
+
+        The instance is cached with its base currency, so a warm load runs
+        no queries.  Saving or deleting the settings or a currency drops the
+        cache; with a cache of its own per process, the others see the
+        change once their copy expires.
+        """
+        obj = cache.get(cls.CACHE_KEY)
+        if obj is None:
+            obj = cls.objects.select_related('base_currency').filter(pk=1).first()
+            if obj is None:
+                cls.objects.get_or_create(pk=1)
+                obj = cls.objects.select_related('base_currency').get(pk=1)
+            cache.set(cls.CACHE_KEY, obj, settings.DASHBOARD_CACHE_TIMEOUT)
         return obj
     
     class Meta:
@@ -1625,4 +2109,52 @@ class DashboardSetting(models.Model):
         verbose_name_plural = _('Site Settings')
     
     def __str__(self):
-        return self.site_name or "Site Settings"
\ No newline at end of file
+        return self.site_name or "Site Settings"
+
+# ====================== BACKGROUND TASKS ======================
+
+class Task(models.Model):
+    """Slow work queued for the ``run_tasks`` workers, see ``vehicle.tasks``"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'در صف'),
+        (STATUS_RUNNING, 'در حال اجرا'),
+        (STATUS_DONE, 'انجام شد'),
+        (STATUS_FAILED, 'ناکام'),
+    ]
+
+    name = models.CharField(max_length=100, verbose_name="کار")
+    kwargs = models.JSONField(default=dict, blank=True, verbose_name="ورودی")
+    # Set on tasks enqueued with ``unique=True``: name and arguments
+    unique_key = models.CharField(max_length=255, blank=True, db_index=True, editable=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED, verbose_name="حالت")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="تلاش‌ها")
+    max_attempts = models.PositiveSmallIntegerField(default=3, verbose_name="حداکثر تلاش")
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="اجرا بعد از")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="زمان ثبت")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="شروع")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="پایان")
+    worker = models.CharField(max_length=100, blank=True, verbose_name="کارگر")
+    result = models.JSONField(null=True, blank=True, verbose_name="نتیجه")
+    error = models.TextField(blank=True, verbose_name="خطا")
+
+    class Meta:
+        verbose_name = "کار پس‌زمینه"
+        verbose_name_plural = "کارهای پس‌زمینه"
+        indexes = [
+            # The workers' next-task query
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.get_status_display()})"
+
+    @property
+    def error_summary(self):
+        """Last line of the traceback: the exception and its message"""
+        lines = self.error.strip().splitlines()
+        return lines[-1] if lines else ''
@@ -0,0 +1,228 @@
+"""
+Keyset (cursor) pagination for list views.
+
+A page is addressed by the sort key and id of the row at its edge
+(``?after=`` / ``?before=``) instead of a page number, so the database
+seeks straight to it on the sort column's index: page 500 costs the same as
+page 1, and no ``COUNT(*)`` over the joined queryset is needed.  A total
+can still be shown, counted once and cached or read from the table
+statistics.
+"""
+import base64
+import hashlib
+import json
+from datetime import date, datetime
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F, Q
+
+
+def _encode(value, pk):
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    raw = json.dumps([value, pk]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode(cursor):
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(pk, int) or not isinstance(value, (int, str, type(None))):
+        return None
+    return value, pk
+
+
+def _seek(field, value, pk, descending, forwards):
+    """
+    ``Q`` for the rows after ``(value, pk)`` in the list order, or before it
+    when not ``forwards``.  Rows without a value sort last.
+    """
+    # Forwards follows the list order, backwards runs against it
+    lookup = 'lt' if descending == forwards else 'gt'
+    if field == 'pk':
+        return Q(**{f'pk__{lookup}': pk})
+    if value is None:
+        after_nulls = Q(**{f'{field}__isnull': True, f'pk__{lookup}': pk})
+        return after_nulls if forwards else after_nulls | Q(**{f'{field}__isnull': False})
+    condition = Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'pk__{lookup}': pk})
+    return condition | Q(**{f'{field}__isnull': True}) if forwards else condition
+
+
+def _order(field, descending, forwards):
+    reverse = descending == forwards
+    pk = '-pk' if reverse else 'pk'
+    if field == 'pk':
+        return [pk]
+    expression = F(field).desc if reverse else F(field).asc
+    # Rows without a value stay at the end of the list whichever way it is read
+    return [expression(nulls_last=True) if forwards else expression(nulls_first=True), pk]
+
+
+class KeysetPage:
+    """One page of a keyset-paginated list, with cursors to its neighbours."""
+
+    def __init__(self, object_list, field, has_next, has_previous, count=None):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = self.previous_cursor = None
+        if object_list:
+            self.previous_cursor = _encode(*self._key(object_list[0], field))
+            self.next_cursor = _encode(*self._key(object_list[-1], field))
+        self._count = count
+
+    @staticmethod
+    def _key(obj, field):
+        return (obj.pk if field == 'pk' else obj.keyset_value), obj.pk
+
+    @property
+    def total(self):
+        """``(count, estimated)`` of the whole list, or ``None`` when not counted."""
+        if callable(self._count):
+            self._count = self._count()
+        return self._count
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def keyset_page(queryset, field, descending, per_page, after=None, before=None, count=None):
+    """
+    The ``per_page`` rows of ``queryset`` ordered by ``field`` (then id)
+    that follow the cursor ``after``, or precede ``before``.
+
+    A cursor that does not decode is ignored and the first page returned.
+    """
+    after = _decode(after) if after else None
+    before = _decode(before) if before and not after else None
+    cursor = after or before
+    forwards = before is None
+
+    if field != 'pk':
+        queryset = queryset.annotate(keyset_value=F(field))
+    if cursor:
+        queryset = queryset.filter(_seek(field, *cursor, descending, forwards))
+    rows = list(queryset.order_by(*_order(field, descending, forwards))[:per_page + 1])
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if not forwards:
+        # Read backwards, flip the page back into list order
+        rows.reverse()
+        return KeysetPage(rows, field, has_next=True, has_previous=more, count=count)
+    return KeysetPage(rows, field, has_next=more, has_previous=cursor is not None, count=count)
+
+
+def estimated_count(queryset):
+    """
+    Row count of an unfiltered ``queryset`` from the table statistics, or
+    ``None`` when there are none (filtered queryset, no ``ANALYZE`` yet).
+    """
+    if queryset.query.where:
+        return None
+    table = queryset.model._meta.db_table
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'sqlite':
+            # sqlite_stat1 only exists once ANALYZE has run
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # The first number of any index's stat is the table's row count
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if not row:
+        return None
+    count = int(str(row[0]).split()[0])
+    return count if count >= 0 else None
+
+
+def refresh_statistics(*models, using=DEFAULT_DB_ALIAS):
+    """
+    Refresh the SQLite table statistics ``estimated_count`` and the query
+    planner read, for the tables of ``models`` or for every table of the
+    database ``using``.
+
+    SQLite only knows what the last ``ANALYZE`` found, so task workers run
+    this every hour and imports and ``seed_fleet`` after they write.
+    PostgreSQL's autovacuum keeps its statistics current itself.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        # Sample a bounded number of rows per index, so large tables stay quick
+        cursor.execute('PRAGMA analysis_limit=1000')
+        if not models:
+            cursor.execute('ANALYZE')
+        for model in models:
+            cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+
+def page_total(queryset, estimate=False, timeout=60):
+    """
+    ``(count, estimated)`` of ``queryset``, cached for ``timeout`` seconds
+    per distinct query.  With ``estimate`` the table statistics are used
+    when they can be.
+    """
+    sql, params = queryset.order_by().query.sql_with_params()
+    key = 'keyset-count:' + hashlib.md5(f'{estimate}{sql}{params!r}'.encode('utf-8')).hexdigest()
+    total = cache.get(key)
+    if total is None:
+        count = estimated_count(queryset) if estimate else None
+        total = (queryset.count(), False) if count is None else (count, True)
+        cache.set(key, total, timeout)
+    return total
+
+
+class KeysetPaginationMixin:
+    """
+    ``ListView`` mixin paginating by keyset on ``keyset_field`` then id.
+
+    ``paginate_count`` adds ``page_obj.total``: ``'cached'`` counts the
+    list once per ``count_cache_timeout`` seconds, ``'estimated'`` reads
+    the table statistics instead when the list is unfiltered.  The context
+    gets ``pagination_querystring``, the current querystring without the
+    cursor, for the page links.
+    """
+    keyset_field = 'pk'
+    keyset_descending = True
+    paginate_count = None
+    count_cache_timeout = 60
+
+    def get_keyset_ordering(self):
+        """``(field, descending)`` to order and paginate by."""
+        return self.keyset_field, self.keyset_descending
+
+    def paginate_queryset(self, queryset, page_size):
+        field, descending = self.get_keyset_ordering()
+        count = None
+        if self.paginate_count:
+            estimate = self.paginate_count == 'estimated'
+            count = lambda: page_total(queryset, estimate, self.count_cache_timeout)
+        page = keyset_page(
+            queryset, field, descending, page_size,
+            after=self.request.GET.get('after'), before=self.request.GET.get('before'), count=count,
+        )
+        return None, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        querystring = self.request.GET.copy()
+        for name in ('after', 'before', 'page'):
+            querystring.pop(name, None)
+        context['pagination_querystring'] = querystring.urlencode()
+        return context
@@ -0,0 +1,165 @@
+"""
+How long cars spend on each leg of the route, and how many are on each now.
+
+The route is the chain of stage dates in ``STOPS``; leg ``i`` of
+``CarLeg.LEG_CHOICES`` runs from stop ``i`` to stop ``i + 1``.  ``CarLeg``
+keeps one row per car and leg it reached, with the days the leg took and the
+month and week it ended in, so that
+
+* ``percentiles()`` reads the cars through a leg per month or week and
+  their p50/p90/p99 and average days with one window query over an index,
+* ``work_in_progress()`` reads the cars on each leg now, the capital spent
+  on them so far and the oldest of them with one grouped query.
+
+A car's rows are rewritten with its stages (see ``signals``) and by imports;
+``seed_fleet`` and ``manage.py rebuild_car_legs`` rebuild them all.  Working
+the lengths out in SQL instead would run a date function per car and leg on
+every read.
+"""
+from datetime import datetime
+from decimal import Decimal
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Avg, Count, F, Min, Q, Sum, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .analytics import period_start
+from .models import CarInfo, CarLeg, FleetRollup, SaleInfo
+
+
+# (stop, date of it from a car), in route order
+STOPS = (
+    ('bought', 'purchase_info__buy_date'),
+    ('shipped', 'shipping_info__etd_from_usa'),
+    ('arrived_dubai', 'shipping_info__date_arrived_in_dubai'),
+    ('left_dubai', 'world_expenses__return_date_from_dubai'),
+    ('arrived_herat', 'world_expenses__herat_arrival_date'),
+    ('arrived_kabul', 'kabul_expenses__arrival_date_kabul'),
+    ('sold', 'sale_info__sale_date'),
+)
+
+LEGS = dict(CarLeg.LEG_CHOICES)
+
+# What has been spent on a car so far, whichever stages it has
+CAPITAL = sum(
+    (F(f'car__cost_ledger__{name}') for name in (
+        'masaref_to_dubai', 'expenses_to_herat', 'herat_to_kabul_in_base', 'repair_in_base', 'palate_in_base',
+    )),
+    F('car__cost_ledger__purchase_in_base'),
+)
+
+
+def _stop_dates(car_ids=None):
+    """``(car_id, [date of each stop or None])`` of the cars, all by default."""
+    cars = CarInfo.objects.order_by()
+    if car_ids is not None:
+        cars = cars.filter(pk__in=car_ids)
+    rows = cars.values_list('pk', 'sale_info__status', *(path for _, path in STOPS))
+    for car_id, status, *dates in rows.iterator(chunk_size=2000):
+        # ``buy_date`` is a datetime, counted on its local day
+        dates = [timezone.localdate(day) if isinstance(day, datetime) else day for day in dates]
+        if status != SaleInfo.STATUS_SOLD:
+            dates[-1] = None
+        yield car_id, dates
+
+
+def car_legs(car_id, dates):
+    """The ``CarLeg`` rows of a car with the stop ``dates`` of ``STOPS``."""
+    legs = []
+    for index, leg in enumerate(LEGS):
+        started, ended = dates[index], dates[index + 1]
+        if started is None:
+            continue
+        if ended is None and any(dates[index + 2:]):
+            # A later stop is recorded, only this one's date is missing
+            continue
+        legs.append(CarLeg(
+            car_id=car_id, leg=leg, started=started, ended=ended,
+            days=(ended - started).days if ended else None,
+            month=period_start(FleetRollup.KIND_MONTH, ended) if ended else None,
+            week=period_start(FleetRollup.KIND_WEEK, ended) if ended else None,
+        ))
+    return legs
+
+
+def refresh(car_ids, batch_size=1000):
+    """Rewrite the legs of the cars.  Returns how many were written."""
+    car_ids = iter(car_ids)
+    written = 0
+    while batch := list(islice(car_ids, batch_size)):
+        legs = [leg for car_id, dates in _stop_dates(batch) for leg in car_legs(car_id, dates)]
+        with transaction.atomic():
+            CarLeg.objects.filter(car_id__in=batch).delete()
+            CarLeg.objects.bulk_create(legs, batch_size=batch_size)
+        written += len(legs)
+    return written
+
+
+def rebuild(batch_size=5000):
+    """Rewrite the legs of every car.  Returns how many were written."""
+    written = 0
+    with transaction.atomic():
+        CarLeg.objects.all().delete()
+        legs = (leg for car_id, dates in _stop_dates() for leg in car_legs(car_id, dates))
+        while batch := list(islice(legs, batch_size)):
+            CarLeg.objects.bulk_create(batch, batch_size=batch_size)
+            written += len(batch)
+    return written
+
+
+def percentiles(leg, kind=FleetRollup.KIND_MONTH, since=None, points=(50, 90, 99)):
+    """
+    ``[{'start', 'cars', 'average', point: days, ...}]``: per period of
+    ``kind`` the ``leg`` ended in, oldest first and from ``since`` if given,
+    the cars through it, their average days and the days at each percentile
+    ``point`` (nearest rank).
+    """
+    legs = CarLeg.objects.filter(leg=leg, **{f'{kind}__isnull': False})
+    if since is not None:
+        legs = legs.filter(**{f'{kind}__gte': period_start(kind, since)})
+    partition = [F(kind)]
+    legs = legs.annotate(
+        rank=Window(RowNumber(), partition_by=partition, order_by=[F('days').asc(), F('pk').asc()]),
+        cars=Window(Count('pk'), partition_by=partition),
+        average=Window(Avg('days'), partition_by=partition),
+    ).annotate(percent_rank=F('rank') * 100)
+    # The nearest rank of p is the first rank at or above p% of the cars
+    wanted = Q()
+    for point in points:
+        wanted |= Q(percent_rank__gte=F('cars') * point, percent_rank__lt=F('cars') * point + 100)
+    periods = {}
+    rows = legs.filter(wanted).values_list(kind, 'cars', 'average', 'rank', 'days').order_by(kind)
+    for start, cars, average, rank, days in rows:
+        period = periods.setdefault(start, {'start': start, 'cars': cars, 'average': average})
+        for point in points:
+            if cars * point <= rank * 100 < cars * point + 100:
+                period[point] = days
+    return list(periods.values())
+
+
+def work_in_progress(today=None):
+    """
+    Per leg in route order: the cars on it now, the capital spent on them
+    so far and since when the oldest of them is there.
+    """
+    today = today or timezone.localdate()
+    current = {
+        row['leg']: row for row in CarLeg.objects.filter(ended__isnull=True).values('leg').annotate(
+            cars=Count('pk'), capital=Sum(CAPITAL), oldest=Min('started'),
+        ).order_by()
+    }
+    legs = []
+    for leg, label in LEGS.items():
+        row = current.get(leg, {})
+        oldest = row.get('oldest')
+        legs.append({
+            'leg': leg,
+            'label': label,
+            'cars': row.get('cars', 0),
+            'capital': row.get('capital') or Decimal('0'),
+            'oldest': oldest,
+            'oldest_days': (today - oldest).days if oldest else None,
+        })
+    return legs
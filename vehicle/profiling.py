@@ -0,0 +1,243 @@
+"""
+Per-request profiling, switched on with ``DJANGO_PROFILING`` (see
+``middleware.ProfilingMiddleware``).
+
+Every request records its wall time split into SQL, template rendering and
+the Python left over, and its queries grouped by SQL text: a statement run
+many times with different parameters is an N+1 loop, one run again with the
+same parameters is a duplicate.  With ``DJANGO_PROFILING_CPROFILE`` the top
+of a cProfile of the request is kept too.
+
+The last ``PROFILING_BUFFER_SIZE`` requests stay in memory, each worker
+process with its own buffer, and are listed on a staff-only page.
+"""
+import cProfile
+import functools
+import io
+import itertools
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+from django.utils import timezone
+
+
+_state = Local()
+_lock = threading.Lock()
+_buffer = None
+_ids = itertools.count(1)
+
+
+class QueryGroup:
+    """The runs of one SQL statement within a request."""
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.count = 0
+        self.ms = 0.0
+        # Until the request ends, then only their number is kept
+        self.params = set()
+        self.distinct = 0
+
+    def close(self):
+        self.distinct = len(self.params)
+        self.params = None
+
+    @property
+    def duplicates(self):
+        """Runs that repeated parameters run before."""
+        return self.count - self.distinct
+
+
+class RequestProfile:
+    def __init__(self, request):
+        self.id = next(_ids)
+        self.started = timezone.now()
+        self.method = request.method
+        self.path = request.get_full_path()
+        self.view = ''
+        self.status = None
+        self.total_ms = self.sql_ms = self.template_ms = 0.0
+        self.groups = {}
+        self.cprofile = ''
+        self._rendering = False
+
+    def add_query(self, sql, params, ms):
+        group = self.groups.get(sql)
+        if group is None:
+            group = self.groups[sql] = QueryGroup(sql)
+        group.count += 1
+        group.ms += ms
+        group.params.add(repr(params))
+        self.sql_ms += ms
+
+    @property
+    def queries(self):
+        return sum(group.count for group in self.groups.values())
+
+    @property
+    def duplicates(self):
+        return sum(group.duplicates for group in self.groups.values())
+
+    @property
+    def repeated(self):
+        """Statements run more than once, most runs first."""
+        groups = [group for group in self.groups.values() if group.count > 1]
+        return sorted(groups, key=lambda group: (-group.count, -group.ms))
+
+    @property
+    def repeated_queries(self):
+        """Runs beyond the first of every statement, the cost of N+1 loops."""
+        return sum(group.count - 1 for group in self.groups.values())
+
+    @property
+    def python_ms(self):
+        return max(self.total_ms - self.sql_ms - self.template_ms, 0.0)
+
+    @property
+    def slowest(self):
+        return sorted(self.groups.values(), key=lambda group: -group.ms)[:10]
+
+
+def _buffered():
+    global _buffer
+    if _buffer is None:
+        _buffer = deque(maxlen=settings.PROFILING_BUFFER_SIZE)
+    return _buffer
+
+
+def recorded():
+    """The profiles in the buffer, newest first."""
+    with _lock:
+        return list(reversed(_buffered()))
+
+
+def get(profile_id):
+    return next((profile for profile in recorded() if profile.id == profile_id), None)
+
+
+def clear():
+    with _lock:
+        _buffered().clear()
+
+
+def current():
+    return getattr(_state, 'profile', None)
+
+
+def _record_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile = current()
+        if profile is not None:
+            profile.add_query(sql, params, (time.perf_counter() - started) * 1000)
+
+
+def _timed_render(render):
+    @functools.wraps(render)
+    def timed_render(self, context):
+        profile = current()
+        # Included templates render inside the outer one, time that one only
+        if profile is None or profile._rendering:
+            return render(self, context)
+        profile._rendering = True
+        sql_ms = profile.sql_ms
+        started = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            profile._rendering = False
+            # Lazy querysets run while rendering, they count as SQL
+            profile.template_ms += (time.perf_counter() - started) * 1000 - (profile.sql_ms - sql_ms)
+    timed_render.profiled = True
+    return timed_render
+
+
+def install():
+    """Time template rendering; done once per process."""
+    if not getattr(Template.render, 'profiled', False):
+        Template.render = _timed_render(Template.render)
+
+
+def _cprofile_text(profiler, limit=40):
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(limit)
+    return output.getvalue()
+
+
+@contextmanager
+def profile_request(request):
+    """Record the request run in the block; yields its ``RequestProfile``."""
+    install()
+    profile = RequestProfile(request)
+    previous = current()
+    _state.profile = profile
+    profiler = cProfile.Profile() if settings.PROFILING_CPROFILE else None
+    started = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(_record_query))
+            if profiler is not None:
+                try:
+                    profiler.enable()
+                except ValueError:
+                    # Another profiler is running in this thread
+                    profiler = None
+            try:
+                yield profile
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+    finally:
+        _state.profile = previous
+        profile.total_ms = (time.perf_counter() - started) * 1000
+        match = getattr(request, 'resolver_match', None)
+        profile.view = match.view_name if match else ''
+        for group in profile.groups.values():
+            group.close()
+        if profiler is not None:
+            profile.cprofile = _cprofile_text(profiler)
+        with _lock:
+            _buffered().append(profile)
+
+
+# Sort keys of the list page, worst first
+SORTS = {
+    'total': lambda profile: profile.total_ms,
+    'sql': lambda profile: profile.sql_ms,
+    'queries': lambda profile: profile.queries,
+    'repeated': lambda profile: profile.repeated_queries,
+    'template': lambda profile: profile.template_ms,
+    'python': lambda profile: profile.python_ms,
+}
+
+
+def by_view(profiles):
+    """Per-view totals of ``profiles``, slowest average first."""
+    views = {}
+    for profile in profiles:
+        views.setdefault(profile.view or profile.path, []).append(profile)
+    summary = []
+    for view, runs in views.items():
+        count = len(runs)
+        summary.append({
+            'view': view,
+            'requests': count,
+            'avg_ms': sum(run.total_ms for run in runs) / count,
+            'max_ms': max(run.total_ms for run in runs),
+            'avg_sql_ms': sum(run.sql_ms for run in runs) / count,
+            'avg_template_ms': sum(run.template_ms for run in runs) / count,
+            'avg_python_ms': sum(run.python_ms for run in runs) / count,
+            'avg_queries': sum(run.queries for run in runs) / count,
+            'max_repeated': max(run.repeated_queries for run in runs),
+        })
+    return sorted(summary, key=lambda row: -row['avg_ms'])
@@ -0,0 +1,100 @@
+"""
+Rankings of the sold cars by benefit.
+
+The benefit of every car is stored in ``CarCostLedger.benefit`` (zero until
+the car is sold), on an index, so the best or worst cars are read in index
+order and the query stops after the first ``n``, without walking the cost
+chain of any car.  The check that a car is sold is a correlated ``EXISTS``
+for that reason: as a join, SQLite would start from the sale status index
+and sort every sold car instead.
+
+Percentiles need one pass over the sold cars in benefit order, the
+leaderboards (by mark, type or month of sale) one grouped pass; callers
+showing them on every request should cache them (``data_version.cached``).
+"""
+import math
+
+from django.db import connections
+from django.db.models import Avg, Count, Exists, F, Max, Min, OuterRef, Sum, Window
+from django.db.models.functions import RowNumber, TruncMonth
+
+from .models import CarCostLedger, CarInfo, SaleInfo
+
+
+def sold_ledgers(queryset=None):
+    """Ledger rows of the sold cars of ``queryset`` (all cars by default)."""
+    sold = SaleInfo.objects.filter(car_id=OuterRef('car_id'), status=SaleInfo.STATUS_SOLD)
+    ledgers = CarCostLedger.objects.filter(Exists(sold))
+    if queryset is not None:
+        ledgers = ledgers.filter(car__in=queryset)
+    return ledgers
+
+
+def _ranked_cars(ledgers, n, descending):
+    order = ('-benefit', '-pk') if descending else ('benefit', 'pk')
+    ranked = ledgers.order_by(*order)[:n].values('car_id')
+    if not connections[ledgers.db].features.allow_sliced_subqueries_with_in:
+        # MySQL rejects LIMIT inside IN (...): read the ids first
+        ranked = list(ranked.values_list('car_id', flat=True))
+    return (
+        CarInfo.objects.filter(pk__in=ranked)
+        .annotate(benefit=F('cost_ledger__benefit'))
+        .order_by(order[0], 'pk')
+    )
+
+
+def best(n, queryset=None):
+    """The ``n`` sold cars with the highest benefit, annotated with it."""
+    return _ranked_cars(sold_ledgers(queryset), n, descending=True)
+
+
+def worst(n, queryset=None):
+    """The ``n`` sold cars with the lowest benefit, annotated with it."""
+    return _ranked_cars(sold_ledgers(queryset), n, descending=False)
+
+
+def percentiles(points=(10, 25, 50, 75, 90), queryset=None):
+    """
+    ``{point: benefit}`` of the sold cars by the nearest-rank method, empty
+    when no car is sold.
+    """
+    ledgers = sold_ledgers(queryset)
+    count = ledgers.count()
+    if not count:
+        return {}
+    ranks = {point: max(math.ceil(point / 100 * count), 1) for point in points}
+    found = dict(
+        ledgers.annotate(rank=Window(RowNumber(), order_by=[F('benefit').asc(), F('pk').asc()]))
+        .filter(rank__in=set(ranks.values()))
+        .values_list('rank', 'benefit')
+    )
+    return {point: found[rank] for point, rank in ranks.items()}
+
+
+# group: (label, values() of the group)
+GROUPS = {
+    'mark': ("مارک", {'mark_name': F('mark__name')}),
+    'type': ("نوع", {'mark_name': F('car_type__mark__name'), 'type_name': F('car_type__name')}),
+    'month': ("ماه فروش", {'month': TruncMonth('sale_info__sale_date')}),
+}
+
+
+def leaderboard(group, limit=20, queryset=None):
+    """
+    The ``limit`` groups of sold cars with the highest total benefit, with
+    their number of cars and their average, highest and lowest benefit.
+    """
+    if group not in GROUPS:
+        raise ValueError(f"Unknown group '{group}', expected one of {', '.join(GROUPS)}")
+    if queryset is None:
+        queryset = CarInfo.objects.all()
+    # Every sold car is read here, joining from the status index is right
+    return list(
+        queryset.filter(sale_info__status=SaleInfo.STATUS_SOLD).order_by().values(**GROUPS[group][1]).annotate(
+            cars=Count('pk'),
+            total=Sum('cost_ledger__benefit'),
+            average=Avg('cost_ledger__benefit'),
+            highest=Max('cost_ledger__benefit'),
+            lowest=Min('cost_ledger__benefit'),
+        ).order_by('-total')[:limit]
+    )
@@ -0,0 +1,246 @@
+"""
+Bring the stored amounts in line with a change to a currency's rate history.
+
+An amount converts at the rate of the latest history row on or before its
+date (``rates.rate_at``), so a history row dated D decides the amounts dated
+from D up to the next row's date, and a change to it touches exactly those.
+The latest row is the currency's current rate, which also converts amounts
+without a date or dated before the first row: a change to it touches those
+too and every later date.
+
+``recompute()`` finds the rows with an amount in that window, one query per
+stage table, and rewrites what their ``save()`` derives from the converted
+amounts, in batches with ``bulk_update`` and skipping rows that come out
+unchanged:
+
+* ``PurchaseInfo.remain_purchase`` (and ``payment_date`` once paid),
+* ``WorldExpenses.remain_shipping_for_islam_qala``,
+* ``KabulExpenses.remaining_price_from_herat_to_kabul``,
+* ``SaleInfo.sale_price`` of unsold cars, which follows the final cost,
+
+then refreshes the cost ledger of the cars concerned, the rollup periods
+of their dates (``analytics``), and starts a new ``data_version``.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.backends.utils import format_number
+from django.utils import timezone
+
+from . import analytics, data_version, rates
+from .models import (
+    COST_CHAIN_AMOUNTS, HERAT_AMOUNTS, CarCostLedger, CarInfo, ExchangeRateHistory,
+    KabulExpenses, PurchaseInfo, SaleInfo, WorldExpenses,
+)
+
+
+@dataclass
+class RateWindow:
+    """The dates whose conversion in ``currency_id`` a history change can alter."""
+    currency_id: int
+    since: date = None  # None: every date
+    until: date = None  # first date past the window, None when open-ended
+    first: date = None  # first history date of the currency, when open-ended
+
+    @classmethod
+    def around(cls, currency_id, since=None, through=None):
+        """
+        The window of a history row changed from ``since`` to ``through``
+        (the same day unless the row moved), read from the history as it is
+        now.
+        """
+        if since is None:
+            return cls(currency_id)
+        days = ExchangeRateHistory.objects.filter(currency_id=currency_id).order_by('date').values_list('date', flat=True)
+        until = days.filter(date__gt=through or since).first()
+        return cls(currency_id, since, until, days.first() if until is None else None)
+
+    def condition(self, model, amount, date_field, prefix=''):
+        """``Q`` for rows whose ``amount`` of ``model`` (reached by ``prefix``) converts in the window."""
+        condition = models.Q(**{f'{prefix}{amount}_currency': self.currency_id})
+        if self.since is None:
+            return condition
+        field = model._meta.get_field(date_field)
+        lookup = f'{prefix}{date_field}'
+        in_window = models.Q(**{f'{lookup}__gte': _bound(field, self.since)})
+        if self.until is not None:
+            in_window &= models.Q(**{f'{lookup}__lt': _bound(field, self.until)})
+        elif self.first is None:
+            # No history left, every amount converts at the current rate
+            return condition
+        else:
+            in_window |= models.Q(**{f'{lookup}__isnull': True})
+            in_window |= models.Q(**{f'{lookup}__lt': _bound(field, self.first)})
+        return condition & in_window
+
+
+def _bound(field, day):
+    # A day as the datetime range start ``rates`` matches a datetime against
+    if isinstance(field, models.DateTimeField):
+        return timezone.make_aware(datetime.combine(day, time.min), timezone.get_default_timezone())
+    return day
+
+
+def _stored(model, name, value):
+    """``value`` rounded as the column of ``model.name`` stores it."""
+    field = model._meta.get_field(name)
+    return Decimal(format_number(value, field.max_digits, field.decimal_places))
+
+
+def _rewrite(queryset, fields, compute, batch_size):
+    """
+    Run ``compute(rows)`` over ``queryset`` one batch at a time and save the
+    rows it returns as changed.  Returns how many were.
+    """
+    model = queryset.model
+    # Ids first: SQLite does not isolate a running SELECT from the updates
+    ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+    changed = 0
+    for start in range(0, len(ids), batch_size):
+        rows = compute(list(queryset.filter(pk__in=ids[start:start + batch_size]).order_by('pk')))
+        if rows:
+            with transaction.atomic():
+                model.objects.bulk_update(rows, fields, batch_size=batch_size)
+        changed += len(rows)
+    return changed
+
+
+def _purchases(rows):
+    converted = iter(rates.convert_many(
+        item for row in rows for item in (
+            (row.purchase_price, row.purchase_price_currency_id, row.buy_date),
+            (row.paid_amount, row.paid_amount_currency_id, row.buy_date),
+        )
+    ))
+    changed = []
+    for row in rows:
+        remain = next(converted) - next(converted)
+        payment_date = None if remain <= 0 else row.payment_date
+        remain = _stored(PurchaseInfo, 'remain_purchase', remain)
+        if remain != row.remain_purchase or payment_date != row.payment_date:
+            row.remain_purchase, row.payment_date = remain, payment_date
+            changed.append(row)
+    return changed
+
+
+def _world_expenses(rows):
+    converted = iter(rates.convert_many(
+        item for row in rows for item in (
+            (row.shipiping_price_to_islam_qala, row.shipiping_price_to_islam_qala_currency_id,
+             row.shipiping_price_to_islam_qala_date),
+            (row.paid_value_for_shipping, row.paid_value_for_shipping_currency_id, row.paid_value_for_shipping_date),
+        )
+    ))
+    changed = []
+    for row in rows:
+        remain = _stored(WorldExpenses, 'remain_shipping_for_islam_qala', next(converted) - next(converted))
+        if remain != row.remain_shipping_for_islam_qala:
+            row.remain_shipping_for_islam_qala = remain
+            changed.append(row)
+    return changed
+
+
+def _kabul_expenses(rows):
+    items = []
+    for row in rows:
+        items.append((row.herat_to_kabul_cost, row.herat_to_kabul_cost_currency_id, row.herat_to_kabul_cost_date))
+        world = getattr(row.car, 'world_expenses', None)
+        for name in HERAT_AMOUNTS:
+            items.append((
+                getattr(world, name, None), getattr(world, f'{name}_currency_id', None), getattr(world, f'{name}_date', None),
+            ))
+    converted = iter(rates.convert_many(items))
+    changed = []
+    for row in rows:
+        herat_to_kabul = next(converted)
+        to_herat = sum((next(converted) for _ in HERAT_AMOUNTS), Decimal('0'))
+        # As ``save()`` has it: the Herat to Kabul fare less the cost from the USA to Kabul
+        remaining = _stored(
+            KabulExpenses, 'remaining_price_from_herat_to_kabul', herat_to_kabul - (to_herat + herat_to_kabul),
+        )
+        if remaining != row.remaining_price_from_herat_to_kabul:
+            row.remaining_price_from_herat_to_kabul = remaining
+            changed.append(row)
+    return changed
+
+
+def _sale_prices(rows):
+    changed = []
+    for row in rows:
+        repair = getattr(row.car, 'repair_expenses', None)
+        price = _stored(SaleInfo, 'sale_price', repair.final_cost if repair else Decimal('0'))
+        if price != row.sale_price:
+            row.sale_price = price
+            changed.append(row)
+    return changed
+
+
+def ledger_cars(window):
+    """Ids of cars with an amount their ledger adds up in ``window``."""
+    conditions = {}
+    for _, relation, amount, date_field in COST_CHAIN_AMOUNTS:
+        model = CarInfo._meta.get_field(relation).related_model
+        conditions[model] = conditions.get(model, models.Q()) | window.condition(model, amount, date_field)
+    car_ids = set()
+    for model, condition in conditions.items():
+        car_ids.update(model.objects.filter(condition).values_list('car_id', flat=True))
+    return car_ids
+
+
+def recompute(currency_id, since=None, through=None, batch_size=1000):
+    """
+    Rewrite what a change to the rate history of ``currency_id`` between
+    ``since`` and ``through`` made stale, everything in that currency when
+    ``since`` is ``None``.  Returns the number of rows changed per table and
+    of cars whose ledger was refreshed.
+    """
+    window = RateWindow.around(currency_id, since, through)
+    counts = {}
+    with rates.rate_table():
+        counts['purchases'] = _rewrite(
+            PurchaseInfo.objects.filter(
+                window.condition(PurchaseInfo, 'purchase_price', 'buy_date')
+                | window.condition(PurchaseInfo, 'paid_amount', 'buy_date')
+            ),
+            ['remain_purchase', 'payment_date'], _purchases, batch_size,
+        )
+        counts['world_expenses'] = _rewrite(
+            WorldExpenses.objects.filter(
+                window.condition(WorldExpenses, 'shipiping_price_to_islam_qala', 'shipiping_price_to_islam_qala_date')
+                | window.condition(WorldExpenses, 'paid_value_for_shipping', 'paid_value_for_shipping_date')
+            ),
+            ['remain_shipping_for_islam_qala'], _world_expenses, batch_size,
+        )
+        # Only stored while there is a remainder to pay, it is zero otherwise
+        kabul = window.condition(KabulExpenses, 'herat_to_kabul_cost', 'herat_to_kabul_cost_date')
+        for name in HERAT_AMOUNTS:
+            kabul |= window.condition(WorldExpenses, name, f'{name}_date', prefix='car__world_expenses__')
+        counts['kabul_expenses'] = _rewrite(
+            KabulExpenses.objects.filter(kabul, has_remaining_price_from_herat_to_kabul=True)
+            .select_related('car__world_expenses'),
+            ['remaining_price_from_herat_to_kabul'], _kabul_expenses, batch_size,
+        )
+
+        car_ids = sorted(ledger_cars(window))
+        CarCostLedger.refresh_many(car_ids, batch_size)
+        # Unsold cars are priced at the final cost just refreshed
+        unsold = (
+            SaleInfo.objects.exclude(status=SaleInfo.STATUS_SOLD)
+            .select_related('car__repair_expenses', 'car__cost_ledger')
+        )
+        repriced = []
+        for start in range(0, len(car_ids), batch_size):
+            rows = _sale_prices(list(unsold.filter(car_id__in=car_ids[start:start + batch_size])))
+            if rows:
+                with transaction.atomic():
+                    SaleInfo.objects.bulk_update(rows, ['sale_price'], batch_size=batch_size)
+            repriced.extend(row.car_id for row in rows)
+        # The ledger converts the sale price too
+        CarCostLedger.refresh_many(repriced, batch_size)
+        analytics.refresh(analytics.car_periods(car_ids, batch_size))
+    data_version.bump()
+    counts['sales'] = len(repriced)
+    counts['cars'] = len(car_ids)
+    return counts
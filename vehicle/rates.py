@@ -0,0 +1,183 @@
+"""
+In-process exchange-rate resolver.
+
+``Currency.get_rate_at_date`` used to run one query per conversion, and a
+single ``mizan_masaref_up_to_dubai`` converts ten amounts.  Inside a rate
+table scope (every request, via ``RateTableMiddleware``) the resolver loads
+each currency's history once into a sorted array and answers "rate at date"
+with a binary search instead.
+
+``convert_many`` converts a whole batch of amounts the same way, with one
+pass over each currency's history.
+
+Outside a scope every lookup goes to the database as before, so shells and
+scripts never see a stale rate.  Saving or deleting an
+``ExchangeRateHistory`` row drops that currency from the active table.
+"""
+from bisect import bisect_right
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+
+from asgiref.local import Local
+from django.conf import settings
+from django.utils import timezone
+
+
+_state = Local()
+
+
+def _table():
+    return getattr(_state, 'table', None)
+
+
+def activate():
+    """Start a fresh rate table for the current thread or task."""
+    _state.table = {}
+
+
+def deactivate():
+    _state.table = None
+
+
+@contextmanager
+def rate_table():
+    """Resolve rates from an in-memory table for the duration of the block."""
+    previous = _table()
+    activate()
+    try:
+        yield
+    finally:
+        _state.table = previous
+
+
+def invalidate(currency_id=None):
+    """Forget the loaded history of ``currency_id`` (or of every currency)."""
+    table = _table()
+    if table is None:
+        return
+    if currency_id is None:
+        table.clear()
+    else:
+        table.pop(currency_id, None)
+
+
+def _as_date(value):
+    # Same conversion ``DateField`` applies when filtering with a datetime.
+    if isinstance(value, datetime):
+        if settings.USE_TZ and timezone.is_aware(value):
+            value = timezone.make_naive(value, timezone.get_default_timezone())
+        return value.date()
+    return value
+
+
+def _load(table, currency_ids):
+    """Load the history of every currency in ``currency_ids`` missing from ``table`` in one query."""
+    from .models import ExchangeRateHistory
+
+    missing = [currency_id for currency_id in currency_ids if currency_id not in table]
+    if not missing:
+        return
+    for currency_id in missing:
+        table[currency_id] = ([], [])
+    rows = ExchangeRateHistory.objects.filter(currency_id__in=missing).order_by(
+        'currency_id', 'date', 'created_at'
+    ).values_list('currency_id', 'date', 'rate')
+    for currency_id, day, rate in rows:
+        dates, rates = table[currency_id]
+        dates.append(day)
+        rates.append(rate)
+
+
+def _history(currency_id):
+    table = _table()
+    _load(table, (currency_id,))
+    return table[currency_id]
+
+
+def rate_at(currency, date):
+    """
+    Rate of ``currency`` on ``date``: the latest history row on or before
+    that day, falling back to ``currency.exchange_rate``.
+    """
+    if not date:
+        return currency.exchange_rate
+
+    if _table() is None:
+        from .models import ExchangeRateHistory
+
+        rate = ExchangeRateHistory.objects.filter(
+            currency=currency,
+            date__lte=date
+        ).order_by('-date', '-created_at').first()
+        return rate.rate if rate else currency.exchange_rate
+
+    dates, rates = _history(currency.pk)
+    index = bisect_right(dates, _as_date(date))
+    return rates[index - 1] if index else currency.exchange_rate
+
+
+def convert_many(items):
+    """
+    Convert ``(amount, currency, date)`` triples to base currency in bulk.
+
+    ``currency`` is a ``Currency`` or its id.  The result is a list of
+    ``Decimal`` in the order of ``items`` with the semantics of
+    ``CurrencyModelMixin._convert_to_base``: a missing amount is zero, an
+    amount without a currency or in the base currency is kept, any other is
+    multiplied by the rate at its date.
+
+    Currencies given by id are loaded with one query and every history with
+    one more (or taken from the active rate table).  The dates of each
+    currency are then sorted and matched against its history in a single
+    pass, instead of a lookup per amount.
+    """
+    from .models import Currency
+
+    items = list(items)
+    results = [Decimal('0')] * len(items)
+
+    currencies = {}
+    ids = set()
+    for _, currency, _ in items:
+        if isinstance(currency, Currency):
+            currencies[currency.pk] = (currency.is_base, currency.exchange_rate)
+        elif currency is not None:
+            ids.add(currency)
+    ids.difference_update(currencies)
+    if ids:
+        currencies.update(
+            (pk, (is_base, rate))
+            for pk, is_base, rate in Currency.objects.filter(pk__in=ids).order_by().values_list('pk', 'is_base', 'exchange_rate')
+        )
+
+    dated = {}
+    for index, (amount, currency, date) in enumerate(items):
+        if amount is None:
+            continue
+        currency_id = currency.pk if isinstance(currency, Currency) else currency
+        if currency_id is None or currency_id not in currencies or currencies[currency_id][0]:
+            # ``_convert_to_base`` keeps amounts without a (known) currency
+            results[index] = amount
+        elif not date:
+            results[index] = amount * currencies[currency_id][1]
+        else:
+            dated.setdefault(currency_id, []).append((_as_date(date), index))
+
+    # Outside a rate table scope the histories are loaded for this call only
+    table = _table()
+    if table is None:
+        table = {}
+    _load(table, dated)
+
+    for currency_id, pending in dated.items():
+        dates, rates = table[currency_id]
+        fallback = currencies[currency_id][1]
+        pending.sort()
+        position = 0
+        for day, index in pending:
+            while position < len(dates) and dates[position] <= day:
+                position += 1
+            rate = rates[position - 1] if position else fallback
+            results[index] = items[index][0] * rate
+    return results
@@ -0,0 +1,256 @@
+"""
+Set-based cost rollups.
+
+The model properties (``mizan_masaref_up_to_dubai``, ``all_expeses_to_herat``,
+``final_cost``, ``benefit`` ...) walk the cost chain one car at a time in
+Python.  The helpers in this module express the same chain as database
+annotations so totals over the whole fleet are computed by a single query.
+"""
+from decimal import Decimal
+
+from django.db.models import (
+    Case, Count, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.expressions import CombinedExpression
+from django.db.models.functions import Cast, Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import HERAT_AMOUNTS, SHIPPING_AMOUNTS, CarInfo, ExchangeRateHistory, SaleInfo
+
+MONEY = DecimalField(max_digits=24, decimal_places=6)
+
+
+class _SQLiteBare:
+    """
+    Terms of the chain are rendered as they are on SQLite.  Django casts
+    every decimal expression to NUMERIC there, and the chain nests deep
+    enough for those casts to overflow SQLite's parser stack; they would
+    change nothing, as SQLite computes any arithmetic in doubles.  Only the
+    exposed annotations are cast (``annotate_cost_chain``).
+    """
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, **extra_context)
+
+
+class _Case(_SQLiteBare, Case):
+    pass
+
+
+class _Coalesce(_SQLiteBare, Coalesce):
+    pass
+
+
+class _Combined(_SQLiteBare, CombinedExpression):
+    pass
+
+
+_ZERO = Value(Decimal('0'), output_field=MONEY)
+
+
+def _combine(lhs, connector, rhs):
+    return _Combined(lhs, connector, rhs, output_field=MONEY)
+
+
+def _add(*terms):
+    # Add pairwise so the generated SQL stays shallow.
+    if len(terms) == 1:
+        return terms[0]
+    middle = len(terms) // 2
+    return _combine(_add(*terms[:middle]), '+', _add(*terms[middle:]))
+
+
+def _number(value):
+    return Value(Decimal(value), output_field=MONEY)
+
+
+def _rate_at(currency_path, date_path):
+    """Latest historical rate of ``currency_path`` on or before ``date_path``."""
+    return ExchangeRateHistory.objects.filter(
+        currency=OuterRef(currency_path),
+        date__lte=OuterRef(date_path),
+    ).order_by('-date', '-created_at').values('rate')[:1]
+
+
+def base_amount(amount_path, currency_path, date_path=None):
+    """
+    Database counterpart of ``CurrencyModelMixin._convert_to_base``.
+
+    Missing amounts count as zero, amounts without a currency or in the base
+    currency are taken as-is, everything else is multiplied by the historical
+    rate at ``date_path`` (falling back to the current rate).  ``date_path``
+    must point at a date; annotate datetimes with ``TruncDate`` first.
+    """
+    amount = _Coalesce(F(amount_path), _ZERO, output_field=MONEY)
+    rate = F(f'{currency_path}__exchange_rate')
+    if date_path:
+        rate = _Coalesce(Subquery(_rate_at(currency_path, date_path)), rate, output_field=MONEY)
+
+    return _Case(
+        When(
+            Q(**{f'{currency_path}__isnull': True}) | Q(**{f'{currency_path}__is_base': True}),
+            then=amount,
+        ),
+        default=_combine(amount, '*', rate),
+        output_field=MONEY,
+    )
+
+
+def _if_exists(relation, expression):
+    return _Case(When(**{f'{relation}__isnull': False}, then=expression), default=_ZERO, output_field=MONEY)
+
+
+def _stage(relation, *names):
+    return [
+        base_amount(f'{relation}__{name}', f'{relation}__{name}_currency', f'{relation}__{name}_date')
+        for name in names
+    ]
+
+
+def cost_chain_expressions():
+    """
+    Unannotated expressions for every stage subtotal of a ``CarInfo`` row.
+
+    Requires the ``purchase_day`` annotation added by ``with_purchase_day``.
+    """
+    purchase = base_amount(
+        'purchase_info__purchase_price', 'purchase_info__purchase_price_currency', 'purchase_day',
+    )
+    masaref_to_dubai = _add(*_stage('shipping_info', *SHIPPING_AMOUNTS))
+    expenses_to_herat = _add(*_stage('world_expenses', *HERAT_AMOUNTS))
+    herat_to_kabul, = _stage('kabul_expenses', 'herat_to_kabul_cost')
+    repair, palate = _stage('repair_expenses', 'repair_cost', 'palate_cost')
+    sale = base_amount('sale_info__sale_price', 'sale_info__sale_price_currency', 'sale_info__sale_date')
+
+    total_to_dubai = _if_exists('shipping_info', _add(purchase, masaref_to_dubai))
+    all_expenses_to_herat = _if_exists('world_expenses', _add(total_to_dubai, expenses_to_herat))
+    total_cost_in_kabul = _if_exists('kabul_expenses', _add(all_expenses_to_herat, herat_to_kabul))
+    final_cost = _if_exists('repair_expenses', _add(repair, palate, total_cost_in_kabul))
+    commission = _add(_combine(sale, '*', _number('0.02')), _number('100'))
+    benefit = _Case(
+        When(sale_info__status=SaleInfo.STATUS_SOLD, then=_combine(_combine(sale, '-', commission), '-', final_cost)),
+        default=_ZERO,
+        output_field=MONEY,
+    )
+    return {
+        'purchase_in_base': purchase,
+        'masaref_to_dubai': masaref_to_dubai,
+        'total_to_dubai': total_to_dubai,
+        'expenses_to_herat': expenses_to_herat,
+        'all_expenses_to_herat': all_expenses_to_herat,
+        'herat_to_kabul_in_base': herat_to_kabul,
+        'total_cost_in_kabul': total_cost_in_kabul,
+        'repair_in_base': repair,
+        'palate_in_base': palate,
+        'final_cost': final_cost,
+        'sale_in_base': sale,
+        'benefit': benefit,
+    }
+
+
+def with_purchase_day(queryset):
+    """Annotate the local date of ``buy_date`` that purchase rates are looked up by."""
+    # Same conversion the DateField lookup in ``get_rate_at_date`` applies
+    # to the aware ``buy_date`` datetime.
+    return queryset.annotate(
+        purchase_day=TruncDate('purchase_info__buy_date', tzinfo=timezone.get_default_timezone()),
+    )
+
+
+def annotate_cost_chain(queryset):
+    """
+    Annotate a ``CarInfo`` queryset with every stage subtotal in base currency.
+
+    The annotations mirror the model properties:
+
+    * ``purchase_in_base``          - ``PurchaseInfo.purchase_price``
+    * ``masaref_to_dubai``          - ``ShippingInfo.mizan_masaref_up_to_dubai``
+    * ``total_to_dubai``            - ``ShippingInfo.computed_total_price_to_dubai``
+    * ``expenses_to_herat``         - ``WorldExpenses.amount_of_expeses_to_herat``
+    * ``all_expenses_to_herat``     - ``WorldExpenses.all_expeses_to_herat``
+    * ``herat_to_kabul_in_base``    - ``KabulExpenses.herat_to_kabul_cost``
+    * ``total_cost_in_kabul``       - ``KabulExpenses.total_cost_in_kabul``
+    * ``repair_in_base`` / ``palate_in_base``
+    * ``final_cost``                - ``RepairAndOtherExpenses.final_cost``
+    * ``sale_in_base``              - ``SaleInfo.sale_price``
+    * ``benefit``                   - ``SaleInfo.benefit``
+
+    On PostgreSQL and MySQL the chain is computed in exact numerics.  SQLite
+    has none and computes it in doubles, rounded to six decimals here: exact
+    to the cent for subtotals below 10^11 in base currency, not to the last
+    decimal.  ``CarCostLedger`` stores the exact ``Decimal`` subtotals on
+    every backend.
+    """
+    return with_purchase_day(queryset).annotate(**{
+        name: Cast(expression, MONEY) for name, expression in cost_chain_expressions().items()
+    })
+
+
+def fleet_totals(queryset=None):
+    """
+    Dashboard financial totals for ``queryset`` (all cars by default).
+
+    Returns ``total_sales``, ``total_benefit``, ``total_investment`` and
+    ``total_expenses`` as ``Decimal`` in base currency.
+    """
+    if queryset is None:
+        queryset = CarInfo.objects.all()
+    sold = Q(sale_info__status=SaleInfo.STATUS_SOLD)
+
+    totals = annotate_cost_chain(queryset).aggregate(
+        total_sales=Sum('sale_in_base', filter=sold),
+        total_benefit=Sum('benefit', filter=sold),
+        total_investment=Sum('purchase_in_base'),
+        total_expenses=Sum(
+            F('masaref_to_dubai') + F('expenses_to_herat') + F('herat_to_kabul_in_base')
+            + F('repair_in_base') + F('palate_in_base'),
+        ),
+    )
+    return {key: value if value is not None else Decimal('0') for key, value in totals.items()}
+
+
+# Label of the cars that have no sale info yet
+NO_SALE_INFO = "بدون اطلاعات فروش"
+
+
+def fleet_status(queryset=None):
+    """
+    Cars of ``queryset`` (all cars by default) per sale status, counted by a
+    single grouped query.
+
+    Returns ``cars``, the number of cars, and ``statuses``: one row per
+    ``SaleInfo.STATUS_CHOICES`` entry then one for cars without sale info
+    (status ``None``), each with ``status``, ``label``, ``cars``,
+    ``percentage`` of all cars and, from the cost ledger, the ``sale_total``,
+    ``final_cost`` and ``benefit`` in base currency.  Statuses without cars
+    are listed with zeros.
+    """
+    if queryset is None:
+        queryset = CarInfo.objects.all()
+    grouped = queryset.order_by().values('sale_info__status').annotate(
+        cars=Count('pk'),
+        sale_total=Sum('cost_ledger__sale_in_base'),
+        final_cost=Sum('cost_ledger__final_cost'),
+        benefit=Sum('cost_ledger__benefit'),
+    )
+    found = {row.pop('sale_info__status'): row for row in grouped}
+
+    labels = [*SaleInfo.STATUS_CHOICES, (None, NO_SALE_INFO)]
+    # Kept if the data has a status the choices no longer list
+    labels += [(status, status) for status in found if status not in dict(labels)]
+    total = sum(row['cars'] for row in found.values())
+    statuses = []
+    for status, label in labels:
+        row = found.get(status, {})
+        cars = row.get('cars', 0)
+        statuses.append({
+            'status': status,
+            'label': label,
+            'cars': cars,
+            'percentage': round(cars / total * 100, 1) if total else 0,
+            **{
+                name: row.get(name) if row.get(name) is not None else Decimal('0')
+                for name in ('sale_total', 'final_cost', 'benefit')
+            },
+        })
+    return {'cars': total, 'statuses': statuses}
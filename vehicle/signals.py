@@ -0,0 +1,136 @@
+"""
+Keep ``CarCostLedger``, ``CarLeg`` and ``FleetRollup`` in step with the cost
+chain, and car photo variants in step with the uploads.
+
+Any save or delete of a stage model refreshes the ledger row and the legs
+(``pipeline``) of its car and queues a refresh of the rollup periods its
+dates fall in, see ``analytics``; any change to a currency's rate history queues a background
+recompute of the amounts converted at the changed rate, see
+``rate_changes``.  Photo variants are built in the background too.  Changes
+to anything the dashboard shows start a new ``data_version``.
+"""
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import analytics, data_version, pipeline, tasks, thumbnails
+from .models import (
+    CarCostLedger, CarImages, CarInfo, CarMark, CarType, Currency, ExchangeRateHistory,
+    KabulExpenses, ModelYear, PurchaseInfo, RepairAndOtherExpenses, SaleInfo, ShippingInfo,
+    WorldExpenses,
+)
+
+
+STAGE_MODELS = (
+    PurchaseInfo, ShippingInfo, WorldExpenses,
+    KabulExpenses, RepairAndOtherExpenses, SaleInfo,
+)
+
+
+def _refresh(instance):
+    ledger = CarCostLedger.refresh(instance.car_id)
+    # Keep an already loaded car from serving the previous ledger row
+    car = instance._state.fields_cache.get('car')
+    if car is not None and ledger is not None:
+        car.cost_ledger = ledger
+    pipeline.refresh([instance.car_id])
+
+
+def _queue_rollups(periods):
+    # Not unique: the periods would not fit the task's unique key
+    if periods:
+        tasks.enqueue('vehicle.refresh_rollups', periods=analytics.encode(periods))
+
+
+def stage_saving(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # The periods the dates counted in before this save, refreshed with the new ones
+    instance.previous_periods = analytics.stored_periods(instance)
+
+
+def stage_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _refresh(instance)
+    # The cost of the car changed, and so the benefit of its sale
+    _queue_rollups(analytics.car_periods([instance.car_id]) | getattr(instance, 'previous_periods', set()))
+
+
+def stage_deleted(sender, instance, origin=None, **kwargs):
+    # The car itself is being deleted, its ledger row goes with it
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model is CarInfo:
+        _queue_rollups(analytics.stage_periods(instance))
+        return
+    _refresh(instance)
+    _queue_rollups(analytics.car_periods([instance.car_id]) | analytics.stage_periods(instance))
+
+
+for model in STAGE_MODELS:
+    pre_save.connect(stage_saving, sender=model, dispatch_uid=f'rollup_{model.__name__}_saving')
+    post_save.connect(stage_saved, sender=model, dispatch_uid=f'ledger_{model.__name__}_saved')
+    post_delete.connect(stage_deleted, sender=model, dispatch_uid=f'ledger_{model.__name__}_deleted')
+
+
+@receiver(post_save, sender=CarInfo, dispatch_uid='rollup_car_saved')
+def car_saved(sender, instance, created=False, raw=False, **kwargs):
+    # A new car has no stage yet; a changed one may have a new mark or type
+    if raw or created:
+        return
+    _queue_rollups(analytics.car_periods([instance.pk]))
+
+
+@receiver(post_save, sender=ExchangeRateHistory, dispatch_uid='ledger_rate_saved')
+@receiver(post_delete, sender=ExchangeRateHistory, dispatch_uid='ledger_rate_deleted')
+def rate_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # The default is a datetime until the row is read back
+    day = ExchangeRateHistory._meta.get_field('date').to_python(instance.date)
+    since = through = day
+    previous = getattr(instance, 'previous', None)
+    if previous and previous[0] != instance.currency_id:
+        _queue_recompute(previous[0], previous[1], previous[1])
+    elif previous:
+        since, through = min(day, previous[1]), max(day, previous[1])
+    _queue_recompute(instance.currency_id, since, through)
+
+
+def _queue_recompute(currency_id, since, through):
+    # Can touch every car of the fleet, too slow for the request
+    tasks.enqueue(
+        'vehicle.refresh_currency_ledger', unique=True,
+        currency_id=currency_id, since=since.isoformat(), through=through.isoformat(),
+    )
+
+
+@receiver(post_save, sender=CarImages, dispatch_uid='car_image_saved')
+def car_image_saved(sender, instance, raw=False, **kwargs):
+    if raw or not instance.image:
+        return
+    # The car_image tag shows the original until the variants exist
+    tasks.enqueue('vehicle.build_image_variants', unique=True, image_id=instance.pk)
+
+
+@receiver(post_delete, sender=CarImages, dispatch_uid='car_image_deleted')
+def car_image_deleted(sender, instance, **kwargs):
+    # The original is kept, its variants are only a cache of it
+    if instance.image:
+        thumbnails.delete_variants(instance.image)
+
+
+# What the panels cached on ``data_version`` are built from
+VERSIONED_MODELS = (
+    CarInfo, *STAGE_MODELS, Currency, ExchangeRateHistory,
+    CarMark, CarType, ModelYear, CarImages,
+)
+
+
+def data_changed(sender, **kwargs):
+    data_version.bump()
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(data_changed, sender=model, dispatch_uid=f'data_version_{model.__name__}_saved')
+    post_delete.connect(data_changed, sender=model, dispatch_uid=f'data_version_{model.__name__}_deleted')
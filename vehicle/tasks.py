@@ -0,0 +1,255 @@
+"""
+Background tasks: slow work queued as ``Task`` rows and run by
+``manage.py run_tasks`` worker processes, with the database as the only
+broker.
+
+    @register('vehicle.build_image_variants', label="...")
+    def build_image_variants(image_id):
+        ...
+
+    enqueue('vehicle.build_image_variants', image_id=image.pk)
+
+A task is written in the caller's transaction, so no worker picks it up
+before the change that queued it is committed.  Arguments and results must
+be JSON.  A task that raises is queued again after a growing delay until
+it has run ``max_attempts`` times, then it is failed and can be retried by
+hand from the status page.  With ``settings.TASKS_EAGER`` a task runs as it
+is enqueued, and is failed the first time it raises.
+"""
+import json
+import os
+import socket
+import tempfile
+import time
+import traceback
+import uuid
+from dataclasses import dataclass
+from datetime import date, timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import analytics, exports, pagination, rate_changes, thumbnails
+from .models import CarImages, Task
+
+
+@dataclass
+class TaskType:
+    func: object
+    label: str
+    max_attempts: int
+    retry_delay: int  # seconds before the first retry, doubled on each one
+
+
+REGISTRY = {}
+
+
+def register(name, label='', max_attempts=3, retry_delay=30):
+    """Decorator adding a function to the tasks workers can run as ``name``."""
+    def decorator(func):
+        REGISTRY[name] = TaskType(func, label or name, max_attempts, retry_delay)
+        return func
+    return decorator
+
+
+def enqueue(name, unique=False, delay=0, **kwargs):
+    """
+    Queue ``name`` to run with ``kwargs`` and return its ``Task``.
+
+    With ``unique`` a task with the same name and arguments still waiting in
+    the queue is returned instead of queueing another one.
+    """
+    if name not in REGISTRY:
+        raise ValueError(f"Unknown task '{name}'")
+    unique_key = ''
+    if unique:
+        unique_key = f'{name}:{json.dumps(kwargs, sort_keys=True)}'[:255]
+        waiting = Task.objects.filter(unique_key=unique_key, status=Task.STATUS_QUEUED).first()
+        if waiting is not None:
+            return waiting
+    task = Task.objects.create(
+        name=name, kwargs=kwargs, unique_key=unique_key,
+        max_attempts=REGISTRY[name].max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+    if settings.TASKS_EAGER:
+        task.status = Task.STATUS_RUNNING
+        task.attempts = 1
+        task.started_at = timezone.now()
+        # No worker would pick a retry up
+        run(task, retry=False)
+    return task
+
+
+def retry(task):
+    """Queue a failed task again with all its attempts."""
+    updated = Task.objects.filter(pk=task.pk, status=Task.STATUS_FAILED).update(
+        status=Task.STATUS_QUEUED, attempts=0, run_after=timezone.now(), error='',
+    )
+    return bool(updated)
+
+
+def claim(worker):
+    """Mark the next due task as running for ``worker`` and return it, or ``None``."""
+    due = Task.objects.filter(status=Task.STATUS_QUEUED, run_after__lte=timezone.now()).order_by('run_after', 'pk')
+    while True:
+        with transaction.atomic():
+            if connection.features.has_select_for_update_skip_locked:
+                due_ids = due.select_for_update(skip_locked=True)
+            else:
+                # SQLite: the IMMEDIATE transaction already keeps other
+                # workers out until this one commits
+                due_ids = due
+            task_id = due_ids.values_list('pk', flat=True).first()
+            if task_id is None:
+                return None
+            claimed = Task.objects.filter(pk=task_id, status=Task.STATUS_QUEUED).update(
+                status=Task.STATUS_RUNNING, worker=worker,
+                started_at=timezone.now(), attempts=F('attempts') + 1,
+            )
+        if claimed:
+            return Task.objects.get(pk=task_id)
+
+
+def run(task, retry=True):
+    """
+    Run a claimed task and record its result, or its error and the next
+    attempt.  Without ``retry`` a task that raises is failed at once.
+    """
+    task_type = REGISTRY.get(task.name)
+    try:
+        if task_type is None:
+            raise LookupError(f"Unknown task '{task.name}'")
+        result = task_type.func(**task.kwargs)
+    except Exception:
+        task.error = traceback.format_exc()
+        if retry and task_type is not None and task.attempts < task.max_attempts:
+            task.status = Task.STATUS_QUEUED
+            delay = task_type.retry_delay * 2 ** (task.attempts - 1)
+            task.run_after = timezone.now() + timedelta(seconds=delay)
+        else:
+            task.status = Task.STATUS_FAILED
+    else:
+        task.status = Task.STATUS_DONE
+        task.result = result
+        task.error = ''
+    task.finished_at = timezone.now()
+    task.save()
+    return task
+
+
+def requeue_stale(older_than):
+    """
+    Queue again tasks left running longer than ``older_than`` by a worker
+    that died, or fail them when that was their last attempt.
+    """
+    stale = Task.objects.filter(status=Task.STATUS_RUNNING, started_at__lt=timezone.now() - older_than)
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Task.STATUS_FAILED, finished_at=timezone.now(), error="The worker running it stopped",
+    )
+    return stale.update(status=Task.STATUS_QUEUED, run_after=timezone.now())
+
+
+def prune(older_than):
+    """Delete finished tasks older than ``older_than``, with the files they wrote."""
+    finished = Task.objects.filter(
+        status__in=(Task.STATUS_DONE, Task.STATUS_FAILED), finished_at__lt=timezone.now() - older_than,
+    )
+    storage = export_storage()
+    rows = finished.values_list('pk', 'result').iterator(chunk_size=500)
+    deleted = 0
+    while chunk := list(islice(rows, 500)):
+        for _, result in chunk:
+            if isinstance(result, dict) and result.get('file'):
+                storage.delete(result['file'])
+        deleted += Task.objects.filter(pk__in=[pk for pk, _ in chunk]).delete()[0]
+    return deleted
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def work(burst=False, poll=1.0, stale_after=timedelta(minutes=10), keep=timedelta(days=14),
+         analyze_every=timedelta(hours=1), stop=lambda: False):
+    """
+    Run tasks until ``stop()`` is true, or the queue is empty with ``burst``.
+    Returns the number of tasks run.
+    """
+    worker = worker_name()
+    done = 0
+    housekeeping = analyze = 0.0
+    while not stop():
+        if time.monotonic() >= housekeeping:
+            requeue_stale(stale_after)
+            prune(keep)
+            housekeeping = time.monotonic() + 60
+        if time.monotonic() >= analyze:
+            pagination.refresh_statistics()
+            analyze = time.monotonic() + analyze_every.total_seconds()
+        if not connection.in_atomic_block:
+            # Drop a connection the database closed while the worker slept
+            close_old_connections()
+        task = claim(worker)
+        if task is None:
+            if burst:
+                break
+            time.sleep(poll)
+            continue
+        run(task)
+        done += 1
+    return done
+
+
+# ---------------------------------------------------------------- the tasks
+
+def export_storage():
+    return FileSystemStorage(location=settings.EXPORT_ROOT)
+
+
+@register('vehicle.build_image_variants', label="ساخت عکس‌های کوچک", max_attempts=2)
+def build_image_variants(image_id):
+    image = CarImages.objects.filter(pk=image_id).only('pk', 'image').first()
+    if image is None or not image.image:
+        return None
+    thumbnails.build_variants(image.image)
+    return {'image': image.image.name}
+
+
+@register('vehicle.refresh_currency_ledger', label="محاسبه دوباره مبالغ پس از تغییر نرخ")
+def refresh_currency_ledger(currency_id, since=None, through=None):
+    # Without dates every amount in the currency is recomputed
+    return rate_changes.recompute(
+        currency_id,
+        since=date.fromisoformat(since) if since else None,
+        through=date.fromisoformat(through) if through else None,
+    )
+
+
+@register('vehicle.refresh_rollups', label="به‌روزرسانی روند ماهانه و هفته‌وار")
+def refresh_rollups(periods):
+    return {'rows': analytics.refresh(analytics.decode(periods))}
+
+
+@register('vehicle.fleet_export', label="گزارش مفاد موترها")
+def fleet_export(format='csv'):
+    filename = f"fleet-{timezone.localdate():%Y-%m-%d}.{format}"
+    storage = export_storage()
+    name = f'{uuid.uuid4().hex}/{filename}'
+    if format == 'xlsx':
+        output = exports.xlsx_file(exports.fleet_rows())
+    elif format == 'csv':
+        output = tempfile.TemporaryFile()
+        for line in exports.csv_lines(exports.fleet_rows()):
+            output.write(line.encode('utf-8'))
+        output.seek(0)
+    else:
+        raise ValueError(f"Unknown export format '{format}'")
+    with output:
+        name = storage.save(name, File(output))
+    return {'file': name, 'filename': filename}
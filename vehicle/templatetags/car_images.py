@@ -0,0 +1,31 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from vehicle.thumbnails import variant_urls
+
+register = template.Library()
+
+
+@register.simple_tag
+def car_image(image, size='thumb', **attrs):
+    """
+    ``<picture>`` of the ``size`` variant ('thumb' or 'medium') of a
+    ``CarImages`` photo, WebP with a JPEG fallback; extra keyword arguments
+    become attributes of the ``<img>``.  Shows the original while the
+    variants are missing; they are built by the task queued on upload, or by
+    ``manage.py build_image_variants``, never while a page renders.
+
+        {% car_image image 'thumb' class="w-full h-48 object-cover" %}
+    """
+    attrs.setdefault('alt', image.description)
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    urls = variant_urls(image.image, size) if image.image else None
+    if urls is None:
+        return format_html('<img src="{}"{}>', image.image.url if image.image else '', flatatt(attrs))
+    webp_url, jpeg_url = urls
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}"><img src="{}"{}></picture>',
+        webp_url, jpeg_url, flatatt(attrs),
+    )
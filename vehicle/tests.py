@@ -1,3 +1,1273 @@
-from django.test import TestCase
+import json
+import os
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.template.loader import render_to_string
+from django.test import LiveServerTestCase, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.connection import ConnectionDoesNotExist
+
+from .models import *
+from . import analytics, data_version, metrics, pipeline, profiling, rankings, rate_changes, rates, tasks, urls as vehicle_urls
+from .context_processors import dashboard_settings
+from .filters import CarFilterForm
+from .importers import IMPORTERS, read_rows
+from .pagination import estimated_count, keyset_page, refresh_statistics
+from .rollups import NO_SALE_INFO, annotate_cost_chain, fleet_status, fleet_totals
+from .thumbnails import VARIANTS, variant_name, variant_names
+from .views import CarInfoListView
+
+
+CENT = Decimal('0.01')
+
+
+def build_car(index, usd, afn, status=SaleInfo.STATUS_SOLD, stages=7):
+    """Create a car with the first ``stages`` stages of the cost chain."""
+    mark, _ = CarMark.objects.get_or_create(name='Toyota')
+    car = CarInfo.objects.create(
+        mark=mark,
+        car_type=CarType.objects.get_or_create(mark=mark, name='Corolla')[0],
+        model_year=ModelYear.objects.get_or_create(year=str(2018 + index % 5))[0],
+        color=CarColor.objects.get_or_create(name='White')[0],
+        related=Related.objects.get_or_create(name='Kabul')[0],
+        action=CarAction.objects.get_or_create(name='Auction')[0],
+        vin=f'VIN{index:05d}',
+    )
+    currency = afn if index % 2 else usd
+    if stages >= 1:
+        PurchaseInfo.objects.create(
+            car=car,
+            purchase_price=Decimal('5000.50') + index,
+            paid_amount=Decimal('4000'),
+            purchase_price_currency=currency,
+            paid_amount_currency=usd,
+            buy_date=datetime(2024, 1 + index % 6, 10, 22, 30, tzinfo=dt_timezone.utc),
+        )
+    if stages >= 2:
+        ShippingInfo.objects.create(
+            car=car,
+            shipping=Decimal('1200.25'), shipping_currency=currency, shipping_date=date(2024, 2, 1),
+            towing=Decimal('300'), towing_currency=afn,
+            clearing=Decimal('150.10'), clearing_currency=usd, clearing_date=date(2024, 3, 5),
+            cash_paid_comission=Decimal('75.33'), cash_paid_comission_currency=afn,
+            cash_paid_comission_date=date(2023, 12, 31),
+        )
+    if stages >= 3:
+        WorldExpenses.objects.create(
+            car=car,
+            shipiping_price_to_islam_qala=Decimal('800'), shipiping_price_to_islam_qala_currency=usd,
+            gomrok_payment=Decimal('45000'), gomrok_payment_currency=afn, gomrok_payment_date=date(2024, 4, 2),
+            business_company_comission=Decimal('3500'), business_company_comission_currency=afn,
+        )
+    if stages >= 4:
+        KabulExpenses.objects.create(
+            car=car,
+            herat_to_kabul_cost=Decimal('9000'), herat_to_kabul_cost_currency=afn,
+            herat_to_kabul_cost_date=date(2024, 5, 1),
+        )
+    if stages >= 5:
+        RepairAndOtherExpenses.objects.create(
+            car=car,
+            repair_cost=Decimal('250.75'), repair_cost_currency=usd, repair_cost_date=date(2024, 5, 3),
+            palate_cost=Decimal('12000'), palate_cost_currency=afn, palate_cost_date=date(2024, 1, 15),
+        )
+    if stages >= 6:
+        SaleInfo.objects.create(
+            car=car,
+            status=status,
+            buyer=Buyer.objects.get_or_create(name='Ahmad')[0] if status == SaleInfo.STATUS_SOLD else None,
+            sale_price=Decimal('15000') + index * 7,
+            sale_price_currency=currency,
+            sale_date=date(2024, 6, 1),
+        )
+    return car
+
+
+def run_tasks():
+    """Run every queued background task, as a worker would."""
+    call_command('run_tasks', burst=True, stdout=StringIO())
+
+
+def build_fleet(size):
+    usd = get_usd_currency()
+    afn, created = Currency.objects.get_or_create(
+        code='AFN', defaults={'name': 'Afghani', 'symbol': '؋', 'exchange_rate': Decimal('0.014000')},
+    )
+    if created:
+        ExchangeRateHistory.objects.create(currency=afn, rate=Decimal('0.013500'), date=date(2024, 1, 1))
+        ExchangeRateHistory.objects.create(currency=afn, rate=Decimal('0.013800'), date=date(2024, 3, 1))
+        ExchangeRateHistory.objects.create(currency=afn, rate=Decimal('0.014200'), date=date(2024, 5, 1))
+    statuses = [SaleInfo.STATUS_SOLD, SaleInfo.STATUS_READY, SaleInfo.STATUS_IN_TRANSIT]
+    for index in range(size):
+        build_car(index, usd, afn, status=statuses[index % 3], stages=7 - index % 7)
+
+
+def python_totals(cars=None):
+    """The per-car loop the dashboard used before the rollup engine, in ``Decimal``."""
+    total_sales = total_benefit = total_investment = total_expenses = Decimal('0')
+    for car in CarInfo.objects.all() if cars is None else cars:
+        if hasattr(car, 'sale_info') and car.sale_info.status == SaleInfo.STATUS_SOLD:
+            sale_info = car.sale_info
+            total_sales += sale_info._convert_to_base(sale_info.sale_price, 'sale_price', 'sale_date')
+            total_benefit += sale_info.compute_benefit()
+        if hasattr(car, 'purchase_info'):
+            purchase_info = car.purchase_info
+            total_investment += purchase_info._convert_to_base(
+                purchase_info.purchase_price, 'purchase_price', 'buy_date'
+            )
+        if hasattr(car, 'shipping_info'):
+            total_expenses += car.shipping_info.mizan_masaref_up_to_dubai
+        if hasattr(car, 'world_expenses'):
+            total_expenses += car.world_expenses.amount_of_expeses_to_herat
+        if hasattr(car, 'kabul_expenses'):
+            kabul_exp = car.kabul_expenses
+            total_expenses += kabul_exp._convert_to_base(
+                kabul_exp.herat_to_kabul_cost, 'herat_to_kabul_cost', 'herat_to_kabul_cost_date'
+            )
+        if hasattr(car, 'repair_expenses'):
+            repair_exp = car.repair_expenses
+            total_expenses += repair_exp._convert_to_base(repair_exp.repair_cost, 'repair_cost', 'repair_cost_date')
+            total_expenses += repair_exp._convert_to_base(repair_exp.palate_cost, 'palate_cost', 'palate_cost_date')
+    return {
+        'total_sales': total_sales,
+        'total_benefit': total_benefit,
+        'total_investment': total_investment,
+        'total_expenses': total_expenses,
+    }
+
+
+class CostRollupTests(TestCase):
+    def test_fleet_totals_match_python_loop(self):
+        build_fleet(21)
+        expected = python_totals()
+        totals = fleet_totals()
+        for key, value in expected.items():
+            self.assertEqual(totals[key].quantize(CENT), value.quantize(CENT), key)
+
+    def test_fleet_totals_are_exact_to_the_cent_on_a_large_fleet(self):
+        # Amounts in cents of four currencies, converted at six-decimal rates
+        call_command('seed_fleet', cars=3000, currency_mix='USD=40,AFN=30,AED=20,PKR=10', stdout=StringIO())
+        with rates.rate_table():
+            expected = python_totals(CarInfo.objects.select_related(*CarCostLedger.chain_related()))
+        totals = fleet_totals()
+        for key, value in expected.items():
+            self.assertEqual(totals[key].quantize(CENT), value.quantize(CENT), key)
+
+    def test_per_car_annotations_match_properties(self):
+        build_fleet(14)
+        for car in annotate_cost_chain(CarInfo.objects.all()):
+            if hasattr(car, 'repair_expenses'):
+                self.assertEqual(car.final_cost.quantize(CENT), car.repair_expenses.final_cost.quantize(CENT))
+            if hasattr(car, 'sale_info'):
+                self.assertEqual(car.benefit.quantize(CENT), car.sale_info.benefit.quantize(CENT))
+
+    def test_chain_of_amounts_doubles_cannot_hold(self):
+        build_fleet(1)
+        car = build_car(1, get_usd_currency(), Currency.objects.get(code='AFN'), stages=5)
+        shipping, repair = car.shipping_info, car.repair_expenses
+        shipping.shipping, shipping.towing, shipping.clearing = Decimal('0.10'), Decimal('0.20'), Decimal('98765432.17')
+        shipping.save()
+        repair.repair_cost, repair.palate_cost = Decimal('0.30'), Decimal('12345.67')
+        repair.save()
+        amounts = [shipping.shipping, shipping.clearing, repair.repair_cost]
+        # Precondition: added up as doubles these already lose the exact sum
+        self.assertNotEqual(Decimal(sum(float(amount) for amount in amounts)), sum(amounts))
+
+        expected = RepairAndOtherExpenses.objects.get(pk=repair.pk).compute_final_cost()
+        # The ledger read through with_cost_chain() is the Decimal computation
+        self.assertEqual(RepairAndOtherExpenses.objects.with_cost_chain().get(pk=repair.pk).final_cost, expected)
+        # The annotations keep six decimals, exact to the cent (doubles on SQLite)
+        annotated = annotate_cost_chain(CarInfo.objects.filter(pk=car.pk)).get()
+        self.assertEqual(annotated.final_cost.quantize(CENT), expected.quantize(CENT))
+        self.assertLessEqual(abs(annotated.final_cost - expected), Decimal('0.000001'))
+
+    def test_fleet_status_counts_every_status_in_one_query(self):
+        build_fleet(14)
+        with self.assertNumQueries(1):
+            summary = fleet_status()
+        rows = {row['status']: row for row in summary['statuses']}
+        self.assertEqual(list(rows), [status for status, _ in SaleInfo.STATUS_CHOICES] + [None])
+        self.assertEqual(summary['cars'], 14)
+        for status, row in rows.items():
+            cars = CarInfo.objects.filter(**{'sale_info__isnull': True} if status is None else {'sale_info__status': status})
+            self.assertEqual(row['cars'], cars.count(), status)
+            self.assertEqual(row['percentage'], round(cars.count() / 14 * 100, 1))
+        sold = rows[SaleInfo.STATUS_SOLD]
+        totals = fleet_totals()
+        self.assertEqual(sold['sale_total'].quantize(CENT), totals['total_sales'].quantize(CENT))
+        self.assertEqual(sold['benefit'].quantize(CENT), totals['total_benefit'].quantize(CENT))
+
+    def test_rankings_match_python_sort(self):
+        build_fleet(21)
+        sold = sorted(
+            (sale.benefit.quantize(CENT), sale.car_id)
+            for sale in SaleInfo.objects.filter(status=SaleInfo.STATUS_SOLD)
+        )
+        self.assertEqual([(car.benefit.quantize(CENT), car.pk) for car in rankings.worst(3)], sold[:3])
+        self.assertEqual(
+            [car.pk for car in rankings.best(3)],
+            [car_id for _, car_id in sorted(sold, key=lambda row: (-row[0], -row[1]))[:3]],
+        )
+        benefits = [benefit for benefit, _ in sold]
+        self.assertEqual(
+            {point: benefit.quantize(CENT) for point, benefit in rankings.percentiles((10, 50, 100)).items()},
+            {10: benefits[0], 50: benefits[(len(benefits) + 1) // 2 - 1], 100: benefits[-1]},
+        )
+        [row] = rankings.leaderboard('mark')
+        self.assertEqual((row['mark_name'], row['cars']), ('Toyota', len(sold)))
+        self.assertEqual(row['total'].quantize(CENT), fleet_totals()['total_benefit'].quantize(CENT))
+        with self.assertRaises(ValueError):
+            rankings.leaderboard('color')
+        self.assertEqual(fleet_status(CarInfo.objects.none()), {
+            'cars': 0,
+            'statuses': [
+                {'status': status, 'label': label, 'cars': 0, 'percentage': 0,
+                 'sale_total': Decimal('0'), 'final_cost': Decimal('0'), 'benefit': Decimal('0')}
+                for status, label in [*SaleInfo.STATUS_CHOICES, (None, NO_SALE_INFO)]
+            ],
+        })
+
+    @override_settings(DASHBOARD_CACHE_TIMEOUT=0)
+    def test_dashboard_query_count_is_independent_of_fleet_size(self):
+        self.client.force_login(User.objects.create_user('staff'))
+        build_fleet(9)
+        # The first request creates the dashboard settings row.
+        self.client.get(reverse('dashboard'))
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+        build_fleet(30)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+        self.assertEqual(len(small), len(large))
+
+
+class RateResolverTests(TestCase):
+    def setUp(self):
+        build_fleet(0)
+        self.afn = Currency.objects.get(code='AFN')
+
+    def test_table_matches_database_lookup(self):
+        days = [
+            None, date(2023, 6, 1), date(2024, 1, 1), date(2024, 2, 29), date(2024, 3, 1), date(2030, 1, 1),
+            datetime(2024, 2, 29, 20, 0, tzinfo=dt_timezone.utc),
+        ]
+        expected = [self.afn.get_rate_at_date(day) for day in days]
+        with rates.rate_table(), self.assertNumQueries(1):
+            self.assertEqual([self.afn.get_rate_at_date(day) for day in days], expected)
+
+    def test_new_history_row_invalidates_table(self):
+        with rates.rate_table():
+            self.assertEqual(self.afn.get_rate_at_date(date(2030, 1, 1)), Decimal('0.014200'))
+            self.afn.exchange_rate = Decimal('0.015000')
+            self.afn.save()
+            self.assertEqual(self.afn.get_rate_at_date(date(2030, 1, 1)), Decimal('0.015000'))
+
+    def test_batch_conversion_matches_one_at_a_time(self):
+        usd = get_usd_currency()
+        days = [
+            None, date(2023, 6, 1), date(2024, 3, 1), date(2024, 2, 29), date(2030, 1, 1),
+            datetime(2024, 2, 29, 20, 0, tzinfo=dt_timezone.utc),
+        ]
+        items = [(Decimal('1000.25') + index, self.afn.pk, day) for index, day in enumerate(days)]
+        items += [(None, self.afn.pk, None), (Decimal('5'), usd.pk, date(2024, 1, 1)), (Decimal('7'), None, None)]
+        expected = [
+            amount * self.afn.get_rate_at_date(day) for amount, _, day in items[:len(days)]
+        ] + [Decimal('0'), Decimal('5'), Decimal('7')]
+
+        # The currencies, then every history at once
+        with self.assertNumQueries(2):
+            self.assertEqual(rates.convert_many(items), expected)
+        with rates.rate_table():
+            rates.convert_many(items)
+            # Loaded currencies and the rate table need nothing more
+            with self.assertNumQueries(0):
+                self.assertEqual(rates.convert_many([(Decimal('1'), self.afn, date(2024, 3, 1))]), [Decimal('0.013800')])
+
+
+class CostLedgerTests(TestCase):
+    def assertLedgerIsCurrent(self):
+        for car in CarInfo.objects.select_related('cost_ledger'):
+            live = CarCostLedger.compute(car)
+            for name, value in live.items():
+                self.assertEqual(getattr(car.cost_ledger, name).quantize(CENT), value.quantize(CENT), name)
+
+    def test_ledger_follows_stage_and_rate_changes(self):
+        build_fleet(7)
+        self.assertLedgerIsCurrent()
+
+        repair = RepairAndOtherExpenses.objects.first()
+        repair.palate_cost = Decimal('20000')
+        repair.save()
+        afn = Currency.objects.get(code='AFN')
+        ExchangeRateHistory.objects.create(currency=afn, rate=Decimal('0.020000'), date=date(2024, 4, 15))
+        KabulExpenses.objects.first().delete()
+        # Rate changes are applied by a background task
+        run_tasks()
+        self.assertLedgerIsCurrent()
+
+        CarInfo.objects.first().delete()
+        self.assertEqual(CarCostLedger.objects.count(), 6)
+
+    def test_batch_compute_matches_stage_properties(self):
+        build_fleet(7)
+        cars = list(CarInfo.objects.select_related(*CarCostLedger.chain_related()).order_by('pk'))
+        with self.assertNumQueries(1):
+            computed = CarCostLedger.compute_many(cars)
+        for car, values in zip(cars, computed):
+            shipping = getattr(car, 'shipping_info', None)
+            repair = getattr(car, 'repair_expenses', None)
+            sale = getattr(car, 'sale_info', None)
+            if shipping:
+                self.assertEqual(values['masaref_to_dubai'], shipping.mizan_masaref_up_to_dubai)
+                self.assertEqual(values['total_to_dubai'], shipping.compute_total_price_to_dubai())
+            if repair:
+                self.assertEqual(values['final_cost'], repair.compute_final_cost())
+            if sale:
+                self.assertEqual(values['benefit'], sale.compute_benefit())
+
+    def test_properties_read_the_ledger(self):
+        build_fleet(1)
+        sale_info = SaleInfo.objects.get()
+        CarCostLedger.objects.filter(car=sale_info.car_id).update(benefit=Decimal('1.50'))
+        sale_info = SaleInfo.objects.select_related('car__cost_ledger').get()
+        with self.assertNumQueries(0):
+            self.assertEqual(sale_info.benefit, Decimal('1.50'))
+
+    def test_rebuild_command_reports_and_repairs_drift(self):
+        build_fleet(3)
+        CarCostLedger.objects.filter(car__vin='VIN00000').update(final_cost=0)
+        CarCostLedger.objects.filter(car__vin='VIN00001').delete()
+        out = StringIO()
+        call_command('rebuild_cost_ledger', stdout=out)
+        self.assertIn('1 drifted, 1 missing', out.getvalue())
+        self.assertLedgerIsCurrent()
+        out = StringIO()
+        call_command('rebuild_cost_ledger', '--check', stdout=out)
+        self.assertIn('0 drifted, 0 missing', out.getvalue())
+
+
+
+class SeedFleetTests(TestCase):
+    # What save() derives, and seed_fleet writes itself as it bulk-creates
+    DERIVED = {
+        CarInfo: ['vin', 'lot', 'vin_reversed'],
+        PurchaseInfo: ['remain_purchase'],
+        WorldExpenses: ['remain_shipping_for_islam_qala'],
+        KabulExpenses: ['remaining_price_from_herat_to_kabul'],
+        SaleInfo: ['sale_price'],
+        CarCostLedger: list(CarCostLedger.AMOUNT_FIELDS),
+    }
+
+    def derived(self):
+        return {
+            model: {
+                row[0]: row[1:]
+                for row in model.objects.values_list('pk' if model is CarInfo else 'car_id', *fields)
+            }
+            for model, fields in self.DERIVED.items()
+        }
+
+    def test_seeded_fields_match_what_save_derives(self):
+        call_command('seed_fleet', cars=40, stdout=StringIO())
+        seeded = self.derived()
+        self.assertTrue(seeded[SaleInfo])
+        for model in (CarInfo, PurchaseInfo, ShippingInfo, WorldExpenses, KabulExpenses, RepairAndOtherExpenses, SaleInfo):
+            for instance in model.objects.order_by('pk'):
+                instance.save()
+        for model, rows in self.derived().items():
+            self.assertEqual(rows, seeded[model], model.__name__)
+
+
+@override_settings(TASKS_EAGER=False)
+class RateChangeTests(TestCase):
+    STORED = (
+        (PurchaseInfo, 'remain_purchase'),
+        (WorldExpenses, 'remain_shipping_for_islam_qala'),
+        (KabulExpenses, 'remaining_price_from_herat_to_kabul'),
+        (SaleInfo, 'sale_price'),
+    )
+
+    def setUp(self):
+        build_fleet(14)
+        self.afn = Currency.objects.get(code='AFN')
+        for kabul in KabulExpenses.objects.all():
+            kabul.has_remaining_price_from_herat_to_kabul = True
+            kabul.remaining_price_from_herat_to_kabul_date = date(2024, 5, 2)
+            kabul.save()
+        world = WorldExpenses.objects.first()
+        world.paid_value_for_shipping, world.paid_value_for_shipping_currency = Decimal('30000'), self.afn
+        world.paid_value_for_shipping_date = date(2024, 4, 20)
+        world.save()
+
+    def stored(self):
+        return {model: dict(model.objects.values_list('pk', name)) for model, name in self.STORED}
+
+    def saved_one_by_one(self):
+        """The stored amounts as saving every row again computes them."""
+        for model, _ in self.STORED:
+            for row in model.objects.order_by('pk'):
+                row.save()
+        return self.stored()
+
+    def test_bulk_recompute_matches_saving_each_row(self):
+        before = self.stored()
+        # An older rate corrected, then the current one changed
+        ExchangeRateHistory.objects.create(currency=self.afn, rate=Decimal('0.020000'), date=date(2024, 4, 1))
+        run_tasks()
+        self.assertEqual(self.stored(), self.saved_one_by_one())
+        self.afn.exchange_rate = Decimal('0.030000')
+        self.afn.save()
+        run_tasks()
+        after = self.stored()
+        self.assertEqual(after, self.saved_one_by_one())
+        for model, _ in self.STORED:
+            self.assertNotEqual(before[model], after[model], model.__name__)
+        for car in CarInfo.objects.select_related('cost_ledger'):
+            self.assertEqual(car.cost_ledger.sale_in_base.quantize(CENT), CarCostLedger.compute(car)['sale_in_base'].quantize(CENT))
+
+    def test_only_amounts_dated_in_the_window_are_rewritten(self):
+        PurchaseInfo.objects.update(remain_purchase=-1)
+        ExchangeRateHistory.objects.create(currency=self.afn, rate=Decimal('0.020000'), date=date(2024, 4, 1))
+        # Bought in April in afghani, before the rate of 1 May takes over
+        in_window = set(
+            PurchaseInfo.objects.filter(purchase_price_currency=self.afn, buy_date__month=4).values_list('pk', flat=True)
+        )
+        self.assertTrue(in_window)
+        with CaptureQueriesContext(connection) as queries:
+            counts = rate_changes.recompute(self.afn.pk, since=date(2024, 4, 1))
+        self.assertEqual(counts['purchases'], len(in_window))
+        self.assertEqual(set(PurchaseInfo.objects.exclude(remain_purchase=-1).values_list('pk', flat=True)), in_window)
+        # One UPDATE for the whole batch
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "vehicle_purchaseinfo"')]
+        self.assertEqual(len(updates), 1)
+
+
+class CostChainListQueryTests(TestCase):
+    LIST_URLS = (
+        'shippinginfo-list', 'world_expenses_list', 'kabul_expenses_list',
+        'repair_expenses_list', 'sale_info_list',
+    )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_list_pages_run_a_fixed_number_of_queries(self):
+        self.client.force_login(User.objects.create_superuser('admin'))
+        urls = [reverse(name) for name in self.LIST_URLS] + [
+            reverse(f'admin:vehicle_{model._meta.model_name}_changelist')
+            for model in (ShippingInfo, WorldExpenses, KabulExpenses, RepairAndOtherExpenses, SaleInfo)
+        ]
+        # Sixteen cars cover every currency and status the pages convert
+        build_fleet(16)
+        for url in urls:
+            self.client.get(url)
+        small = {url: self.count_queries(url) for url in urls}
+        build_fleet(30)
+        # Now paginated, the lists count their totals once
+        for url in urls:
+            self.client.get(url)
+        large = {url: self.count_queries(url) for url in urls}
+        self.assertEqual(small, large)
+
+
+PERF_BUDGETS = Path(__file__).with_name('perf_budgets.json')
+
+
+# Budget the dashboard as computed, not as served from its cache
+@override_settings(DASHBOARD_CACHE_TIMEOUT=0)
+class RouteBudgetTests(TestCase):
+    """
+    Query and time budget for every named route in ``vehicle/urls.py``.
+
+    Each route is measured on fleets of every size in ``VEHICLE_PERF_SIZES``
+    (default ``100,1000,10000``, generated by ``seed_fleet``; for a quicker
+    run, any sizes above one list page, 60 cars) and must run the same number
+    of queries at each, at most its budget in ``perf_budgets.json``, and,
+    unless listed in ``UNTIMED_ROUTES``, answer within ``VEHICLE_PERF_MAX_MS``
+    milliseconds (default 2000).  The budgets are edited by hand; set
+    ``VEHICLE_PERF_REPORT`` to a path to write the query count, wall time
+    and response size per route and size.
+    """
+    # Login redirects signed-in users and logout only accepts POST; a
+    # profiled request only exists with profiling on
+    SKIPPED_ROUTES = {'login', 'logout', 'profiling_detail'}
+    # Function views with a ``pk`` argument, keyed by their route prefix
+    ROUTE_MODELS = {
+        'related': Related, 'carmark': CarMark, 'cartype': CarType, 'modelyear': ModelYear,
+        'carcolor': CarColor, 'caraction': CarAction, 'carinfo': CarInfo,
+        'task_retry': Task, 'task_download': Task,
+    }
+    # Routes whose time grows with the fleet by design, held to their query
+    # budget only: the stage and photo forms list every car to pick from,
+    # and the export writes a row per car
+    UNTIMED_ROUTES = {
+        'purchaseinfo-create', 'purchaseinfo-update', 'shippinginfo-create', 'shippinginfo-update',
+        'world_expenses_create', 'world_expenses_update', 'kabul_expenses_create', 'kabul_expenses_update',
+        'repair_expenses_create', 'repair_expenses_update', 'sale_info_create', 'sale_info_update',
+        'car_images_create', 'car_images_update', 'fleet_export',
+    }
+
+    def routes(self):
+        for pattern in vehicle_urls.urlpatterns:
+            name = pattern.name
+            if not name or name in self.SKIPPED_ROUTES:
+                continue
+            kwargs = {}
+            if 'pk' in pattern.pattern.converters:
+                view_class = getattr(pattern.callback, 'view_class', None)
+                model = getattr(view_class, 'model', None) or self.ROUTE_MODELS[name.split('-')[0]]
+                kwargs['pk'] = model.objects.order_by('pk').values_list('pk', flat=True).first()
+            yield name, reverse(name, kwargs=kwargs)
+
+    def measure(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = self.client.get(url)
+            # A streamed body runs its queries while it is read
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            elapsed = time.perf_counter() - started
+        self.assertLess(response.status_code, 500, url)
+        return {
+            'queries': len(queries),
+            'ms': round(elapsed * 1000, 1),
+            'bytes': len(body),
+        }
+
+    def test_routes_stay_within_budget(self):
+        sizes = [int(size) for size in os.environ.get('VEHICLE_PERF_SIZES', '100,1000,10000').split(',')]
+        max_ms = float(os.environ.get('VEHICLE_PERF_MAX_MS', 2000))
+        budgets = json.loads(PERF_BUDGETS.read_text())
+        self.client.force_login(User.objects.create_superuser('admin'))
+        CarImages.objects.create(car=build_car(0, get_usd_currency(), get_usd_currency()), image='car_images/x.jpg')
+        # Queued by the image save, and failed
+        run_tasks()
+
+        report = {}
+        for size in sizes:
+            call_command('seed_fleet', cars=size - CarInfo.objects.count(), stdout=StringIO())
+            # List totals are cached, count them at every size
+            cache.clear()
+            # Warm up one-off work such as creating the settings row
+            self.client.get(reverse('dashboard'))
+            report[size] = {name: self.measure(url) for name, url in self.routes()}
+
+        if os.environ.get('VEHICLE_PERF_REPORT'):
+            Path(os.environ['VEHICLE_PERF_REPORT']).write_text(json.dumps(report, indent=2))
+
+        for name in report[sizes[0]]:
+            counts = {size: report[size][name]['queries'] for size in sizes}
+            with self.subTest(route=name):
+                self.assertIn(name, budgets, f"no budget in {PERF_BUDGETS.name}, measured {counts}")
+                self.assertEqual(len(set(counts.values())), 1, f"queries grow with the fleet: {counts}")
+                self.assertLessEqual(max(counts.values()), budgets[name], f"measured {counts}")
+                if name not in self.UNTIMED_ROUTES:
+                    for size in sizes:
+                        self.assertLessEqual(report[size][name]['ms'], max_ms, f"{size} cars")
+
+
+class DashboardSettingCacheTests(TestCase):
+    def setUp(self):
+        cache.delete(DashboardSetting.CACHE_KEY)
+
+    def test_warm_load_runs_no_queries(self):
+        DashboardSetting.load()
+        with self.assertNumQueries(0):
+            settings = dashboard_settings(None)['dashboard_settings']
+            self.assertEqual(settings.base_currency.code, 'USD')
+
+    def test_saves_invalidate_the_cache(self):
+        setting = DashboardSetting.load()
+        setting.site_name = 'Sabawoon'
+        setting.save()
+        self.assertEqual(DashboardSetting.load().site_name, 'Sabawoon')
+
+        usd = setting.base_currency
+        usd.symbol = 'US$'
+        usd.save()
+        self.assertEqual(DashboardSetting.load().base_currency.symbol, 'US$')
+
+        DashboardSetting.load()
+        Currency.objects.create(code='EUR', name='Euro', symbol='€', exchange_rate=Decimal('1.08')).delete()
+        self.assertIsNone(cache.get(DashboardSetting.CACHE_KEY))
+
+    @override_settings(DASHBOARD_CACHE_TIMEOUT=60)
+    def test_cache_expires_for_other_processes(self):
+        # Another process, with a cache of its own, keeps its copy until then
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            DashboardSetting.load()
+        cache_set.assert_called_once_with(DashboardSetting.CACHE_KEY, mock.ANY, 60)
+
+
+class FleetRollupTests(TestCase):
+    def setUp(self):
+        build_fleet(14)
+        for index, shipping in enumerate(ShippingInfo.objects.order_by('pk')):
+            ShippingInfo.objects.filter(pk=shipping.pk).update(
+                etd_from_usa=date(2024, 2, 1 + index), date_arrived_in_dubai=date(2024, 3, 10 + index),
+            )
+        analytics.rebuild()
+
+    def test_rollups_add_up_the_stage_tables(self):
+        months = analytics.series('month')
+        self.assertEqual(sum(row['bought'] for row in months), PurchaseInfo.objects.count())
+        self.assertEqual(sum(row['shipped'] for row in months), ShippingInfo.objects.count())
+        self.assertEqual(sum(row['sold'] for row in months), SaleInfo.objects.filter(status=SaleInfo.STATUS_SOLD).count())
+        self.assertEqual(
+            sum(row['benefit'] for row in months).quantize(CENT), fleet_totals()['total_benefit'].quantize(CENT),
+        )
+        weeks = analytics.series('week')
+        for name in analytics.FIELDS:
+            self.assertEqual(sum(row[name] for row in weeks), sum(row[name] for row in months), name)
+        # Months without any event in between are filled in
+        self.assertEqual([row['start'] for row in months], [date(2024, month, 1) for month in range(1, 7)])
+        self.assertEqual(analytics.series('month', mark=CarMark.objects.create(name='Nissan')), [])
+
+    def test_changes_refresh_the_periods_they_touch(self):
+        sale = SaleInfo.objects.filter(status=SaleInfo.STATUS_SOLD).first()
+        sale.sale_date = date(2024, 8, 20)
+        sale.save()
+        purchase = PurchaseInfo.objects.exclude(car=sale.car).first()
+        purchase.purchase_price += 1000
+        purchase.save()
+        CarInfo.objects.exclude(pk__in=[sale.car_id, purchase.car_id]).filter(sale_info__isnull=False).first().delete()
+        car = CarInfo.objects.get(pk=purchase.car_id)
+        car.mark = CarMark.objects.create(name='Nissan')
+        car.save()
+        run_tasks()
+        refreshed = {kind: analytics.series(kind) for kind in analytics.KINDS}
+        analytics.rebuild()
+        self.assertEqual(refreshed, {kind: analytics.series(kind) for kind in analytics.KINDS})
+        self.assertEqual(analytics.series('month', mark=car.mark)[0]['bought'], 1)
+
+    def test_a_group_has_one_row_per_period(self):
+        self.assertEqual(analytics.refresh({(FleetRollup.KIND_MONTH, date(2024, 2, 1))}), FleetRollup.objects.filter(
+            kind=FleetRollup.KIND_MONTH, start=date(2024, 2, 1),
+        ).count())
+        row = FleetRollup.objects.filter(mark__isnull=False).first()
+        FleetRollup.objects.create(kind=row.kind, start=date(2030, 1, 1))
+        for start, mark, car_type in ((row.start, row.mark, row.car_type), (date(2030, 1, 1), None, None)):
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                FleetRollup.objects.create(kind=row.kind, start=start, mark=mark, car_type=car_type)
+
+    def test_trends_page(self):
+        self.client.force_login(User.objects.create_user('analyst'))
+        response = self.client.get(reverse('fleet_trends'), {'kind': 'week'})
+        self.assertEqual(len(response.context['periods']), len(analytics.series('week')))
+        data = self.client.get(reverse('fleet_trends'), {'format': 'json'}).json()
+        self.assertEqual(sum(row['bought'] for row in data['periods']), PurchaseInfo.objects.count())
+
+
+class PipelineTests(TestCase):
+    def setUp(self):
+        build_fleet(14)
+        # Saved one by one, so the signals keep the legs up to date
+        for index, shipping in enumerate(ShippingInfo.objects.order_by('pk')):
+            shipping.etd_from_usa = date(2024, 2, 1)
+            shipping.date_arrived_in_dubai = date(2024, 2, 1) + timedelta(days=20 + index % 5 * 2)
+            shipping.save()
+
+    def test_legs_follow_the_stage_dates(self):
+        legs = list(CarLeg.objects.order_by('car_id', 'leg').values_list('car_id', 'leg', 'started', 'ended', 'days'))
+        pipeline.rebuild()
+        self.assertEqual(legs, list(
+            CarLeg.objects.order_by('car_id', 'leg').values_list('car_id', 'leg', 'started', 'ended', 'days')
+        ))
+        shipping = ShippingInfo.objects.order_by('pk').first()
+        self.assertEqual(
+            CarLeg.objects.get(car=shipping.car, leg=CarLeg.LEG_TO_DUBAI).days,
+            (shipping.date_arrived_in_dubai - shipping.etd_from_usa).days,
+        )
+        # Bought, no ETD yet: still in the USA
+        purchase = PurchaseInfo.objects.filter(car__shipping_info__isnull=True).first()
+        self.assertEqual(list(purchase.car.legs.values_list('leg', 'ended')), [(CarLeg.LEG_USA, None)])
+        shipping.delete()
+        self.assertFalse(CarLeg.objects.filter(car=shipping.car, leg=CarLeg.LEG_TO_DUBAI).exists())
+
+    def test_percentiles_and_work_in_progress(self):
+        days = sorted(CarLeg.objects.filter(leg=CarLeg.LEG_TO_DUBAI).values_list('days', flat=True))
+        with self.assertNumQueries(1):
+            [period] = pipeline.percentiles(CarLeg.LEG_TO_DUBAI)
+        self.assertEqual(period['cars'], len(days))
+        for point in (50, 90, 99):
+            self.assertEqual(period[point], days[-(-point * len(days) // 100) - 1], point)
+        self.assertAlmostEqual(period['average'], sum(days) / len(days))
+        self.assertEqual(pipeline.percentiles(CarLeg.LEG_TO_DUBAI, since=date(2024, 6, 1)), [])
+
+        with self.assertNumQueries(1):
+            legs = {row['leg']: row for row in pipeline.work_in_progress(today=date(2024, 7, 1))}
+        # No later stop is dated, whatever stages the cars have
+        in_dubai = CarInfo.objects.exclude(sale_info__status=SaleInfo.STATUS_SOLD).filter(shipping_info__isnull=False)
+        self.assertEqual(legs[CarLeg.LEG_DUBAI]['cars'], in_dubai.count())
+        self.assertEqual(legs[CarLeg.LEG_DUBAI]['capital'].quantize(CENT), sum(
+            ledger.purchase_in_base + ledger.masaref_to_dubai + ledger.expenses_to_herat
+            + ledger.herat_to_kabul_in_base + ledger.repair_in_base + ledger.palate_in_base
+            for ledger in CarCostLedger.objects.filter(car__in=in_dubai)
+        ).quantize(CENT))
+        self.assertEqual(legs[CarLeg.LEG_TO_DUBAI]['cars'], 0)
+        self.assertEqual(legs[CarLeg.LEG_USA]['oldest_days'], (date(2024, 7, 1) - date(2024, 1, 10)).days)
+        self.client.force_login(User.objects.create_user('planner'))
+        response = self.client.get(reverse('route_pipeline'), {'leg': CarLeg.LEG_TO_DUBAI})
+        self.assertEqual(response.context['periods'][0]['cars'], len(days))
+
+
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('clerk'))
+
+    def test_panels_are_served_from_cache_until_the_data_changes(self):
+        build_fleet(3)
+        self.assertContains(self.client.get(reverse('dashboard')), '<h3 class="text-2xl font-bold">3</h3>')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, '<h3 class="text-2xl font-bold">3</h3>')
+        # Only the session and the user are read
+        self.assertEqual([query['sql'] for query in queries if 'vehicle_' in query['sql']], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            build_car(3, get_usd_currency(), Currency.objects.get(code='AFN'))
+        self.assertContains(self.client.get(reverse('dashboard')), '<h3 class="text-2xl font-bold">4</h3>')
+
+        version = data_version.current()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_cost_ledger', stdout=StringIO())
+        self.assertNotEqual(data_version.current(), version)
+
+
+class LoadTestCommandTests(LiveServerTestCase):
+    def test_reports_throughput_of_a_running_server(self):
+        User.objects.create_superuser('admin', '', 'secret')
+        out = StringIO()
+        call_command(
+            'loadtest', url=self.live_server_url, paths=[reverse('carinfo-list')],
+            concurrency=2, duration=0.5, label='live', stdout=out, stderr=StringIO(),
+        )
+        self.assertIn('live: ', out.getvalue())
+        self.assertIn(' 0 failed', out.getvalue())
+
+
+class DatabaseTuningTests(TestCase):
+    def test_sqlite_connections_are_tuned(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("SQLite only")
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA temp_store')
+            self.assertEqual(cursor.fetchone()[0], 2)  # MEMORY
+        self.assertEqual(connection.settings_dict['OPTIONS']['timeout'], 20)
+
+    def test_wal_is_opt_in(self):
+        # journal_mode=WAL is written into the database file itself
+        if connection.vendor != 'sqlite':
+            self.skipTest("SQLite only")
+        if os.environ.get('DJANGO_SQLITE_WAL'):
+            self.skipTest("DJANGO_SQLITE_WAL is set")
+        self.assertNotIn('journal_mode', connection.settings_dict['OPTIONS']['init_command'])
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_fleet', cars=150, stdout=StringIO())
+        # A table that was empty at the last ANALYZE has no statistics, and
+        # SQLite plans its joins from a default guess of its size
+        CarImages.objects.bulk_create(
+            CarImages(car=car, image=f'car_images/{car.lot}.jpg') for car in CarInfo.objects.all()[:120]
+        )
+        refresh_statistics(CarImages)
+
+    def test_list_views_do_no_full_table_scans(self):
+        out = StringIO()
+        call_command('explain_list_views', stdout=out)
+        self.assertIn('No list view does a full table scan', out.getvalue())
+
+    def test_dashboard_status_counts_use_the_index(self):
+        plan = CarInfo.objects.filter(sale_info__status=SaleInfo.STATUS_SOLD).explain()
+        self.assertIn('vehicle_sal_status', plan)
+
+    def test_best_cars_are_read_off_the_benefit_index(self):
+        plan = rankings.best(3).explain()
+        self.assertIn('vehicle_car_benefit', plan)
+
+
+class FleetExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_fleet(7)
+        cls.user = User.objects.create_user('exporter', password='secret')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_csv_streams_one_row_per_car(self):
+        # A car without a ledger row is computed live
+        CarCostLedger.objects.filter(car=CarInfo.objects.last()).delete()
+        response = self.client.get(reverse('fleet_export'))
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lines), CarInfo.objects.count() + 1)
+
+        benefits = {
+            car.pk: CarCostLedger.compute(car)['benefit'].quantize(CENT)
+            for car in CarInfo.objects.select_related(*CarCostLedger.chain_related())
+        }
+        for line in lines[1:]:
+            values = line.split(',')
+            self.assertEqual(Decimal(values[-1]), benefits[int(values[0])])
+
+    def test_xlsx_and_command_match_the_view(self):
+        from openpyxl import load_workbook
+
+        response = self.client.get(reverse('fleet_export'), {'format': 'xlsx'})
+        sheet = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True).active
+        xlsx_rows = [[str(cell) for cell in row] for row in sheet.iter_rows(values_only=True)]
+
+        out = StringIO()
+        call_command('export_fleet', stdout=out)
+        csv_rows = [line.split(',') for line in out.getvalue().splitlines()]
+        self.assertEqual(len(xlsx_rows), len(csv_rows))
+        self.assertEqual(Decimal(xlsx_rows[1][-1]).quantize(CENT), Decimal(csv_rows[1][-1]))
+
+
+class ImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_fleet(2)
+        cls.user = User.objects.create_user('importer', password='secret')
+
+    def import_file(self, kind, text, file_format='csv', **kwargs):
+        return IMPORTERS[kind](**kwargs).run(read_rows(BytesIO(text.encode('utf-8')), file_format))
+
+    def test_cars_then_purchases_from_csv(self):
+        report = self.import_file('cars', (
+            "vin,mark,car_type,model_year,color,related,action\n"
+            "NEW001,Toyota,Corolla,2018,White,Kabul,Auction\n"
+            "NEW002,toyota,Toyota - Corolla,2019,White,Kabul,Auction\n"
+            "NEW003,Lada,Corolla,2018,White,Kabul,Auction\n"
+        ))
+        self.assertEqual(report.created, 2)
+        self.assertEqual([(line, field) for line, field, _ in report.errors], [(4, 'mark')])
+        lots = set(CarInfo.objects.filter(vin__startswith='NEW').values_list('lot', flat=True))
+        self.assertEqual(len(lots), 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            report = self.import_file('purchases', (
+                "car,purchase_price,purchase_price_currency,paid_amount,paid_amount_currency,buy_date\n"
+                "NEW001,5000,AFN,1000,USD,2024-02-15 10:00\n"
+                "NEW002,6000,USD,6000,USD,2024-02-15 10:00\n"
+                "VIN00000,7000,USD,0,USD,2024-02-15 10:00\n"
+                "NEW001,7000,USD,0,USD,2024-02-15 10:00\n"
+            ))
+        self.assertEqual(report.created, 2)
+        self.assertEqual([line for line, _, _ in report.errors], [4, 5])
+        # Lookups, the batch's cars, the insert, the ledger and the rollups; not per row
+        self.assertLess(len(queries), 35)
+
+        # Derived like a saved purchase, bulk_create skips save()
+        purchase = PurchaseInfo.objects.get(car__vin='NEW001')
+        imported = purchase.remain_purchase
+        purchase.update_remaining()
+        self.assertEqual(imported, purchase.remain_purchase)
+        car = CarInfo.objects.select_related(*CarCostLedger.chain_related()).get(vin='NEW001')
+        self.assertEqual(CarCostLedger.objects.get(car=car).total_to_dubai, CarCostLedger.compute(car)['total_to_dubai'])
+
+    def test_dry_run_writes_nothing(self):
+        report = self.import_file(
+            'cars', '{"vin": "NEW001", "mark": "Toyota"}\nnot json\n', file_format='jsonl', dry_run=True,
+        )
+        self.assertEqual(report.created, 1)
+        self.assertEqual(report.errors[0][0], 2)
+        self.assertFalse(CarInfo.objects.filter(vin='NEW001').exists())
+
+    def test_upload_view_and_command(self):
+        car = build_car(9, get_usd_currency(), Currency.objects.get(code='AFN'), stages=1)
+        line = {
+            'car': car.lot, 'shipping': 1200, 'shipping_currency': 'AFN',
+            'total_price_to_dubai_currency': 'USD', 'date_arrived_in_dubai': '2024-10-01',
+        }
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('shipping.jsonl', json.dumps(line).encode('utf-8'))
+        response = self.client.post(reverse('fleet_import'), {'kind': 'shipping', 'file': upload})
+        self.assertEqual(response.context['report'].created, 1)
+        self.assertEqual(ShippingInfo.objects.get(car=car).date_arrived_in_dubai, date(2024, 10, 1))
+        self.assertGreater(CarCostLedger.objects.get(car=car).total_to_dubai, 0)
+
+        out = StringIO()
+        path = Path(self.id() + '.jsonl')
+        path.write_text(json.dumps(line) + '\n', encoding='utf-8')
+        self.addCleanup(path.unlink)
+        call_command('import_fleet', 'shipping', str(path), stdout=out)
+        self.assertIn(f"{car.lot} already has", out.getvalue())
+
+
+class CarSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_fleet(9)
+        cls.user = User.objects.create_user('searcher', password='secret')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def listed(self, url_name, **params):
+        response = self.client.get(reverse(url_name), params)
+        self.assertEqual(response.status_code, 200)
+        return response, [obj.pk for obj in response.context['page_obj']]
+
+    def test_vin_and_lot_search_use_index_ranges(self):
+        lot = CarInfo.objects.get(vin='VIN00004').lot
+        cases = {'vin0000': 9, 'VIN00003': 1, '00005': 1, '5': 1, lot[:-2]: 1, 'XYZ': 0}
+        for term, count in cases.items():
+            _, pks = self.listed('carinfo-list', q=term)
+            self.assertEqual(len(pks), count, term)
+
+        _, pks = self.listed('repair_expenses_list', q='00007')
+        self.assertEqual(list(RepairAndOtherExpenses.objects.filter(pk__in=pks).values_list('car__vin', flat=True)), ['VIN00007'])
+
+        form = CarFilterForm({'q': '0003'})
+        plan = form.filter(CarInfo.objects.all()).explain()
+        self.assertIn('vehicle_car_vin_rev', plan)
+        self.assertNotIn('SCAN vehicle_carinfo', plan)
+
+    def test_search_ignores_case(self):
+        car = CarInfo.objects.create(vin='jh4ka7561pc0088', lot='lot-mixed01')
+        self.assertEqual((car.vin, car.lot, car.vin_reversed), ('JH4KA7561PC0088', 'LOT-MIXED01', '8800CP1657AK4HJ'))
+        for term in ('jh4ka', 'JH4KA', 'pc0088', 'lot-mixed'):
+            _, pks = self.listed('carinfo-list', q=term)
+            self.assertEqual(pks, [car.pk], term)
+
+    def test_filters_compose(self):
+        sold = SaleInfo.objects.filter(status=SaleInfo.STATUS_SOLD).values_list('car_id', flat=True)
+        _, pks = self.listed('carinfo-list', status=SaleInfo.STATUS_SOLD, model_year=ModelYear.objects.get(year='2018').pk)
+        self.assertEqual(set(pks), set(CarInfo.objects.filter(pk__in=sold, model_year__year='2018').values_list('pk', flat=True)))
+
+        _, pks = self.listed('carinfo-list', bought_from='2024-03-01', bought_to='2024-03-31')
+        self.assertEqual(set(pks), set(PurchaseInfo.objects.filter(buy_date__month=3).values_list('car_id', flat=True)))
+
+        _, pks = self.listed('carinfo-list', status='none')
+        self.assertEqual(set(pks), set(CarInfo.objects.filter(sale_info__isnull=True).values_list('pk', flat=True)))
+
+    def test_keyset_pages_walk_forward_and_back(self):
+        expected = list(CarInfo.objects.order_by('-vin', '-pk').values_list('pk', flat=True))
+        pages, params = [], {'sort': '-vin'}
+        with mock.patch.object(CarInfoListView, 'paginate_by', 4):
+            while True:
+                response, pks = self.listed('carinfo-list', **params)
+                pages.append(pks)
+                page = response.context['page_obj']
+                if not page.has_next:
+                    break
+                params = {'sort': '-vin', 'after': page.next_cursor}
+            self.assertEqual(sum(pages, []), expected)
+
+            _, pks = self.listed('carinfo-list', sort='-vin', before=page.previous_cursor)
+            self.assertEqual(pks, pages[-2])
+            # A cursor that does not decode is the first page
+            _, pks = self.listed('carinfo-list', sort='-vin', after='garbage')
+            self.assertEqual(pks, pages[0])
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_fleet(9)
+        # Ties and missing arrival dates, which sort last
+        arrivals = [date(2024, 3, 1), None, date(2024, 2, 1), date(2024, 3, 1), None, date(2024, 1, 5)]
+        for shipping, arrived in zip(ShippingInfo.objects.order_by('pk'), arrivals):
+            shipping.date_arrived_in_dubai = arrived
+            shipping.save(update_fields=['date_arrived_in_dubai'])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pages_walk_a_nullable_key_forward_and_back(self):
+        queryset = ShippingInfo.objects.all()
+        dated = queryset.filter(date_arrived_in_dubai__isnull=False).order_by('-date_arrived_in_dubai', '-pk')
+        undated = queryset.filter(date_arrived_in_dubai__isnull=True).order_by('-pk')
+        expected = [shipping.pk for shipping in [*dated, *undated]]
+        pages = [keyset_page(queryset, 'date_arrived_in_dubai', True, 2)]
+        while pages[-1].has_next:
+            pages.append(keyset_page(queryset, 'date_arrived_in_dubai', True, 2, after=pages[-1].next_cursor))
+        self.assertEqual([shipping.pk for page in pages for shipping in page], expected)
+
+        for previous, page in zip(pages, pages[1:]):
+            back = keyset_page(queryset, 'date_arrived_in_dubai', True, 2, before=page.previous_cursor)
+            self.assertEqual([shipping.pk for shipping in back], [shipping.pk for shipping in previous])
+            self.assertEqual(back.has_previous, previous is not pages[0])
+
+    def test_total_is_counted_once_and_cached(self):
+        self.client.force_login(User.objects.create_user('pager'))
+        url = reverse('shippinginfo-list')
+        with CaptureQueriesContext(connection) as first:
+            page = self.client.get(url).context['page_obj']
+            self.assertEqual(page.total, (ShippingInfo.objects.count(), False))
+        with CaptureQueriesContext(connection) as second:
+            self.client.get(url).context['page_obj'].total
+        self.assertLess(len(second), len(first))
+        self.assertFalse(any('COUNT(' in query['sql'] for query in second.captured_queries))
+
+    def test_unfiltered_total_is_estimated_from_statistics(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimated_count(SaleInfo.objects.all()), SaleInfo.objects.count())
+        self.assertIsNone(estimated_count(SaleInfo.objects.filter(status=SaleInfo.STATUS_SOLD)))
+        # Read from the queryset's own database
+        with self.assertRaises(ConnectionDoesNotExist):
+            estimated_count(SaleInfo.objects.using('replica'))
+
+    def test_workers_refresh_the_statistics(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+            if cursor.fetchone() is not None:
+                cursor.execute('DELETE FROM sqlite_stat1')
+        self.assertIsNone(estimated_count(ShippingInfo.objects.all()))
+        tasks.work(burst=True)
+        self.assertEqual(estimated_count(ShippingInfo.objects.all()), ShippingInfo.objects.count())
+
+
+class CarImageVariantTests(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.car = build_car(0, get_usd_currency(), get_usd_currency(), stages=0)
+
+    def photo(self, size=(3000, 2000)):
+        """A JPEG as a phone writes it: turned on its side by EXIF, with a location."""
+        from PIL import Image
+
+        image = Image.effect_noise(size, 64).convert('RGB')
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise
+        exif[0x8825] = {2: (34.0, 31.0, 0.0)}  # GPS latitude
+        output = BytesIO()
+        image.save(output, 'JPEG', quality=95, exif=exif)
+        return SimpleUploadedFile('phone.jpg', output.getvalue(), content_type='image/jpeg')
+
+    def test_upload_builds_upright_variants_without_exif(self):
+        from PIL import Image
+
+        image = CarImages.objects.create(car=self.car, image=self.photo())
+        run_tasks()
+        storage = image.image.storage
+        for (size, extension), name in variant_names(image.image.name).items():
+            with storage.open(name) as variant, Image.open(variant) as picture:
+                self.assertEqual(picture.format, 'WEBP' if extension == 'webp' else 'JPEG')
+                # Portrait once the orientation is applied
+                width, height = picture.size
+                self.assertEqual(height, VARIANTS[size])
+                self.assertLess(width, height)
+                self.assertFalse(picture.getexif())
+        self.assertLess(storage.size(variant_names(image.image.name)['thumb', 'jpg']) * 10, image.image.size)
+
+        image.delete()
+        self.assertFalse(any(storage.exists(name) for name in variant_names(image.image.name).values()))
+        self.assertTrue(storage.exists(image.image.name))
+
+    def test_list_serves_variants_and_the_original_while_they_are_missing(self):
+        image = CarImages.objects.create(car=self.car, image=self.photo())
+        broken = CarImages.objects.create(car=self.car, image='car_images/missing.jpg')
+        run_tasks()
+        storage = image.image.storage
+        thumb = variant_name(image.image.name, 'thumb', 'webp')
+        storage.delete(thumb)
+
+        self.client.force_login(User.objects.create_user('viewer'))
+        tasks_before = Task.objects.count()
+        with CaptureQueriesContext(connection) as queries:
+            html = self.client.get(reverse('car_images_list')).content.decode()
+        # The original until the variants are built again, and nothing queued by the page
+        self.assertIn(f'src="{image.image.url}"', html)
+        self.assertEqual(Task.objects.count(), tasks_before)
+        self.assertFalse(any('vehicle_task' in query['sql'] for query in queries.captured_queries))
+
+        err = StringIO()
+        call_command('build_image_variants', stdout=StringIO(), stderr=err)
+        self.assertIn(f"Image {broken.pk}", err.getvalue())
+        html = self.client.get(reverse('car_images_list')).content.decode()
+        self.assertIn(storage.url(thumb), html)
+        self.assertNotIn(f'src="{image.image.url}"', html)
+        # An original that cannot be read is shown as it is
+        self.assertIn(f'src="{broken.image.url}"', html)
+
+
+@override_settings(TASKS_EAGER=False)
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.registry = dict(tasks.REGISTRY)
+        self.addCleanup(lambda: (tasks.REGISTRY.clear(), tasks.REGISTRY.update(self.registry)))
+
+        @tasks.register('test.flaky', max_attempts=2, retry_delay=0)
+        def flaky(fail=False):
+            self.calls.append(fail)
+            if fail:
+                raise ValueError("failed on purpose")
+            return {'calls': len(self.calls)}
+
+    def test_tasks_run_retry_and_fail(self):
+        done = tasks.enqueue('test.flaky')
+        self.assertEqual(tasks.enqueue('test.flaky', unique=True, fail=True), tasks.enqueue('test.flaky', unique=True, fail=True))
+        self.assertEqual(Task.objects.count(), 2)
+        with self.assertRaises(ValueError):
+            tasks.enqueue('test.missing')
+
+        run_tasks()
+        done.refresh_from_db()
+        self.assertEqual((done.status, done.result, done.attempts), (Task.STATUS_DONE, {'calls': 1}, 1))
+        failed = Task.objects.get(unique_key__startswith='test.flaky')
+        # Retried once right away (no delay), then failed for good
+        self.assertEqual((failed.status, failed.attempts), (Task.STATUS_FAILED, 2))
+        self.assertIn("ValueError: failed on purpose", failed.error_summary)
+        self.assertEqual(self.calls, [False, True, True])
+
+        self.assertTrue(tasks.retry(failed))
+        self.assertFalse(tasks.retry(done))
+        self.assertIsNotNone(tasks.claim('test'))
+        self.assertIsNone(tasks.claim('test'))
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager_tasks_fail_instead_of_waiting_for_a_retry(self):
+        done = tasks.enqueue('test.flaky')
+        failed = tasks.enqueue('test.flaky', fail=True)
+        self.assertEqual((done.status, done.result), (Task.STATUS_DONE, {'calls': 1}))
+        failed.refresh_from_db()
+        self.assertEqual((failed.status, failed.attempts), (Task.STATUS_FAILED, 1))
+        self.assertIn("ValueError: failed on purpose", failed.error_summary)
+
+    def test_a_dead_workers_task_is_queued_again(self):
+        task = tasks.enqueue('test.flaky')
+        Task.objects.filter(pk=task.pk).update(
+            status=Task.STATUS_RUNNING, attempts=1, started_at=timezone.now() - timedelta(hours=1),
+        )
+        self.assertEqual(tasks.requeue_stale(timedelta(minutes=10)), 1)
+        run_tasks()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.STATUS_DONE, 2))
+
+    def test_fleet_export_runs_in_the_background(self):
+        import shutil
+        import tempfile
+
+        exports_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, exports_dir)
+        build_fleet(3)
+        self.client.force_login(User.objects.create_user('exporter'))
+
+        with override_settings(EXPORT_ROOT=exports_dir):
+            response = self.client.post(reverse('fleet_export'), {'format': 'csv'})
+            self.assertRedirects(response, reverse('task_list'))
+            task = Task.objects.get(name='vehicle.fleet_export')
+            self.assertEqual(self.client.get(reverse('task_download', args=[task.pk])).status_code, 404)
+
+            run_tasks()
+            page = self.client.get(reverse('task_list'), {'status': Task.STATUS_DONE})
+            self.assertContains(page, reverse('task_download', args=[task.pk]))
+            response = self.client.get(reverse('task_download', args=[task.pk]))
+            body = b''.join(response.streaming_content).decode('utf-8-sig')
+            self.assertEqual(len(body.splitlines()), 4)
+            self.assertTrue(body.startswith('Car,LOT#'))
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        profiling.clear()
+
+    def test_groups_repeated_queries_and_splits_the_time(self):
+        usd = get_usd_currency()
+        request = RequestFactory().get('/somewhere/?page=2')
+        with profiling.profile_request(request) as profile:
+            # An N+1 loop, then the same lookup twice
+            for code in ('AAA', 'BBB', 'CCC'):
+                Currency.objects.filter(code=code).first()
+            Currency.objects.get(pk=usd.pk)
+            Currency.objects.get(pk=usd.pk)
+            render_to_string('keyset_pagination.html', {'page_obj': None})
+        self.assertEqual(profiling.recorded(), [profile])
+        self.assertEqual(profile.path, '/somewhere/?page=2')
+        self.assertEqual(profile.queries, 5)
+        self.assertEqual(profile.repeated_queries, 3)
+        self.assertEqual(profile.duplicates, 1)
+        self.assertEqual([group.count for group in profile.repeated], [3, 2])
+        self.assertGreater(profile.template_ms, 0)
+        self.assertAlmostEqual(profile.sql_ms + profile.template_ms + profile.python_ms, profile.total_ms, places=3)
+
+    @override_settings(PROFILING=True, PROFILING_CPROFILE=True)
+    def test_middleware_records_requests_for_the_staff_page(self):
+        build_fleet(3)
+        user = User.objects.create_user('clerk')
+        self.client.force_login(user)
+        self.client.get(reverse('carinfo-list'))
+        self.assertRedirects(
+            self.client.get(reverse('profiling_list')),
+            f"{reverse('login')}?next={reverse('profiling_list')}", fetch_redirect_response=False,
+        )
+
+        user.is_staff = True
+        user.save()
+        self.client.get(reverse('dashboard'))
+        [dashboard, car_list, *_] = profiling.recorded()
+        self.assertEqual((dashboard.view, dashboard.status), ('dashboard', 200))
+        self.assertEqual(car_list.view, 'carinfo-list')
+        self.assertGreater(dashboard.queries, 0)
+        self.assertIn('cumulative', dashboard.cprofile)
+
+        response = self.client.get(reverse('profiling_list'), {'sort': 'queries'})
+        self.assertContains(response, reverse('profiling_detail', args=[dashboard.id]))
+        response = self.client.get(reverse('profiling_detail', args=[dashboard.id]))
+        self.assertContains(response, 'cProfile')
+        # The profiling pages leave themselves out
+        self.assertNotIn('profiling_list', [profile.view for profile in profiling.recorded()])
+        self.client.post(reverse('profiling_clear'))
+        self.assertEqual(profiling.recorded(), [])
+
+
+@override_settings(COST_METRICS=True)
+class CostMetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_counts_the_chain_below_a_property(self):
+        build_fleet(1)
+        sale = SaleInfo.objects.get()
+        metrics.reset()
+        with CaptureQueriesContext(connection) as queries:
+            sale.compute_benefit()
+        totals = metrics.snapshot()
+        benefit = totals['', 'SaleInfo.compute_benefit']
+        self.assertEqual((benefit['calls'], benefit['queries']), (1, len(queries)))
+        self.assertEqual(totals['', 'WorldExpenses.compute_all_expeses_to_herat']['calls'], 1)
+        self.assertEqual(totals['', 'SaleInfo.sale_commission']['calls'], 1)
+        # Self times add up to the time of the outermost call
+        self.assertAlmostEqual(sum(row['self_seconds'] for row in totals.values()), benefit['seconds'], places=6)
+
+    def test_endpoint_serves_prometheus_text_per_view(self):
+        build_fleet(3)
+        self.client.force_login(User.objects.create_user('clerk'))
+        self.client.get(reverse('sale_info_list'))
+        self.assertEqual(self.client.get(reverse('cost_metrics'), REMOTE_ADDR='10.0.0.9').status_code, 403)
+
+        response = self.client.get(reverse('cost_metrics'))
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertContains(response, '# TYPE vehicle_cost_property_calls_total counter')
+        self.assertContains(response, 'vehicle_cost_property_calls_total{view="sale_info_list",property="SaleInfo.benefit"} ')
+        with override_settings(COST_METRICS=False):
+            self.assertEqual(self.client.get(reverse('cost_metrics')).status_code, 404)
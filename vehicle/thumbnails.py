@@ -0,0 +1,112 @@
+"""
+Resized copies of uploaded car photos.
+
+Every ``CarImages`` upload gets a ``thumb`` and a ``medium`` variant, each as
+WebP and as JPEG for browsers without WebP.  Variants are written next to the
+original under ``variants/``, named after it, so their names are known
+without a database column; the original is kept as uploaded.  They are built
+by a background task queued when the image is saved, or by
+``manage.py build_image_variants`` for images uploaded before.
+
+Variants are rotated upright from the EXIF orientation and carry no EXIF,
+so the camera's location and serial number stay with the original.
+"""
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+
+
+# Longest edge in pixels; smaller photos are never enlarged
+VARIANTS = {
+    'thumb': 400,
+    'medium': 1280,
+}
+
+# (extension, Pillow format, save options)
+FORMATS = (
+    ('webp', 'WEBP', {'quality': 75, 'method': 4}),
+    ('jpg', 'JPEG', {'quality': 80, 'optimize': True, 'progressive': True}),
+)
+
+
+def variant_name(name, size, extension):
+    """Storage name of the ``size`` variant of the file ``name``."""
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'variants', f'{stem}.{size}.{extension}')
+
+
+def variant_names(name):
+    """``{(size, extension): storage name}`` of every variant of ``name``."""
+    return {
+        (size, extension): variant_name(name, size, extension)
+        for size in VARIANTS for extension, _, _ in FORMATS
+    }
+
+
+def _upright_rgb(source):
+    from PIL import Image, ImageOps
+
+    image = Image.open(source)
+    # Decode a large JPEG at a reduced scale straight away, enough for the
+    # largest variant
+    largest = max(VARIANTS.values())
+    image.draft('RGB', (largest, largest))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def build_variants(field_file, force=False):
+    """
+    Write the variants of the image in ``field_file``, unless they all exist
+    already (or ``force``), and return their names.
+
+    Raises ``OSError`` when the original is missing or is not an image.
+    """
+    from PIL import Image
+
+    storage = field_file.storage
+    names = variant_names(field_file.name)
+    if not force and all(storage.exists(name) for name in names.values()):
+        return names
+
+    with field_file.open('rb'):
+        original = _upright_rgb(field_file)
+    icc_profile = original.info.get('icc_profile')
+    for size, edge in VARIANTS.items():
+        image = original.copy()
+        image.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        for extension, image_format, options in FORMATS:
+            output = BytesIO()
+            # Only what is passed here is written, which leaves out the EXIF
+            image.save(output, image_format, icc_profile=icc_profile, **options)
+            name = names[size, extension]
+            if storage.exists(name):
+                storage.delete(name)
+            storage.save(name, ContentFile(output.getvalue()))
+    return names
+
+
+def delete_variants(field_file):
+    for name in variant_names(field_file.name).values():
+        field_file.storage.delete(name)
+
+
+def variant_urls(field_file, size):
+    """
+    ``(webp_url, jpeg_url)`` of the ``size`` variant of ``field_file``, or
+    ``None`` while it is not built.
+    """
+    if size not in VARIANTS:
+        raise ValueError(f"Unknown image size '{size}', expected one of {', '.join(VARIANTS)}")
+    storage = field_file.storage
+    names = {extension: variant_name(field_file.name, size, extension) for extension, _, _ in FORMATS}
+    if not all(storage.exists(name) for name in names.values()):
+        return None
+    return storage.url(names['webp']), storage.url(names['jpg'])
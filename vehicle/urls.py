@@ -103,6 +103,22 @@ urlpatterns = [
     path('sale-info/<int:pk>/edit/', views.SaleInfoUpdateView.as_view(), name='sale_info_update'),
     path('sale-info/<int:pk>/delete/', views.SaleInfoDeleteView.as_view(), name='sale_info_delete'),
     path('sale-info/<int:pk>/', views.SaleInfoDetailView.as_view(), name='sale_info_detail'),
+    path('sale-info/export/', views.fleet_export, name='fleet_export'),
+    path('sale-info/leaderboard/', views.benefit_leaderboard, name='benefit_leaderboard'),
+    path('sale-info/trends/', views.fleet_trends, name='fleet_trends'),
+    path('sale-info/pipeline/', views.route_pipeline, name='route_pipeline'),
+    path('imports/', views.fleet_import, name='fleet_import'),
+    path('tasks/', views.TaskListView.as_view(), name='task_list'),
+    path('tasks/<int:pk>/retry/', views.task_retry, name='task_retry'),
+    path('tasks/<int:pk>/download/', views.task_download, name='task_download'),
+
+    # Request profiling (staff only)
+    path('profiling/', views.profiling_list, name='profiling_list'),
+    path('profiling/<int:profile_id>/', views.profiling_detail, name='profiling_detail'),
+    path('profiling/clear/', views.profiling_clear, name='profiling_clear'),
+
+    # Cost property metrics, Prometheus text format
+    path('metrics/', views.cost_metrics, name='cost_metrics'),
 
 
 
@@ -4,6 +4,8 @@ from django.contrib.auth import views as auth_views
 from django.contrib import messages
 from django.views.generic import ListView
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
 from .models import *
 from .forms import *
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView
@@ -11,18 +13,26 @@ from django.urls import reverse_lazy
 from .models import PurchaseInfo
 from .forms import PurchaseInfoForm
 from django.contrib.messages.views import SuccessMessageMixin
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.views.generic import DetailView
 
-from django.http import JsonResponse
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 
-from django.db.models import Count, Sum, Avg, F, ExpressionWrapper, DecimalField
+from django.db.models import Count, Sum, Avg, F, ExpressionWrapper, DecimalField, Prefetch
 from django.contrib.humanize.templatetags.humanize import intcomma
 from decimal import Decimal
+import functools
 
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 
+from .rollups import annotate_cost_chain, fleet_status, fleet_totals
+from . import analytics, data_version, exports, importers, metrics, pipeline, profiling, rankings, tasks
+from .filters import CarFilterMixin
+from .pagination import KeysetPaginationMixin
+
 class LoginView(auth_views.LoginView):
     template_name = 'login.html'
     redirect_authenticated_user = True
@@ -121,6 +131,9 @@ class CarTypeListView(LoginRequiredMixin, ListView):
     context_object_name = 'cartypes'
     login_url = 'login'
 
+    def get_queryset(self):
+        return super().get_queryset().select_related('mark')
+
 @login_required(login_url='login')
 def cartype_create(request):
     if request.method == 'POST':
@@ -278,13 +291,17 @@ def caraction_delete(request, pk):
         return redirect('caraction-list')
     return render(request, 'settings/caraction_confirm_delete.html', {'object': caraction})
 
-class CarInfoListView(LoginRequiredMixin, ListView):
+class CarInfoListView(LoginRequiredMixin, CarFilterMixin, ListView):
     model = CarInfo
     template_name = 'carinfo/carinfo_list.html'
     context_object_name = 'cars'
     paginate_by = 20
+    paginate_count = 'cached'
     login_url = 'login'
 
+    def get_queryset(self):
+        return super().get_queryset().select_related('mark', 'car_type__mark', 'model_year')
+
 @login_required(login_url='login')
 def carinfo_create(request):
     if request.method == 'POST':
@@ -299,7 +316,8 @@ def carinfo_create(request):
 
 @login_required(login_url='login')
 def carinfo_update(request, pk):
-    car = get_object_or_404(CarInfo, pk=pk)
+    # The page summarises every stage, converted from its currencies
+    car = get_object_or_404(CarInfo.objects.select_related('cost_ledger', *CarCostLedger.chain_related()), pk=pk)
     if request.method == 'POST':
         form = CarInfoForm(request.POST, instance=car)
         if form.is_valid():
@@ -319,13 +337,18 @@ def carinfo_delete(request, pk):
         return redirect('carinfo-list')
     return render(request, 'carinfo/carinfo_confirm_delete.html', {'object': car})
 
-class PurchaseInfoListView(LoginRequiredMixin, ListView):
+class PurchaseInfoListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = PurchaseInfo
     template_name = 'purchaseinfo/purchaseinfo_list.html'
     context_object_name = 'purchases'
-    ordering = ['-buy_date']
+    paginate_by = 20
+    keyset_field = 'buy_date'
+    paginate_count = 'estimated'
     login_url = 'login'
 
+    def get_queryset(self):
+        return super().get_queryset().select_related('car__mark', 'car__car_type__mark')
+
 class PurchaseInfoCreateView(LoginRequiredMixin, CreateView):
     model = PurchaseInfo
     form_class = PurchaseInfoForm
@@ -479,28 +502,17 @@ class PurchaseInfoDeleteView(LoginRequiredMixin, DeleteView):
 
 
 
-class ShippingInfoListView(ListView):
+class ShippingInfoListView(KeysetPaginationMixin, ListView):
     model = ShippingInfo
     template_name = 'shippinginfo/shippinginfo_list.html'  # make sure this matches your template path
     context_object_name = 'shippings'  # this should match your template variable
     paginate_by = 20
+    keyset_field = 'date_arrived_in_dubai'
+    paginate_count = 'estimated'
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        return queryset.select_related(
-            'car',
-            'shipping_currency',
-            'towing_currency',
-            'red_sea_currency',
-            'd_o_currency',
-            'duty_vat_currency',
-            'clearing_currency',
-            'commission_currency',
-            'attstion_currency',
-            'port_clips_prmi_currency',
-            'dubai_paid_invoice_currency',
-            'cash_paid_comission_currency'
-        ).order_by('-date_arrived_in_dubai')
+        return queryset.with_cost_chain()
 
 class ShippingInfoDetailView(DetailView):
     model = ShippingInfo
@@ -688,16 +700,17 @@ class ShippingInfoDeleteView(DeleteView):
 
 
 
-class WorldExpensesListView(ListView):
+class WorldExpensesListView(KeysetPaginationMixin, ListView):
     model = WorldExpenses
     template_name = 'world_expenses/list.html'
     context_object_name = 'world_expenses'
     paginate_by = 20
+    paginate_count = 'estimated'
 
     def get_queryset(self):
         queryset = super().get_queryset()
         # Add any filtering or ordering here
-        return queryset.select_related('car')
+        return queryset.with_cost_chain()
 
 class WorldExpensesCreateView(SuccessMessageMixin, CreateView):
     model = WorldExpenses
@@ -851,14 +864,15 @@ class WorldExpensesDetailView(DetailView):
 
 
 
-class KabulExpensesListView(ListView):
+class KabulExpensesListView(KeysetPaginationMixin, ListView):
     model = KabulExpenses
     template_name = 'kabul_expenses/list.html'
     context_object_name = 'expenses'
     paginate_by = 20
+    paginate_count = 'estimated'
 
     def get_queryset(self):
-        return super().get_queryset().select_related('car', 'herat_to_kabul_cost_currency')
+        return super().get_queryset().with_cost_chain()
 
 class KabulExpensesCreateView(SuccessMessageMixin, CreateView):
     model = KabulExpenses
@@ -977,34 +991,16 @@ class KabulExpensesDetailView(DetailView):
 
 
 
-class RepairAndOtherExpensesListView(LoginRequiredMixin, ListView):
+class RepairAndOtherExpensesListView(LoginRequiredMixin, CarFilterMixin, ListView):
     model = RepairAndOtherExpenses
     template_name = 'repair_expenses/list.html'
     context_object_name = 'repair_expenses'
     paginate_by = 20
     login_url = 'login'
+    car_prefix = 'car__'
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        # Add search functionality
-        if 'search' in self.request.GET:
-            search_term = self.request.GET['search']
-            queryset = queryset.filter(
-                models.Q(car__mark__icontains=search_term) |
-                models.Q(car__model__icontains=search_term) |
-                models.Q(repair_cost__icontains=search_term) |
-                models.Q(palate_cost__icontains=search_term)
-        )
-        return queryset.select_related(
-            'car',
-            'repair_cost_currency',
-            'palate_cost_currency'
-        ).order_by('-id')
-
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['search_term'] = self.request.GET.get('search', '')
-        return context
+        return super().get_queryset().with_cost_chain()
 
 class RepairAndOtherExpensesCreateView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
     model = RepairAndOtherExpenses
@@ -1333,16 +1329,23 @@ def buyer_create_ajax(request):
 
 
 
-class SaleInfoListView(ListView):
+class SaleInfoListView(KeysetPaginationMixin, ListView):
     model = SaleInfo
     template_name = 'sale_info/list.html'
     context_object_name = 'sale_infos'
     paginate_by = 20
+    paginate_count = 'estimated'
 
     def get_queryset(self):
-        queryset = super().get_queryset().select_related('car', 'sale_price_currency')
+        queryset = super().get_queryset().with_cost_chain()
         # Add any filtering logic here if needed
         return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # A scan of the whole fleet, kept until the data changes
+        context['fleet_status'] = data_version.cached('fleet_status', fleet_status, settings.DASHBOARD_CACHE_TIMEOUT)
+        return context
     
 
     
@@ -1551,8 +1554,8 @@ class SaleInfoDetailView(DetailView):
 
 class SaleInfoDeleteView(DeleteView):
     model = SaleInfo
-    template_name = 'shippinginfo/confirm_delete.html'
-    success_url = reverse_lazy('car-list')  # Adjust to your needs
+    template_name = 'sale_info/confirm_delete.html'
+    success_url = reverse_lazy('sale_info_list')
     
     def delete(self, request, *args, **kwargs):
         response = super().delete(request, *args, **kwargs)
@@ -1560,11 +1563,65 @@ class SaleInfoDeleteView(DeleteView):
         return response
 
 
+@login_required(login_url='login')
+def fleet_export(request):
+    """
+    Download the per-car profitability report of the whole fleet, or on
+    POST queue it as a background task to download from the task list.
+    """
+    export_format = request.POST.get('format') if request.method == 'POST' else request.GET.get('format', 'csv')
+    if export_format not in exports.FORMATS:
+        return HttpResponseBadRequest(f"Unknown export format '{export_format}'")
+
+    if request.method == 'POST':
+        tasks.enqueue('vehicle.fleet_export', format=export_format)
+        messages.success(request, _('The report is being prepared, download it from the task list when it is done'))
+        return redirect('task_list')
+
+    filename = f"fleet-{timezone.localdate():%Y-%m-%d}.{export_format}"
+    if export_format == 'xlsx':
+        return FileResponse(exports.xlsx_file(exports.fleet_rows()), as_attachment=True, filename=filename)
+
+    response = StreamingHttpResponse(
+        exports.csv_lines(exports.fleet_rows()), content_type='text/csv; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required(login_url='login')
+def fleet_import(request):
+    """Bulk-import cars or stage records from an uploaded CSV or JSONL file."""
+    report = None
+    if request.method == 'POST':
+        form = FleetImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            importer = importers.IMPORTERS[form.cleaned_data['kind']](dry_run=form.cleaned_data['dry_run'])
+            try:
+                report = importer.run(importers.read_rows(upload, upload.name.rsplit('.', 1)[-1].lower()))
+            except UnicodeDecodeError:
+                form.add_error('file', _('The file is not UTF-8 text'))
+            else:
+                if report.created and not importer.dry_run:
+                    messages.success(request, _('%(count)s records imported') % {'count': report.created})
+    else:
+        form = FleetImportForm()
+
+    context = {
+        'form': form,
+        'report': report,
+        # The page shows the first errors, the command line reports them all
+        'errors': report.errors[:200] if report else [],
+    }
+    return render(request, 'imports/import_form.html', context)
 
 
 
 
-class CarImagesListView(LoginRequiredMixin, ListView):
+
+
+class CarImagesListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = CarImages
     template_name = 'car_images/list.html'
     context_object_name = 'images'
@@ -1617,92 +1674,42 @@ class CarImagesDeleteView(LoginRequiredMixin, SuccessMessageMixin, DeleteView):
 
 
 
-@login_required(login_url='login')
-def dashboard(request):
-    # Basic counts
-    cars_count = CarInfo.objects.count()
-    sold_cars_count = CarInfo.objects.filter(sale_info__status=SaleInfo.STATUS_SOLD).count()
-    ready_cars_count = CarInfo.objects.filter(sale_info__status=SaleInfo.STATUS_READY).count()
-    in_transit_cars_count = CarInfo.objects.filter(sale_info__status=SaleInfo.STATUS_IN_TRANSIT).count()
-    
-    # Percentages
-    sold_percentage = round((sold_cars_count / cars_count) * 100, 1) if cars_count > 0 else 0
-    ready_percentage = round((ready_cars_count / cars_count) * 100, 1) if cars_count > 0 else 0
-    in_transit_percentage = round((in_transit_cars_count / cars_count) * 100, 1) if cars_count > 0 else 0
+def dashboard_figures():
+    """What the dashboard panels show, computed from the fleet."""
+    # Counts and percentages per sale status, in one query
+    status = fleet_status()
+    by_status = {row['status']: row for row in status['statuses']}
+    cars_count = status['cars']
+    sold_cars_count = by_status[SaleInfo.STATUS_SOLD]['cars']
+    ready_cars_count = by_status[SaleInfo.STATUS_READY]['cars']
+    in_transit_cars_count = by_status[SaleInfo.STATUS_IN_TRANSIT]['cars']
+    sold_percentage = by_status[SaleInfo.STATUS_SOLD]['percentage']
+    ready_percentage = by_status[SaleInfo.STATUS_READY]['percentage']
+    in_transit_percentage = by_status[SaleInfo.STATUS_IN_TRANSIT]['percentage']
     
-    # Calculate financial data
-    total_sales = Decimal('0')
-    total_benefit = Decimal('0')
-    total_investment = Decimal('0')
-    total_expenses = Decimal('0')
-    
-    # Get all cars with their related data
-    cars = CarInfo.objects.select_related(
-        'purchase_info', 'shipping_info', 'world_expenses', 
-        'kabul_expenses', 'repair_expenses', 'sale_info'
-    ).prefetch_related('images').all()
-    
-    for car in cars:
-        # Calculate total sales and benefits from sold cars
-        if hasattr(car, 'sale_info') and car.sale_info.status == SaleInfo.STATUS_SOLD:
-            sale_info = car.sale_info
-            total_sales += sale_info._convert_to_base(
-                sale_info.sale_price,
-                'sale_price',
-                'sale_date'
-            )
-            total_benefit += sale_info.benefit
-        
-        # Calculate total investment (purchase + repair)
-        if hasattr(car, 'purchase_info'):
-            purchase_info = car.purchase_info
-            total_investment += purchase_info._convert_to_base(
-                purchase_info.purchase_price,
-                'purchase_price',
-                'buy_date'
-            )
-        
-        # Calculate total expenses (shipping + world + kabul + repair)
-        if hasattr(car, 'shipping_info'):
-            shipping_info = car.shipping_info
-            total_expenses += shipping_info.mizan_masaref_up_to_dubai
-        
-        if hasattr(car, 'world_expenses'):
-            world_exp = car.world_expenses
-            total_expenses += world_exp.amount_of_expeses_to_herat
-        
-        if hasattr(car, 'kabul_expenses'):
-            kabul_exp = car.kabul_expenses
-            total_expenses += kabul_exp._convert_to_base(
-                kabul_exp.herat_to_kabul_cost,
-                'herat_to_kabul_cost',
-                'herat_to_kabul_cost_date'
-            )
-        
-        if hasattr(car, 'repair_expenses'):
-            repair_exp = car.repair_expenses
-            repair_in_base = repair_exp._convert_to_base(
-                repair_exp.repair_cost,
-                'repair_cost',
-                'repair_cost_date'
-            )
-            palate_in_base = repair_exp._convert_to_base(
-                repair_exp.palate_cost,
-                'palate_cost',
-                'palate_cost_date'
-            )
-            total_expenses += repair_in_base + palate_in_base
+    # Financial totals, computed by the database in a single query
+    totals = fleet_totals()
+    total_sales = totals['total_sales']
+    total_benefit = totals['total_benefit']
+    total_investment = totals['total_investment']
+    total_expenses = totals['total_expenses']
     
     # Calculate averages
     avg_benefit = total_benefit / sold_cars_count if sold_cars_count > 0 else Decimal('0')
     
+    cars = annotate_cost_chain(
+        CarInfo.objects.select_related('mark', 'car_type__mark', 'model_year', 'sale_info')
+    )
+    
     # Recent cars
     recent_cars = cars.order_by('-id')[:5]
     
-    # Top performing cars (sold cars sorted by benefit)
-    sold_cars = [car for car in cars if hasattr(car, 'sale_info') and car.sale_info.status == SaleInfo.STATUS_SOLD]
-    sold_cars.sort(key=lambda x: x.sale_info.benefit, reverse=True)
-    top_performing_cars = sold_cars[:3]
+    # Top performing cars, read off the ledger's benefit index
+    top_performing_cars = rankings.best(3).select_related(
+        'mark', 'car_type__mark', 'model_year', 'sale_info',
+    ).prefetch_related(
+        Prefetch('images', queryset=CarImages.objects.order_by('id'))
+    )
     
     # Get dashboard settings for currency formatting
     dashboard_settings = DashboardSetting.load()
@@ -1725,7 +1732,30 @@ def dashboard(request):
         'top_performing_cars': top_performing_cars,
         'base_currency': base_currency,
     }
-    
+    return context
+
+
+DASHBOARD_FIGURES = (
+    'cars_count', 'sold_cars_count', 'ready_cars_count', 'in_transit_cars_count',
+    'sold_percentage', 'ready_percentage', 'in_transit_percentage',
+    'total_sales', 'total_benefit', 'avg_benefit', 'total_investment', 'total_expenses',
+    'recent_cars', 'top_performing_cars', 'base_currency',
+)
+
+
+@login_required(login_url='login')
+def dashboard(request):
+    """
+    The panels are cached as rendered for each ``data_version``.  The
+    template calls the figures only when it renders them, so a cached
+    load runs none of their queries.
+    """
+    figures = functools.cache(dashboard_figures)
+    context = {name: functools.partial(lambda name: figures()[name], name) for name in DASHBOARD_FIGURES}
+    context.update({
+        'data_version': data_version.current(),
+        'cache_timeout': settings.DASHBOARD_CACHE_TIMEOUT,
+    })
     return render(request, 'dashboard.html', context)
 
 
@@ -1733,6 +1763,189 @@ def dashboard(request):
 
 
 
+@login_required(login_url='login')
+def benefit_leaderboard(request):
+    """Best and worst sold cars, benefit percentiles and totals per ``?group=``."""
+    group = request.GET.get('group')
+    if group not in rankings.GROUPS:
+        group = 'mark'
+    timeout = settings.DASHBOARD_CACHE_TIMEOUT
+    related = ('mark', 'car_type__mark', 'model_year', 'sale_info')
+    return render(request, 'leaderboard/leaderboard.html', {
+        'ranked': [
+            ("بیشترین مفاد", rankings.best(10).select_related(*related)),
+            ("کمترین مفاد", rankings.worst(10).select_related(*related)),
+        ],
+        # Both read every sold car
+        'percentiles': data_version.cached('benefit_percentiles', rankings.percentiles, timeout),
+        'rows': data_version.cached(f'benefit_leaderboard:{group}', lambda: rankings.leaderboard(group), timeout),
+        'group': group,
+        'groups': [(key, label) for key, (label, _) in rankings.GROUPS.items()],
+    })
+
+
+def _int_param(request, name):
+    value = request.GET.get(name, '')
+    return int(value) if value.isdigit() else None
+
+
+@login_required(login_url='login')
+def fleet_trends(request):
+    """
+    Cars reaching each stop of the route, sold, and their revenue, cost and
+    benefit per month or week (``?kind=``), of a ``?mark=`` and ``?car_type=``
+    if given; ``?format=json`` for charts.
+    """
+    kind = request.GET.get('kind')
+    if kind not in analytics.KINDS:
+        kind = FleetRollup.KIND_MONTH
+    mark = CarMark.objects.filter(pk=_int_param(request, 'mark')).first()
+    car_type = CarType.objects.filter(pk=_int_param(request, 'car_type'), mark=mark).first() if mark else None
+    filters = {name: value for name, value in (('mark', mark), ('car_type', car_type)) if value is not None}
+    periods = analytics.series(kind, **filters)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'kind': kind, 'periods': periods})
+    # Bars of the benefit column, scaled to the largest one
+    widest = max((abs(period['benefit']) for period in periods), default=0) or 1
+    for period in periods:
+        period['counts'] = [period[name] for name, _, _ in analytics.EVENTS]
+        period['amounts'] = [period[name] for name, _, _ in analytics.AMOUNTS]
+        period['bar'] = round(abs(period['benefit']) / widest * 100)
+    return render(request, 'trends/trends.html', {
+        'periods': periods,
+        'kind': kind,
+        'kinds': analytics.KINDS.items(),
+        'mark': mark,
+        'car_type': car_type,
+        'marks': CarMark.objects.order_by('name'),
+        'car_types': CarType.objects.filter(mark=mark).order_by('name') if mark else [],
+        'events': analytics.EVENTS,
+        'amounts': analytics.AMOUNTS,
+    })
+
+
+@login_required(login_url='login')
+def route_pipeline(request):
+    """
+    The cars on each leg of the route now and the capital in them, and per
+    month or week (``?kind=``) how long the cars through a ``?leg=`` took.
+    """
+    kind = request.GET.get('kind')
+    if kind not in analytics.KINDS:
+        kind = FleetRollup.KIND_MONTH
+    leg = request.GET.get('leg')
+    if leg not in pipeline.LEGS:
+        leg = CarLeg.LEG_USA
+    timeout = settings.DASHBOARD_CACHE_TIMEOUT
+    # Both read every car on the route, or through the leg
+    legs = data_version.cached('route_legs', pipeline.work_in_progress, timeout)
+    periods = data_version.cached(f'route_percentiles:{leg}:{kind}', lambda: pipeline.percentiles(leg, kind), timeout)
+    capital = sum(row['capital'] for row in legs) or 1
+    for row in legs:
+        row['share'] = round(row['capital'] / capital * 100)
+    longest = max((period[90] for period in periods), default=0) or 1
+    for period in periods:
+        period['bar'] = round(max(period[90], 0) / longest * 100)
+    return render(request, 'pipeline/pipeline.html', {
+        'legs': legs,
+        'periods': periods,
+        'leg': leg,
+        'leg_label': pipeline.LEGS[leg],
+        'kind': kind,
+        'kinds': analytics.KINDS.items(),
+    })
+
+
+class TaskListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
+    """Background tasks, newest first, with how many wait in each status."""
+    model = Task
+    template_name = 'tasks/task_list.html'
+    context_object_name = 'tasks'
+    paginate_by = 50
+    login_url = 'login'
+
+    def get_queryset(self):
+        queryset = super().get_queryset().defer('result')
+        status = self.request.GET.get('status')
+        if status in dict(Task.STATUS_CHOICES):
+            queryset = queryset.filter(status=status)
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        counts = dict(Task.objects.order_by().values_list('status').annotate(count=Count('pk')))
+        context['status_counts'] = [
+            (status, label, counts.get(status, 0)) for status, label in Task.STATUS_CHOICES
+        ]
+        context['task_labels'] = {name: task_type.label for name, task_type in tasks.REGISTRY.items()}
+        return context
+
+
+@login_required(login_url='login')
+@require_POST
+def task_retry(request, pk):
+    task = get_object_or_404(Task, pk=pk)
+    if tasks.retry(task):
+        messages.success(request, _('The task is queued again'))
+    return redirect('task_list')
+
+
+@login_required(login_url='login')
+def task_download(request, pk):
+    """The file a finished export task wrote."""
+    task = get_object_or_404(Task, pk=pk, status=Task.STATUS_DONE)
+    result = task.result if isinstance(task.result, dict) else {}
+    storage = tasks.export_storage()
+    if not result.get('file') or not storage.exists(result['file']):
+        raise Http404("The task wrote no file, or it was removed")
+    return FileResponse(storage.open(result['file']), as_attachment=True, filename=result['filename'])
+
+
+@staff_member_required(login_url='login')
+def profiling_list(request):
+    """Recorded requests worst first, by ``?sort=``, and a summary per view."""
+    sort = request.GET.get('sort')
+    if sort not in profiling.SORTS:
+        sort = 'total'
+    profiles = sorted(profiling.recorded(), key=profiling.SORTS[sort], reverse=True)
+    return render(request, 'profiling/profile_list.html', {
+        'profiles': profiles[:100],
+        'views': profiling.by_view(profiles),
+        'recorded': len(profiles),
+        'sort': sort,
+        'sort_choices': [
+            ('total', 'کل'), ('sql', 'SQL'), ('queries', 'کوئری‌ها'),
+            ('repeated', 'تکراری'), ('template', 'قالب'), ('python', 'پایتون'),
+        ],
+        'enabled': settings.PROFILING,
+        'buffer_size': settings.PROFILING_BUFFER_SIZE,
+    })
+
+
+@staff_member_required(login_url='login')
+def profiling_detail(request, profile_id):
+    profile = profiling.get(profile_id)
+    if profile is None:
+        raise Http404("The request is no longer in the buffer")
+    return render(request, 'profiling/profile_detail.html', {'profile': profile})
+
+
+@staff_member_required(login_url='login')
+@require_POST
+def profiling_clear(request):
+    profiling.clear()
+    return redirect('profiling_list')
+
+
+def cost_metrics(request):
+    """Cost property metrics for a Prometheus scraper on ``INTERNAL_IPS``, or for staff."""
+    if not settings.COST_METRICS:
+        raise Http404("Cost metrics are off")
+    if request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS and not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(metrics.prometheus_text(), content_type=metrics.CONTENT_TYPE)
+
+
 class SettingsView(LoginRequiredMixin, ListView):
     model = CarImages
     template_name = 'settings/settings.html'